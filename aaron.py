@@ -1,30 +1,77 @@
-import anthropic
 import csv
 import json
 import os
 import argparse
 import time
 from datetime import datetime
-from openpyxl import Workbook
-import pandas as pd
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import multiprocessing
-from unidecode import unidecode
 import re
-import chardet
+from output_writers import add_output_arguments, write_results
+from metrics import (add_metrics_arguments, finish_metrics, record_api_usage, record_error, set_queue_depth,
+                     start_metrics, time_stage)
+from retry_policy import RetryPolicy, ValidationError, add_retry_arguments, configure_retries
+from model_router import ModelRouter, TruncatedResponse, add_routing_arguments, check_truncated, configure_routing
+from streaming import LabeledBlocksMonitor, add_streaming_arguments, configure_streaming, create_message
+from hedging import add_hedging_arguments, configure_hedging
+from llm_client import get_client
+from planner import Plan, add_plan_arguments, count_tokens, plan_options
 
-client = anthropic.Anthropic(
-    api_key="",
-)
+PIPELINE = "contacts"
 
-csv_file = "/Users/navinnishanth/Downloads/BIO_TESTS/Dir+ Contacts_Sample.csv"
-results_dir = "/Users/navinnishanth/Downloads/BIO_TESTS/GPT_input_3_Companies/bio_results_2"
+# Contacts per company sent to the model after local title scoring (0 sends every contact)
+DEFAULT_TOP_K = 25
 
-os.makedirs(results_dir, exist_ok=True)
+REQUIRED_COLUMNS = ['INDIVIDUAL_ID', 'NAME', 'PRIMARY_TITLE', 'COMPANY_ID', 'CONFIDENCE_SCORE', 'MANAGEMENT_LEVEL']
+
+OUTPUT_COLUMNS = ['name', 'individual_id', 'primary_title', 'management_level', 'email_address', 'best_freemail', 'phone_number', 'linkedin_url', 'company_id', 'reason', 'info_count', 'contact_rank', 'company_rank', 'confidence_score']
+
+# Contact rows sent to the model per request; a company with more is split into several requests
+CONTACTS_BATCH_SIZE = 100
+# One selected contact's labeled block (thirteen fields and a reason), for --plan
+CONTACT_BLOCK_TOKENS = 130
+
+CONTACTS_PROMPT = """
+        As an AI assistant, your task is select the top 5 optimal contacts from each company for Hotel Engine's sales team to approach. I have a dataset of contacts from different companies. The objective is to select the 5 ideal contacts per company who are most likely decision-makers or influential in purchasing or managing lodging solutions. The company to focus on is Hotel Engine, a lodging management software company. Hotel Engine serves industries like construction, transportation & logistics, oil & gas, retail, healthcare, and more. Their product helps with customized hotel reservation & management, billing, control, and support for both large and small businesses.
+        Please identify contacts based on their job titles that are most relevant to hotel management, travel services, procurement, logistics, or operations in each company. Prioritize senior executives or managers in roles such as Travel Manager, Procurement Manager, Operations Manager, Facilities Manager, or Logistics Head, who are likely responsible for lodging or travel arrangements within their companies
+        The dataset includes the following columns: INDIVIDUAL_ID, NAME, LTE_FLAG, PRIMARY_TITLE, MANAGEMENT_LEVEL, EMAIL_ADDRESS, BEST_FREEMAIL, MOBILE_PHONE, PHONE_NUMBER, LINKEDIN_URL, COMPANY_ID, and CONFIDENCE_SCORE.
+        Keep in mind the following pointers while selecting the contacts:
+        1. Do not select duplicate entries based on NAME and COMPANY_ID.
+        2. Prefer contacts with the most relevant and influential job titles that suit the requirements, followed by the Higher CONFIDENCE_SCORE
+        3. For contacts with same C-level positions in a company, retain only the entry with the highest CONFIDENCE_SCORE. For eg if person A has "chairman and ceo" and person
+        B has "chief executive officer & chief financial officer", then select  one contact having higher confidence score
+        4. RANK THE TOP 5 CONTACTS PER EACH COMPANY_ID FROM 1 TO 5 I.E THE RANK SHOULDN'T EXCEED 5 FOR ANY GIVEN CONTACT
+        5. I definitely need five contacts per company, Incase if you cant select 5 contacts for a company, please pick the contacts based on their 
+        management_level (in this order c-level , vp-level, director, manager, non manager)  and confidence_score (highest score) and it should not pick
+        titles like 'Former','Retired','Resigned','Past','independent','Self Employed','Selfemploy','Unemployed','Freelance', 
+        Advisor, Consultant, Personal Assistant, PA,
+        Chief of Staff, Office of, to the, Secretary, Office,
+        and order the final 5 contacts for each company by c-level, vp-level, director, manager, non manager and confidence_score
+        6. For each selected contact, provide the following information in this exact format below:
+        Name: [Contact Name]
+        Individual ID: [Id of an Individual]
+        Primary Title: [Contact Title]
+        Management Level: [Management Level]
+        Email Address: [contact@email_domain.com]
+        Best Freemail: [contact@freemail_domain.com]
+        Phone Number: [123-456-7890]
+        LinkedIn URL: [https://linkedin.com/in/contact]
+        Company ID: [12345]
+        Reason: [Explanation for selection of Contact]
+        Info Count: [Number of non-empty fields among EMAIL_ADDRESS, BEST_FREEMAIL, MOBILE_PHONE, PHONE_NUMBER, and LINKEDIN_URL]
+        Contact Rank: [Rank within company, from 1 to 5]
+        Confidence Score: [confidence_score]
+        Repeat this format for each contact, separating them with a blank line.
+        Data to process: {data}
+            """
+
+# Defaults when run as a script; pipeline.py points these at its own input and results directory
+csv_file = "contacts.csv"
+results_dir = os.path.join("results", "contacts")
 
 log_file = os.path.join(results_dir, "generation_log.txt")
 
-excel_filename = os.path.join(results_dir, "result.xlsx")
+output_filename = os.path.join(results_dir, "result.xlsx")
 
 def log_message(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -32,13 +79,55 @@ def log_message(message):
         f.write(f"[{timestamp}] {message}\n")
     print(message)
 
+retry_policy = RetryPolicy(PIPELINE, log=log_message)
+model_router = ModelRouter(PIPELINE, log=log_message)
+
+class ContactStore:
+    """Selected contacts held column-wise, with management levels stored as integer codes."""
+
+    __slots__ = ("columns", "levels", "_level_codes")
+
+    def __init__(self):
+        self.columns = {column: [] for column in OUTPUT_COLUMNS}
+        self.levels = []
+        self._level_codes = {}
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def append(self, contact):
+        for column, values in self.columns.items():
+            value = contact.get(column, 'N/A')
+            if column == 'management_level':
+                value = str(value)
+                if value not in self._level_codes:
+                    self._level_codes[value] = len(self.levels)
+                    self.levels.append(value)
+                value = self._level_codes[value]
+            values.append(value)
+
+    def extend(self, contacts):
+        for contact in contacts:
+            self.append(contact)
+
+    def to_frame(self):
+        import pandas as pd
+
+        columns = dict(self.columns)
+        columns['management_level'] = pd.Categorical.from_codes(columns['management_level'], self.levels)
+        return pd.DataFrame(columns, columns=OUTPUT_COLUMNS)
+
 def detect_encoding(file_path):
+    import chardet
+
     with open(file_path, 'rb') as file:
         raw_data = file.read()
     result = chardet.detect(raw_data)
     return result['encoding']
 
 def check_csv_contents(csv_file):
+    import pandas as pd
+
     try:
         encoding = detect_encoding(csv_file)
         log_message(f"Detected encoding: {encoding}")
@@ -49,15 +138,25 @@ def check_csv_contents(csv_file):
     except Exception as e:
         log_message(f"Error reading CSV file: {str(e)}")
 
-def extract_contact_info(text, company_rank, original_data):
-    contact_pattern = r'Name: (.*?)\nIndividual ID: (.*?)\nPrimary Title: (.*?)\nManagement Level: (.*?)\nEmail Address: (.*?)\nBest Freemail: (.*?)\nPhone Number: (.*?)\nLinkedIn URL: (.*?)\nCompany ID: (.*?)\nReason: (.*?)\nInfo Count: (.*?)\nContact Rank: (.*?)\nConfidence Score: (.*?)(?:\n\n|\Z)'
-    matches = re.findall(contact_pattern, text, re.DOTALL)
+CONTACT_PATTERN = re.compile(r'Name: (.*?)\nIndividual ID: (.*?)\nPrimary Title: (.*?)\nManagement Level: (.*?)\nEmail Address: (.*?)\nBest Freemail: (.*?)\nPhone Number: (.*?)\nLinkedIn URL: (.*?)\nCompany ID: (.*?)\nReason: (.*?)\nInfo Count: (.*?)\nContact Rank: (.*?)\nConfidence Score: (.*?)(?:\n\n|\Z)', re.DOTALL)
+
+def parse_contact_blocks(text):
+    # The labeled contact blocks of a response, as tuples of the 13 field values
+    return CONTACT_PATTERN.findall(text)
+
+def extract_contact_info(text, company_rank, original_data, matches=None):
+    if matches is None:
+        matches = parse_contact_blocks(text)
     log_message(f"Number of matches found: {len(matches)}")
+    records_by_id = {}
+    for record in original_data:
+        records_by_id.setdefault(str(record['INDIVIDUAL_ID']), record)
     contacts = []
     for i, match in enumerate(matches):
+        original_record = None
         try:
             individual_id = match[1] if len(match) > 1 else 'N/A'
-            original_record = next((r for r in original_data if str(r['INDIVIDUAL_ID']) == individual_id), None)
+            original_record = records_by_id.get(individual_id)
             
             confidence_score = float(match[13]) if len(match) > 13 and match[13].strip() else (float(original_record['CONFIDENCE_SCORE']) if original_record and 'CONFIDENCE_SCORE' in original_record else 0)
             
@@ -112,96 +211,99 @@ def create_contact_from_original(record, company_rank, contact_rank):
         "confidence_score": float(record.get('CONFIDENCE_SCORE', 0))
     }
 
-def process_data(data, batch_size=100):
-    all_contacts = []
-    log_message(f"Total number of records to process: {len(data)}")
-    
-    # Group data by company
-    company_data = {}
-    for record in data:
-        company_id = record['COMPANY_ID']
-        if company_id not in company_data:
-            company_data[company_id] = []
-        company_data[company_id].append(record)
-    
-    # Sort companies by their average confidence score
-    sorted_companies = sorted(company_data.items(), 
-                              key=lambda x: sum(float(r['CONFIDENCE_SCORE']) for r in x[1]) / len(x[1]), 
-                              reverse=True)
-    
-    for company_rank, (company_id, company_records) in enumerate(sorted_companies, start=1):
+def companies_by_rank(df, ranking=None):
+    """(company_id, row positions in df) per company, best average CONFIDENCE_SCORE first.
+
+    Grouping and ranking is one vectorized pass; rows stay in df and only the batch being sent is
+    turned into dicts. ranking (from rank_companies) orders the companies instead, so a shortlisted
+    frame keeps the order of the full one.
+    """
+    import numpy as np
+    import pandas as pd
+
+    company_codes, company_ids = pd.factorize(df['COMPANY_ID'])
+    scores = pd.to_numeric(df['CONFIDENCE_SCORE'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    company_sizes = np.bincount(company_codes, minlength=len(company_ids))
+    average_scores = np.bincount(company_codes, weights=scores, minlength=len(company_ids)) / company_sizes
+    company_rows = np.split(np.argsort(company_codes, kind='stable'), np.cumsum(company_sizes)[:-1])
+    companies = [(company_ids[company], company_rows[company]) for company in np.argsort(-average_scores, kind='stable')]
+    if ranking is not None:
+        companies.sort(key=lambda company: ranking.get(_company_key(company[0]), len(ranking)))
+    return companies
+
+def _company_key(company_id):
+    # validate_contacts transliterates text columns, so rankings taken before it are keyed the same way
+    from unidecode import unidecode
+
+    return unidecode(company_id) if isinstance(company_id, str) else company_id
+
+def rank_companies(df):
+    """{company: rank} by average CONFIDENCE_SCORE over all of each company's contacts, taken before the
+    title shortlist so shortlisting (which favours confident contacts) does not change company_rank."""
+    return {_company_key(company_id): rank for rank, (company_id, _) in enumerate(companies_by_rank(df))}
+
+def contacts_prompt(batch):
+    return CONTACTS_PROMPT.format(data=json.dumps(batch))
+
+def process_data(df, batch_size=CONTACTS_BATCH_SIZE, ranking=None):
+    all_contacts = ContactStore()
+    log_message(f"Total number of records to process: {len(df)}")
+
+    companies = companies_by_rank(df, ranking)
+    for company_rank, (company_id, rows) in enumerate(companies, start=1):
+        set_queue_depth(PIPELINE, "companies", len(companies) - company_rank + 1)
         log_message(f"Processing company ID: {company_id}, Rank: {company_rank}")
         company_contacts = []
-        for i in range(0, len(company_records), batch_size):
-            batch = company_records[i:i+batch_size]
+        for i in range(0, len(rows), batch_size):
+            batch = df.iloc[rows[i:i+batch_size]].to_dict('records')
             log_message(f"Processing batch for company {company_id}, size: {len(batch)}")
-            prompt_template = """
-        As an AI assistant, your task is select the top 5 optimal contacts from each company for Hotel Engine's sales team to approach. I have a dataset of contacts from different companies. The objective is to select the 5 ideal contacts per company who are most likely decision-makers or influential in purchasing or managing lodging solutions. The company to focus on is Hotel Engine, a lodging management software company. Hotel Engine serves industries like construction, transportation & logistics, oil & gas, retail, healthcare, and more. Their product helps with customized hotel reservation & management, billing, control, and support for both large and small businesses.
-        Please identify contacts based on their job titles that are most relevant to hotel management, travel services, procurement, logistics, or operations in each company. Prioritize senior executives or managers in roles such as Travel Manager, Procurement Manager, Operations Manager, Facilities Manager, or Logistics Head, who are likely responsible for lodging or travel arrangements within their companies
-        The dataset includes the following columns: INDIVIDUAL_ID, NAME, LTE_FLAG, PRIMARY_TITLE, MANAGEMENT_LEVEL, EMAIL_ADDRESS, BEST_FREEMAIL, MOBILE_PHONE, PHONE_NUMBER, LINKEDIN_URL, COMPANY_ID, and CONFIDENCE_SCORE.
-        Keep in mind the following pointers while selecting the contacts:
-        1. Do not select duplicate entries based on NAME and COMPANY_ID.
-        2. Prefer contacts with the most relevant and influential job titles that suit the requirements, followed by the Higher CONFIDENCE_SCORE
-        3. For contacts with same C-level positions in a company, retain only the entry with the highest CONFIDENCE_SCORE. For eg if person A has "chairman and ceo" and person
-        B has "chief executive officer & chief financial officer", then select  one contact having higher confidence score
-        4. RANK THE TOP 5 CONTACTS PER EACH COMPANY_ID FROM 1 TO 5 I.E THE RANK SHOULDN'T EXCEED 5 FOR ANY GIVEN CONTACT
-        5. I definitely need five contacts per company, Incase if you cant select 5 contacts for a company, please pick the contacts based on their 
-        management_level (in this order c-level , vp-level, director, manager, non manager)  and confidence_score (highest score) and it should not pick
-        titles like 'Former','Retired','Resigned','Past','independent','Self Employed','Selfemploy','Unemployed','Freelance', 
-        Advisor, Consultant, Personal Assistant, PA,
-        Chief of Staff, Office of, to the, Secretary, Office,
-        and order the final 5 contacts for each company by c-level, vp-level, director, manager, non manager and confidence_score
-        6. For each selected contact, provide the following information in this exact format below:
-        Name: [Contact Name]
-        Individual ID: [Id of an Individual]
-        Primary Title: [Contact Title]
-        Management Level: [Management Level]
-        Email Address: [contact@email_domain.com]
-        Best Freemail: [contact@freemail_domain.com]
-        Phone Number: [123-456-7890]
-        LinkedIn URL: [https://linkedin.com/in/contact]
-        Company ID: [12345]
-        Reason: [Explanation for selection of Contact]
-        Info Count: [Number of non-empty fields among EMAIL_ADDRESS, BEST_FREEMAIL, MOBILE_PHONE, PHONE_NUMBER, and LINKEDIN_URL]
-        Contact Rank: [Rank within company, from 1 to 5]
-        Confidence Score: [confidence_score]
-        Repeat this format for each contact, separating them with a blank line.
-        Data to process: {data}
-            """
+            prompt = contacts_prompt(batch)
 
-            try:
+            def request_contacts(route):
                 start_time = time.time()
-                message = client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=4000,
+                # Streamed (with --stream) until the last expected contact's final field arrives
+                message = create_message(
+                    get_client(), LabeledBlocksMonitor("Name:", "Confidence Score:", count=min(5, len(batch))),
+                    pipeline=PIPELINE,
+                    model=route.model,
+                    max_tokens=route.max_tokens,
                     temperature=0.7,
                     messages=[
-                        {"role": "user", "content": prompt_template.format(data=json.dumps(batch))}
+                        {"role": "user", "content": prompt}
                     ]
                 )
                 end_time = time.time()
+                usage = record_api_usage(PIPELINE, route.model, message.usage, end_time - start_time)
+                check_truncated(message)
                 
                 response_text = message.content[0].text
                 log_message(f"API Response for company {company_id} (first 500 characters): {response_text[:500]}")
                 
-                batch_contacts = extract_contact_info(response_text, company_rank, batch)
+                with time_stage(PIPELINE, "parse"):
+                    blocks = parse_contact_blocks(response_text)
+                    # Checked before extract_contact_info falls back to the original records, so an
+                    # unparseable response is retried and escalated instead
+                    if not blocks:
+                        raise ValidationError(f"No contacts extracted from API for company {company_id}")
+                    batch_contacts = extract_contact_info(response_text, company_rank, batch, matches=blocks)
                 log_message(f"Extracted contacts from batch for company {company_id}: {len(batch_contacts)}")
-                
-                if not batch_contacts:
-                    log_message(f"No contacts extracted from API for company {company_id}. Using original data.")
-                    batch_contacts = [create_contact_from_original(record, company_rank, i) for i, record in enumerate(batch[:5], start=1)]
-                
+                return batch_contacts, usage
+
+            description = f"batch for company {company_id}"
+            try:
+                batch_contacts, usage = model_router.complete(
+                    "contact_selection", prompt,
+                    lambda route: retry_policy.call(request_contacts, route, stage="api", description=description),
+                    description=description)
                 company_contacts.extend(batch_contacts)
                 
-                input_tokens = message.usage.input_tokens
-                output_tokens = message.usage.output_tokens
-                input_cost = input_tokens * 0.25 / 1000000
-                output_cost = output_tokens * 1.25 / 1000000
-                total_cost = input_cost + output_cost
-                time_taken = end_time - start_time
-                
-                log_message(f"Batch processed for company {company_id}: {i}-{i+batch_size}, Contacts: {len(batch_contacts)}, Input Tokens: {input_tokens}, Output Tokens: {output_tokens}, Total Cost: ${total_cost:.2f}, Time Taken: {time_taken:.2f}s")
+                log_message(f"Batch processed for company {company_id}: {i}-{i+batch_size}, Contacts: {len(batch_contacts)}, Input Tokens: {usage['input_tokens']}, Output Tokens: {usage['output_tokens']}, Total Cost: ${usage['total_cost']:.2f}, Time Taken: {usage['time_taken']:.2f}s")
+            except (ValidationError, TruncatedResponse) as e:
+                log_message(f"{str(e)}. Using original data.")
+                batch_contacts = [create_contact_from_original(record, company_rank, i) for i, record in enumerate(batch[:5], start=1)]
+                company_contacts.extend(batch_contacts)
             except Exception as e:
+                record_error(PIPELINE, "api")
                 log_message(f"Error processing data for company {company_id}: {str(e)}")
                 log_message(f"Using original data for this batch.")
                 batch_contacts = [create_contact_from_original(record, company_rank, i) for i, record in enumerate(batch[:5], start=1)]
@@ -218,30 +320,115 @@ def process_data(data, batch_size=100):
         # Add the top 5 contacts from this company to the final list
         all_contacts.extend(top_contacts)
     
+    set_queue_depth(PIPELINE, "companies", 0)
     log_message(f"Total contacts extracted: {len(all_contacts)}")
-    return {"contacts": all_contacts}
+    return all_contacts
+
+def validate_contacts(df):
+    """Fills missing required fields with 'N/A' and transliterates text to ASCII, column by column.
+
+    Each distinct string is transliterated once, and MANAGEMENT_LEVEL comes back as a categorical
+    (integer codes into a small table of levels).
+    """
+    import pandas as pd
+    from unidecode import unidecode
+
+    df = df.copy()
+    for key in REQUIRED_COLUMNS:
+        if key not in df.columns:
+            df[key] = 'N/A'
+            continue
+        missing = df[key].isna() | (df[key].astype(str) == '')
+        if missing.any():
+            df[key] = df[key].astype(object).where(~missing, 'N/A')
+
+    for key in df.columns:
+        if pd.api.types.is_object_dtype(df[key]) or pd.api.types.is_string_dtype(df[key]):
+            values = pd.unique(df[key].dropna())
+            df[key] = df[key].map({value: unidecode(value) if isinstance(value, str) else value for value in values})
+
+    all_missing = (df[REQUIRED_COLUMNS] == 'N/A').all(axis=1)
+    for _, row in df[all_missing].iterrows():
+        log_message(f"Warning: All required fields are 'N/A' for row: {row.to_dict()}")
+
+    df['MANAGEMENT_LEVEL'] = df['MANAGEMENT_LEVEL'].astype('category')
+    return df
 
-def validate_row(row):
-    required_keys = ['INDIVIDUAL_ID', 'NAME', 'PRIMARY_TITLE', 'COMPANY_ID', 'CONFIDENCE_SCORE', 'MANAGEMENT_LEVEL']
-    for key in required_keys:
-        if key not in row.index or pd.isna(row[key]) or row[key] == '':
-            row[key] = 'N/A'
+def clean_contacts(df):
+    import pandas as pd
+
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        log_message(f"Warning: The following required columns are missing: {missing_columns}")
     
-    for key in row.index:
-        if isinstance(row[key], str):
-            row[key] = unidecode(row[key])
+    # Remove rows where all required fields are empty or NaN
+    df = df.dropna(subset=REQUIRED_COLUMNS, how='all')
+    log_message(f"Rows after removing empty entries: {len(df)}")
     
-    if all(row[key] == 'N/A' for key in required_keys):
-        log_message(f"Warning: All required fields are 'N/A' for row: {row.to_dict()}")
+    # Convert CONFIDENCE_SCORE to numeric, replacing non-numeric values with NaN
+    df['CONFIDENCE_SCORE'] = pd.to_numeric(df['CONFIDENCE_SCORE'], errors='coerce')
     
-    return row
+    # Remove rows with NaN CONFIDENCE_SCORE
+    df = df.dropna(subset=['CONFIDENCE_SCORE'])
+    log_message(f"Rows after removing invalid CONFIDENCE_SCORE: {len(df)}")
+    
+    log_message(f"DataFrame shape before processing: {df.shape}")
+    log_message(f"DataFrame head before processing:\n{df.head().to_string()}")
+    return df
 
-def process_csv(csv_file, max_rows=None):
-    if os.path.exists(excel_filename):
-        os.remove(excel_filename)
-        log_message(f"Deleted existing output file: {excel_filename}")
+def select_contacts(df, top_k=DEFAULT_TOP_K):
+    """Picks the top contacts per company from cleaned contact rows.
 
-    check_csv_contents(csv_file)
+    Returns a DataFrame with OUTPUT_COLUMNS, or None when no contacts came back.
+    """
+    df, ranking = prepare_contacts(df, top_k)
+    contacts = process_data(df, ranking=ranking)
+
+    if len(contacts) > 0:
+        log_message(f"Number of contacts in processed data: {len(contacts)}")
+        output_df = contacts.to_frame()
+        log_message(f"Output DataFrame:\n{output_df.head().to_string()}")
+        return output_df
+
+    log_message("Error: No contacts returned from processing.")
+    return None
+
+def prepare_contacts(df, top_k=DEFAULT_TOP_K):
+    # Title shortlist and validation of cleaned contact rows, ahead of process_data. Returns the rows and
+    # the company ranking of the full frame (None without a shortlist, where the rows rank themselves)
+    from title_scoring import shortlist_contacts
+
+    ranking = None
+    if top_k:
+        ranking = rank_companies(df)
+        # Scored before validation so it only touches the shortlist
+        with time_stage(PIPELINE, "shortlist"):
+            total = len(df)
+            df = shortlist_contacts(df, top_k)
+        log_message(f"Shortlisted {len(df)} of {total} contacts (top {top_k} per company by title relevance)")
+
+    with time_stage(PIPELINE, "validate"):
+        return validate_contacts(df), ranking
+
+def plan_contacts(df, batch_size=CONTACTS_BATCH_SIZE, ranking=None):
+    """Dry run of process_data on prepared rows: a planner.Plan of its contact_selection requests.
+
+    Companies are grouped and split into batches as in process_data; each response is counted as five
+    contact blocks, or fewer for a smaller batch.
+    """
+    plan = Plan(PIPELINE)
+    plan.items = len(df)
+    for company_id, rows in companies_by_rank(df, ranking):
+        for i in range(0, len(rows), batch_size):
+            batch = df.iloc[rows[i:i+batch_size]].to_dict('records')
+            prompt = contacts_prompt(batch)
+            plan.add("contact_selection", model_router.route("contact_selection", prompt).model,
+                     count_tokens(prompt), CONTACT_BLOCK_TOKENS * min(5, len(batch)))
+    return plan
+
+def read_contacts(csv_file, max_rows=None):
+    """Reads and cleans csv_file, keeping the first max_rows cleaned rows; None when it cannot be read."""
+    import pandas as pd
 
     try:
         encoding = detect_encoding(csv_file)
@@ -250,74 +437,75 @@ def process_csv(csv_file, max_rows=None):
         log_message(f"Columns: {df.columns.tolist()}")
         log_message(f"First row of data: {df.iloc[0].to_dict()}")
         
-        required_columns = ['INDIVIDUAL_ID', 'NAME', 'PRIMARY_TITLE', 'COMPANY_ID', 'CONFIDENCE_SCORE', 'MANAGEMENT_LEVEL']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            log_message(f"Warning: The following required columns are missing: {missing_columns}")
-        
-        # Remove rows where all required fields are empty or NaN
-        df = df.dropna(subset=required_columns, how='all')
-        log_message(f"Rows after removing empty entries: {len(df)}")
-        
-        # Convert CONFIDENCE_SCORE to numeric, replacing non-numeric values with NaN
-        df['CONFIDENCE_SCORE'] = pd.to_numeric(df['CONFIDENCE_SCORE'], errors='coerce')
-        
-        # Remove rows with NaN CONFIDENCE_SCORE
-        df = df.dropna(subset=['CONFIDENCE_SCORE'])
-        log_message(f"Rows after removing invalid CONFIDENCE_SCORE: {len(df)}")
-        
-        log_message(f"DataFrame shape before processing: {df.shape}")
-        log_message(f"DataFrame head before processing:\n{df.head().to_string()}")
-        
+        df = clean_contacts(df)
     except Exception as e:
         log_message(f"Error reading CSV file: {str(e)}")
-        return
+        return None
 
     if max_rows:
         df = df.iloc[:max_rows]
+    return df
 
-    df = df.apply(validate_row, axis=1)
-
-    processed_data = process_data(df.to_dict('records'))
-
-    log_message(f"Processed data: {processed_data}")
+def process_csv(csv_file, max_rows=None, output_format="auto", excel=None, top_k=DEFAULT_TOP_K):
+    check_csv_contents(csv_file)
 
-    if processed_data and 'contacts' in processed_data and isinstance(processed_data['contacts'], list) and len(processed_data['contacts']) > 0:
-        log_message(f"Number of contacts in processed data: {len(processed_data['contacts'])}")
-        output_df = pd.DataFrame(processed_data['contacts'])
-        log_message(f"Output DataFrame:\n{output_df.head().to_string()}")
+    df = read_contacts(csv_file, max_rows)
+    if df is None:
+        return
 
-        # Ensure the required columns are present
-        required_columns = ['name', 'individual_id', 'primary_title', 'management_level', 'email_address', 'best_freemail', 'phone_number', 'linkedin_url', 'company_id', 'reason', 'info_count', 'contact_rank', 'company_rank', 'confidence_score']
-        for col in required_columns:
-            if col not in output_df.columns:
-                output_df[col] = 'N/A'
+    output_df = select_contacts(df, top_k=top_k)
 
-        with pd.ExcelWriter(excel_filename) as writer:
-            output_df.to_excel(writer, sheet_name='Processed Data', index=False, columns=required_columns)
+    if output_df is not None:
+        with time_stage(PIPELINE, "write"):
+            written = write_results(output_df, output_filename, output_format=output_format, excel=excel,
+                                    sheet_name='Processed Data', columns=OUTPUT_COLUMNS, log=log_message)
 
-        log_message(f"\nProcessing complete. Results saved to {excel_filename}")
+        log_message(f"\nProcessing complete. Results saved to {', '.join(written)}")
     else:
-        log_message("Error: No processed data returned or invalid data structure.")
-        log_message(f"Processed data structure: {type(processed_data)}")
-        log_message(f"Processed data content: {processed_data}")
-        # Save the original data to Excel as a fallback
-        df.to_excel(excel_filename, index=False)
-        log_message(f"Original data saved to {excel_filename}")
+        # Save the original data as a fallback
+        written = write_results(df, output_filename, output_format=output_format, excel=excel,
+                                sheet_name='Original Data', log=log_message)
+        log_message(f"Original data saved to {', '.join(written)}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process contact data from CSV")
     parser.add_argument("--max_rows", type=int, help="Maximum number of rows to process")
+    parser.add_argument("--top_k", type=int, default=DEFAULT_TOP_K,
+                        help="Contacts per company sent to the model after local title scoring (0: send all)")
+    add_output_arguments(parser)
+    add_metrics_arguments(parser)
+    add_retry_arguments(parser)
+    add_routing_arguments(parser)
+    add_streaming_arguments(parser)
+    add_hedging_arguments(parser)
+    add_plan_arguments(parser)
     args = parser.parse_args()
 
+    os.makedirs(results_dir, exist_ok=True)
     if not os.path.exists(csv_file):
         log_message(f"Error: CSV file not found at {csv_file}")
         exit(1)
 
+    configure_retries(args)
+    configure_routing(args, routers=[model_router])
+    configure_streaming(args)
+    configure_hedging(args)
+    if args.plan:
+        df = read_contacts(csv_file, args.max_rows)
+        if df is not None:
+            # process_data sends one batch at a time
+            df, ranking = prepare_contacts(df, args.top_k)
+            plan_contacts(df, ranking=ranking).report(
+                os.path.join(results_dir, "plan.json"), 1, log=log_message, **plan_options(args))
+        exit(0)
+    start_metrics(args, log=log_message)
     try:
         check_csv_contents(csv_file)
-        process_csv(csv_file, max_rows=args.max_rows)
+        process_csv(csv_file, max_rows=args.max_rows, output_format=args.output_format, excel=args.excel,
+                    top_k=args.top_k)
     except KeyboardInterrupt:
         log_message("Script interrupted by user. Progress has been saved.")
     except Exception as e:
         log_message(f"An error occurred: {str(e)}")
+    finally:
+        finish_metrics(args, log=log_message)
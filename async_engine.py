@@ -0,0 +1,115 @@
+import itertools
+
+from llm_client import create_async_client
+from streaming import acreate_message
+
+# asyncio is imported where it is used: it costs more at startup than the rest of a script's imports
+
+DEFAULT_CONCURRENCY = 200
+# Items taken from the input iterator per hop to a worker thread; advancing it can parse a CSV chunk
+PULL_BATCH = 64
+
+# Off by default; --engine async runs bios.py and notebook.py on an event loop instead of a thread pool
+ENABLED = False
+concurrency = DEFAULT_CONCURRENCY
+
+
+class AsyncEngine:
+    """The AsyncAnthropic client (one HTTP connection pool) and request semaphore of one event loop.
+
+    engine.create_message(monitor, pipeline=..., **kwargs) is streaming.acreate_message on the shared
+    client once one of `concurrency` request slots is free, so at most that many requests are open
+    however many rows are in flight (a hedged request shares its primary's slot). Retry backoff happens
+    outside the slot.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self.client = None
+        self.slots = None
+
+    async def __aenter__(self):
+        import asyncio
+
+        self.client = create_async_client(self.concurrency)
+        self.slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.close()
+        return False
+
+    async def create_message(self, monitor=None, pipeline=None, **kwargs):
+        async with self.slots:
+            return await acreate_message(self.client, monitor, pipeline=pipeline, **kwargs)
+
+
+async def to_thread(fn, *args, **kwargs):
+    # CPU-bound or blocking work (tokenizing, parsing, file reads, DataFrame building) off the event loop
+    import asyncio
+
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def map_bounded(process, items, limit):
+    """Async counterpart of windowed_executor.submit_windowed: awaits process(item) for each item with at
+    most `limit` in flight, yielding (item, task) pairs as they complete.
+
+    items is a plain (blocking) iterator, consumed lazily PULL_BATCH items at a time on a worker thread,
+    so reading and validating the input neither blocks the event loop nor runs ahead of the window.
+    """
+    import asyncio
+
+    items = iter(items)
+    in_flight = {}
+    exhausted = False
+
+    async def fill():
+        nonlocal exhausted
+        while not exhausted and len(in_flight) < limit:
+            batch = await to_thread(list, itertools.islice(items, min(PULL_BATCH, limit - len(in_flight))))
+            if not batch:
+                exhausted = True
+            for item in batch:
+                in_flight[asyncio.ensure_future(process(item))] = item
+
+    try:
+        await fill()
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            completed = [(in_flight.pop(task), task) for task in done]
+            await fill()
+            for pair in completed:
+                yield pair
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def run(main, limit=None):
+    """Runs `await main(engine)` on a new event loop with a fresh AsyncEngine and returns its result.
+
+    Blocks the calling thread, so it works from a script's main thread and from a pipeline.py stage.
+    """
+    import asyncio
+
+    async def runner():
+        async with AsyncEngine(limit or concurrency) as engine:
+            return await main(engine)
+
+    return asyncio.run(runner())
+
+
+def add_engine_arguments(parser):
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="Run bios and company-info requests on a thread pool or on one asyncio event loop "
+                             "with a shared connection pool")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Requests in flight at once with --engine async")
+    return parser
+
+
+def configure_engine(args):
+    global ENABLED, concurrency
+    ENABLED = getattr(args, "engine", "threads") == "async"
+    concurrency = getattr(args, "concurrency", concurrency)
@@ -0,0 +1,313 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    # "fixed:0.2", "uniform:0.1,0.5", "lognormal:0.4,0.5" (median seconds, sigma), "exponential:0.3" (mean seconds)
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        mu = 0.0 if median <= 0 else math.log(median)
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _fake_bio(name, target):
+    sentence = (f"{name} is a Senior Manager at Example Corp, based in Denver, Colorado. "
+                f"{name} is responsible for regional operations and vendor management. ")
+    return (sentence * (target // len(sentence) + 1)).strip()
+
+
+def _bio_response(prompt):
+    name = re.search(r"^Name: (.*)$", prompt, re.MULTILINE)
+    profile_id = re.search(r'"profile_id": "(.*?)"', prompt)
+    min_length = re.search(r"at least (\d+) characters", prompt)
+    name = name.group(1) if name else "N/A"
+    return json.dumps({
+        "name": name,
+        "profile_id": profile_id.group(1) if profile_id else "N/A",
+        "bio": _fake_bio(name, int(min_length.group(1)) if min_length else 200),
+    })
+
+
+def _bio_batch_response(prompt):
+    profiles = re.findall(r"^Profile ID: (.*)\nMinimum Length: (\d+) characters\nName: (.*)$", prompt, re.MULTILINE)
+    return json.dumps([
+        {"profile_id": profile_id, "name": name, "bio": _fake_bio(name, int(min_length))}
+        for profile_id, min_length, name in profiles
+    ], indent=2)
+
+
+def _evaluation_response(prompt):
+    name = re.search(r"bio for (.*?) on a scale", prompt)
+    return json.dumps({
+        "name": name.group(1) if name else "N/A",
+        "rating": 8,
+        "explanation": "Clear and accurate summary of the current role.",
+    })
+
+
+def _contacts_response(prompt):
+    data = re.search(r"Data to process: (\[.*\])", prompt, re.DOTALL)
+    records = json.loads(data.group(1)) if data else []
+    blocks = []
+    for rank, record in enumerate(records[:5], start=1):
+        blocks.append("\n".join([
+            f"Name: {record.get('NAME', 'N/A')}",
+            f"Individual ID: {record.get('INDIVIDUAL_ID', 'N/A')}",
+            f"Primary Title: {record.get('PRIMARY_TITLE', 'N/A')}",
+            f"Management Level: {record.get('MANAGEMENT_LEVEL', 'N/A')}",
+            f"Email Address: {record.get('EMAIL_ADDRESS', '')}",
+            f"Best Freemail: {record.get('BEST_FREEMAIL', '')}",
+            f"Phone Number: {record.get('PHONE_NUMBER', '')}",
+            f"LinkedIn URL: {record.get('LINKEDIN_URL', '')}",
+            f"Company ID: {record.get('COMPANY_ID', 'N/A')}",
+            "Reason: Title relevant to travel and procurement",
+            "Info Count: 3",
+            f"Contact Rank: {rank}",
+            f"Confidence Score: {record.get('CONFIDENCE_SCORE', 0)}",
+        ]))
+    return "\n\n".join(blocks)
+
+
+def _company_response(prompt):
+    return "\n".join([
+        "Company Name: Example Corp",
+        "Company Address:",
+        "- Street: 100 Main Street",
+        "- City: Denver",
+        "- County: Denver",
+        "- State: CO",
+        "- Country: USA",
+        "- ZIP: 80202",
+        "Company Revenue: $1.2B",
+        "Company Headcount: 5400",
+        "Company Industry: Logistics",
+        "NAICS Code: 484110",
+        "SIC Code: 4213",
+        "Company Website: https://example.com",
+        "Company Website Status: active",
+        "Company Description: Freight and logistics services.",
+        "Company Phone: 303-555-0100",
+        "Headquarter Identification: Yes",
+    ])
+
+
+def _funding_response(prompt):
+    return json.dumps({
+        "fund_receiver": "Example Robotics",
+        "investors": ["Alpha Ventures", "Beta Capital"],
+        "date": "2024-05-01",
+        "round_type": "Series B",
+        "amount_raised": "$40 million",
+        "summary": "Example Robotics raised $40 million in a Series B round.",
+        "scoop_type": "Funding",
+        "topics": ["Robotics", "Funding"],
+        "department": "Finance",
+    })
+
+
+# (prompt substring, responder) pairs checked in order
+DEFAULT_RESPONDERS = [
+    ("Return the bios as a JSON array", _bio_batch_response),
+    ("professional biographies", _bio_response),
+    ("evaluate the following bio", _evaluation_response),
+    ("top 5 optimal contacts", _contacts_response),
+    ("extract comprehensive information about a specific company", _company_response),
+    ("extract the funding information", _funding_response),
+]
+
+
+class _Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections (and costs a 1s SYN retry) under --engine async
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockAnthropicServer:
+    def __init__(self, latency="fixed:0.05", rate_limit_rate=0.0, overloaded_rate=0.0,
+                 canned_responses=None, seed=0, host="127.0.0.1", port=0, output_tokens_per_second=None):
+        self.sample_latency = parse_latency(latency)
+        # Simulated generation speed; None returns the whole response after the latency only
+        self.output_tokens_per_second = output_tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.overloaded_rate = overloaded_rate
+        self.canned_responses = canned_responses or {}
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+        self.httpd = _Server((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {"requests": 0, "rate_limited": 0, "overloaded": 0, "input_tokens": 0, "output_tokens": 0,
+                          "streamed": 0, "stream_closed_early": 0}
+
+    def snapshot_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def respond(self, prompt):
+        for needle, text in self.canned_responses.items():
+            if needle in prompt:
+                return text
+        for needle, responder in DEFAULT_RESPONDERS:
+            if needle in prompt:
+                return responder(prompt)
+        return "OK"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                server._count("requests")
+
+                with server.rng_lock:
+                    roll = server.rng.random()
+                    delay = server.sample_latency(server.rng)
+
+                if not self.path.split("?")[0].rstrip("/").endswith("/v1/messages"):
+                    self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+                    return
+                if roll < server.rate_limit_rate:
+                    server._count("rate_limited")
+                    self._send_json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limited"}},
+                                    headers={"retry-after-ms": "50"})
+                    return
+                if roll < server.rate_limit_rate + server.overloaded_rate:
+                    server._count("overloaded")
+                    self._send_json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+                    return
+
+                time.sleep(delay)
+                prompt = "\n".join(
+                    part if isinstance(part, str) else part.get("text", "")
+                    for message in request.get("messages", [])
+                    for part in ([message["content"]] if isinstance(message["content"], str) else message["content"])
+                )
+                text = server.respond(prompt)
+                input_tokens = estimate_tokens(prompt)
+                max_tokens = request.get("max_tokens", 4096)
+                stop_reason = "end_turn"
+                if estimate_tokens(text) > max_tokens:
+                    # Truncate like the real API so tight max_tokens caps are exercised
+                    text = text[:max_tokens * 4]
+                    stop_reason = "max_tokens"
+                output_tokens = estimate_tokens(text)
+                server._count("input_tokens", input_tokens)
+                message = {
+                    "id": f"msg_{uuid.uuid4().hex[:24]}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": request.get("model", "mock"),
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": stop_reason,
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+                }
+                if request.get("stream"):
+                    self._stream(message)
+                    return
+                if server.output_tokens_per_second:
+                    time.sleep(output_tokens / server.output_tokens_per_second)
+                server._count("output_tokens", output_tokens)
+                self._send_json(200, message)
+
+            def _send_event(self, event_type, payload):
+                self.wfile.write(f"event: {event_type}\ndata: {json.dumps(dict(payload, type=event_type))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _stream(self, message):
+                # Server-sent events in the Messages API streaming format, 8 tokens per delta
+                server._count("streamed")
+                text = message["content"][0]["text"]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                chunk_chars = 8 * 4
+                sent_tokens = 0
+                try:
+                    self._send_event("message_start", {"message": dict(
+                        message, content=[], stop_reason=None,
+                        usage={"input_tokens": message["usage"]["input_tokens"], "output_tokens": 1})})
+                    self._send_event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+                    for start in range(0, len(text), chunk_chars):
+                        chunk = text[start:start + chunk_chars]
+                        if server.output_tokens_per_second:
+                            time.sleep(estimate_tokens(chunk) / server.output_tokens_per_second)
+                        self._send_event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": chunk}})
+                        sent_tokens += estimate_tokens(chunk)
+                    self._send_event("content_block_stop", {"index": 0})
+                    self._send_event("message_delta", {"delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                                       "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+                    self._send_event("message_stop", {})
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream early; the remaining tokens are never generated
+                    server._count("stream_closed_early")
+                finally:
+                    server._count("output_tokens", sent_tokens)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,452 @@
+import argparse
+import contextlib
+import csv
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from benchmarks.mock_anthropic import MockAnthropicServer, parse_latency
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PIPELINES = ["bios", "contacts", "company_info", "scraper"]
+
+# Seconds a pipeline may run before its child process is killed and the run reported as failed
+DEFAULT_TIMEOUT = 1800
+
+FIRST_NAMES = ["Ana", "Ben", "Chloe", "Dev", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jamal"]
+LAST_NAMES = ["Garcia", "Smith", "Nguyen", "Patel", "Okafor", "Kim", "Rossi", "Cohen", "Silva", "Moore"]
+TITLES = [
+    ("Chief Executive Officer", "C-Level"), ("VP of Operations", "VP-Level"), ("Travel Manager", "Manager"),
+    ("Director of Procurement", "Director"), ("Facilities Manager", "Manager"), ("Software Engineer", "Non-Manager"),
+    ("Head of Logistics", "Director"), ("Accountant", "Non-Manager"), ("Former CFO", "C-Level"),
+]
+CITIES = ["Denver, Colorado", "Austin, Texas", "Chicago, Illinois", "Seattle, Washington", "N/A"]
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def make_bios_input(workdir, rows, rng):
+    path = os.path.join(workdir, "bios.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["PROFILE_ID", "FULL_NAME", "LOCATION", "COMPANY_NAME", "CURRENT_POSITION", "PERSON_BIOGRAPHY",
+                         "COMPANY_NAME_PREV", "PREVIOUS_POSITION", "DEGREE", "INSTITUTION_NAME", "SOCIAL_URL"])
+        for i in range(rows):
+            title, _ = rng.choice(TITLES)
+            writer.writerow([f"P{i:07d}", _name(rng), rng.choice(CITIES), f"Company {i % 97}", title,
+                             "Experienced operator." * rng.randint(0, 12), f"Company {(i + 13) % 97}", "Analyst",
+                             rng.choice(["BA", "MBA", ""]), rng.choice(["State University", ""]), ""])
+    return path
+
+
+def make_contacts_input(workdir, rows, rng):
+    path = os.path.join(workdir, "contacts.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["INDIVIDUAL_ID", "NAME", "LTE_FLAG", "PRIMARY_TITLE", "MANAGEMENT_LEVEL", "EMAIL_ADDRESS",
+                         "BEST_FREEMAIL", "MOBILE_PHONE", "PHONE_NUMBER", "LINKEDIN_URL", "COMPANY_ID", "CONFIDENCE_SCORE"])
+        companies = max(1, rows // 20)
+        for i in range(rows):
+            title, level = rng.choice(TITLES)
+            writer.writerow([100000 + i, _name(rng), "N", title, level, f"user{i}@example.com", "", "",
+                             "303-555-0100", f"https://linkedin.com/in/user{i}", 5000 + i % companies,
+                             round(rng.uniform(0.1, 1.0), 3)])
+    return path
+
+
+def make_company_info_input(workdir, rows, rng):
+    input_dir = os.path.join(workdir, "company_docs")
+    os.makedirs(input_dir, exist_ok=True)
+    paragraph = ("Example Corp is a freight and logistics company headquartered at 100 Main Street, Denver, CO 80202. "
+                 "The company reported revenue of $1.2B and employs roughly 5,400 people. ")
+    for i in range(rows):
+        with open(os.path.join(input_dir, f"filing_{i:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(paragraph * rng.randint(20, 200))
+    return input_dir
+
+
+def make_scraper_input(workdir, rows, rng):
+    path = os.path.join(workdir, "INPUT.csv")
+    fixtures = sorted(os.listdir(FIXTURES_DIR))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["TASK_ID", "SOURCE", "ARTICLE TITLE"])
+        for i in range(rows):
+            fixture = fixtures[i % len(fixtures)]
+            writer.writerow([i + 1, f"https://news{i % 7}.example.com/2024/05/{fixture}?id={i}", f"Article {i + 1}"])
+    return path
+
+
+class _FixtureElement:
+    pass
+
+
+class FixtureDriver:
+    # Stands in for the Firefox webdriver: serves benchmarks/fixtures/<basename of the URL path>
+    def __init__(self, fetch_latency=None, seed=0):
+        self.fetch_latency = fetch_latency
+        self.rng = random.Random(seed)
+        self.page_source = ""
+        self.current_url = None
+
+    def get(self, url):
+        if self.fetch_latency:
+            time.sleep(self.fetch_latency(self.rng))
+        self.current_url = url
+        fixture = os.path.join(FIXTURES_DIR, os.path.basename(urlparse(url).path))
+        with open(fixture, encoding="utf-8") as f:
+            self.page_source = f.read()
+
+    def find_element(self, by=None, value=None):
+        return _FixtureElement()
+
+    def quit(self):
+        pass
+
+
+class _TimedStream:
+    # A streamed call lasts until the pipeline closes it (possibly early), not until the headers arrive
+    def __init__(self, stream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.stream)
+
+    def close(self):
+        self.stream.close()
+        if self.on_close:
+            self.on_close()
+            self.on_close = None
+
+
+def _instrument_client(base_url, latencies):
+    import anthropic
+
+    # Retries are left to the pipelines' retry_policy, as in the scripts' own clients
+    client = anthropic.Anthropic(api_key="benchmark", base_url=base_url, max_retries=0)
+    create = client.messages.create
+    lock = threading.Lock()
+
+    def record(start):
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    def timed_create(*args, **kwargs):
+        start = time.perf_counter()
+        if kwargs.get("stream"):
+            return _TimedStream(create(*args, **kwargs), lambda: record(start))
+        try:
+            return create(*args, **kwargs)
+        finally:
+            record(start)
+
+    client.messages.create = timed_create
+    return client
+
+
+class _AsyncTimedStream(_TimedStream):
+    def __aiter__(self):
+        return self.stream.__aiter__()
+
+    async def close(self):
+        await self.stream.close()
+        if self.on_close:
+            self.on_close()
+            self.on_close = None
+
+
+def _instrument_async_client_factory(base_url, latencies):
+    import anthropic
+    import httpx
+
+    lock = threading.Lock()
+
+    def record(start):
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    def factory(max_connections):
+        http_client = anthropic.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        client = anthropic.AsyncAnthropic(api_key="benchmark", base_url=base_url, max_retries=0,
+                                          http_client=http_client)
+        create = client.messages.create
+
+        async def timed_create(*args, **kwargs):
+            start = time.perf_counter()
+            if kwargs.get("stream"):
+                return _AsyncTimedStream(await create(*args, **kwargs), lambda: record(start))
+            try:
+                return await create(*args, **kwargs)
+            finally:
+                record(start)
+
+        client.messages.create = timed_create
+        return client
+
+    return factory
+
+
+def _patch_paths(module, workdir):
+    module.results_dir = workdir
+    module.log_file = os.path.join(workdir, "generation_log.txt")
+    module.output_filename = os.path.join(workdir, "result.xlsx")
+
+
+def run_bios(workdir, rows, rng, options):
+    csv_path = make_bios_input(workdir, rows, rng)
+    bios = importlib.import_module("bios")
+    _patch_paths(bios, workdir)
+    bios.process_csv(csv_path, output_format="parquet", excel=False, batch_size=options["batch_size"])
+
+
+def run_contacts(workdir, rows, rng, options):
+    csv_path = make_contacts_input(workdir, rows, rng)
+    aaron = importlib.import_module("aaron")
+    _patch_paths(aaron, workdir)
+    aaron.process_csv(csv_path, output_format="parquet", excel=False)
+
+
+def run_company_info(workdir, rows, rng, options):
+    input_dir = make_company_info_input(workdir, rows, rng)
+    notebook = importlib.import_module("notebook")
+    _patch_paths(notebook, workdir)
+    notebook.input_dir = input_dir
+    company_info = notebook.process_input_files(notebook.get_txt_files_from_input_dir())
+    if company_info:
+        notebook.save_results(company_info, "parquet", False)
+
+
+def run_scraper(workdir, rows, rng, options):
+    input_path = make_scraper_input(workdir, rows, rng)
+    scraper = importlib.import_module("webscraping_anthropic")
+    _patch_paths(scraper, workdir)
+    scraper.log_file = os.path.join(workdir, "scraping_and_processing.log")
+    scraper.input_file_path = input_path
+    scraper.output_file_path = os.path.join(workdir, "output.csv")
+    fetch_latency = parse_latency(options["fetch_latency"])
+    scraper.setup_driver = lambda: FixtureDriver(fetch_latency, seed=rng.random())
+    dedup_path = os.path.join(workdir, "dedup_index.sqlite") if options["dedup"] else None
+    # Fixture hosts are not real sites, so there is no robots.txt to read
+    scraper.main(output_format="parquet", excel=False, dedup_path=dedup_path, respect_robots=False)
+
+
+RUNNERS = {
+    "bios": run_bios,
+    "contacts": run_contacts,
+    "company_info": run_company_info,
+    "scraper": run_scraper,
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _child(pipeline, workdir, rows, base_url, options, results):
+    latencies = []
+    rng = random.Random(options["seed"])
+    with open(os.path.join(workdir, "stdout.txt"), "w") as sink, \
+            contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+        client = _instrument_client(base_url, latencies)
+        # Every pipeline module calls the API through the shared client
+        llm_client = importlib.import_module("llm_client")
+        llm_client.set_client(client)
+        llm_client.set_async_client_factory(_instrument_async_client_factory(base_url, latencies))
+        async_engine = importlib.import_module("async_engine")
+        async_engine.ENABLED = options["engine"] == "async"
+        async_engine.concurrency = options["concurrency"]
+        streaming = importlib.import_module("streaming")
+        streaming.ENABLED = options["stream"]
+        importlib.import_module("hedging").HEDGER.budget.ratio = options["hedge_ratio"]
+        start = time.perf_counter()
+        error = None
+        try:
+            RUNNERS[pipeline](workdir, rows, rng, options)
+        except Exception as e:
+            error = repr(e)
+        wall = time.perf_counter() - start
+    results.put({"wall": wall, "latencies": latencies, "peak_rss_mb": _peak_rss_mb(), "error": error})
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _wait_for_outcome(process, results, timeout):
+    # The child's result, or a failed outcome when it dies or runs past timeout without reporting
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return results.get(timeout=1.0)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            try:
+                # A result put just before exiting may still be in the pipe
+                return results.get(timeout=1.0)
+            except queue.Empty:
+                error = f"child process exited with code {process.exitcode} before reporting a result"
+                break
+        if time.monotonic() > deadline:
+            process.terminate()
+            error = f"timed out after {timeout:g}s"
+            break
+    return {"wall": 0.0, "latencies": [], "peak_rss_mb": 0.0, "error": error}
+
+
+def run_pipeline(pipeline, server, rows, options):
+    server.reset_stats()
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    with tempfile.TemporaryDirectory(prefix=f"bench_{pipeline}_") as workdir:
+        process = ctx.Process(target=_child, args=(pipeline, workdir, rows, server.base_url, options, results))
+        process.start()
+        outcome = _wait_for_outcome(process, results, options["timeout"])
+        process.join()
+    if outcome["error"] is None and process.exitcode != 0:
+        outcome["error"] = f"child process exited with code {process.exitcode}"
+    stats = server.snapshot_stats()
+    return {
+        "pipeline": pipeline,
+        "rows": rows,
+        "wall_seconds": round(outcome["wall"], 3),
+        "rows_per_sec": round(rows / outcome["wall"], 3) if outcome["wall"] else 0.0,
+        "p50_latency": round(percentile(outcome["latencies"], 50), 4),
+        "p95_latency": round(percentile(outcome["latencies"], 95), 4),
+        "peak_rss_mb": round(outcome["peak_rss_mb"], 1),
+        "api_calls": stats["requests"],
+        "calls_per_row": round(stats["requests"] / rows, 3) if rows else 0.0,
+        "rate_limited": stats["rate_limited"],
+        "overloaded": stats["overloaded"],
+        "output_tokens": stats["output_tokens"],
+        "error": outcome["error"],
+    }
+
+
+# metric -> True when higher is better
+REGRESSION_METRICS = {
+    "rows_per_sec": True,
+    "p95_latency": False,
+    "peak_rss_mb": False,
+    "calls_per_row": False,
+}
+
+
+def find_regressions(current, baseline, tolerance):
+    regressions = []
+    baseline_by_name = {entry["pipeline"]: entry for entry in baseline}
+    for entry in current:
+        reference = baseline_by_name.get(entry["pipeline"])
+        if not reference:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            old, new = reference.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{entry['pipeline']}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_report(report):
+    columns = ["pipeline", "rows", "wall_seconds", "rows_per_sec", "p50_latency", "p95_latency",
+               "peak_rss_mb", "calls_per_row", "rate_limited", "overloaded", "output_tokens"]
+    widths = [max(len(col), *(len(str(entry[col])) for entry in report)) for col in columns]
+    print("  ".join(col.ljust(width) for col, width in zip(columns, widths)))
+    for entry in report:
+        print("  ".join(str(entry[col]).ljust(width) for col, width in zip(columns, widths)))
+        if entry["error"]:
+            print(f"    error: {entry['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipelines against a local mock Messages API")
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=PIPELINES)
+    parser.add_argument("--rows", type=int, default=200, help="Input rows (documents for company_info) per pipeline")
+    parser.add_argument("--latency", default="lognormal:0.05,0.4", help="Mock API latency distribution")
+    parser.add_argument("--fetch_latency", default="fixed:0.01", help="Simulated page load latency for the scraper")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--overloaded_rate", type=float, default=0.0, help="Fraction of requests answered with 529")
+    parser.add_argument("--responses", help="JSON file mapping prompt substrings to canned response text")
+    parser.add_argument("--dedup", action="store_true", help="Run the scraper with a fresh deduplication index")
+    parser.add_argument("--stream", action="store_true", help="Run the pipelines with streaming and early stop")
+    parser.add_argument("--output_tps", type=float, help="Simulated output tokens per second (default: instant)")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="Engine for the bios and company_info pipelines")
+    parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight with --engine async")
+    parser.add_argument("--hedge_ratio", type=float, default=0.05,
+                        help="Fraction of API calls the pipelines may hedge (0 disables hedging)")
+    parser.add_argument("--batch_size", type=int, default=1, help="Profiles packed into one bios request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Seconds each pipeline may run before it is killed and reported as failed")
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous --json report and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before flagging a regression")
+    args = parser.parse_args()
+
+    canned = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            canned = json.load(f)
+
+    options = {"fetch_latency": args.fetch_latency, "seed": args.seed, "dedup": args.dedup, "stream": args.stream,
+               "batch_size": args.batch_size, "hedge_ratio": args.hedge_ratio,
+               "engine": args.engine, "concurrency": args.concurrency, "timeout": args.timeout}
+    report = []
+    with MockAnthropicServer(latency=args.latency, rate_limit_rate=args.rate_limit_rate,
+                             overloaded_rate=args.overloaded_rate, canned_responses=canned, seed=args.seed,
+                             output_tokens_per_second=args.output_tps) as server:
+        for pipeline in args.pipelines:
+            rows = args.rows if pipeline != "company_info" else max(1, args.rows // 10)
+            print(f"Running {pipeline} with {rows} rows against {server.base_url} ...")
+            report.append(run_pipeline(pipeline, server, rows, options))
+
+    print()
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [entry["pipeline"] for entry in report if entry["error"]]
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        if regressions:
+            print("\nPerformance regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+    if failed:
+        print(f"\nFailed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = ["bios", "aaron", "notebook", "webscraping_anthropic", "pipeline"]
+
+# Libraries that must only be imported once a job actually needs them
+HEAVY_MODULES = ["anthropic", "pandas", "numpy", "pyarrow", "openpyxl", "selenium", "bs4", "lxml", "tiktoken",
+                 "snowflake", "requests", "tqdm", "chardet", "unidecode", "http.server"]
+
+
+def parse_importtime(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_field, cumulative_us, name = line.split("|")
+        entries.append((name.strip(), int(self_field.split(":")[1]), int(cumulative_us)))
+    return entries
+
+
+def measure_import(module):
+    check = (f"import sys, {module}; "
+             f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", check], cwd=REPO_DIR,
+                            capture_output=True, text=True)
+    entries = parse_importtime(result.stderr)
+    total_us = next((cumulative for name, _, cumulative in reversed(entries) if name == module), 0)
+    # Largest imports by cumulative time, excluding the module itself
+    slowest = sorted((entry for entry in entries if entry[0] != module), key=lambda entry: entry[2], reverse=True)
+    heavy = [name for name in result.stdout.strip().split(",") if name]
+    return total_us / 1000.0, heavy, slowest[:5], result.returncode
+
+
+def measure_help(script, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, f"{script}.py", "--help"], cwd=REPO_DIR, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import time and --help startup of each script against a budget")
+    parser.add_argument("--scripts", nargs="+", choices=SCRIPTS, default=SCRIPTS)
+    parser.add_argument("--import_budget_ms", type=float, default=150.0,
+                        help="Maximum cumulative -X importtime of each script module")
+    parser.add_argument("--help_budget_ms", type=float, default=500.0,
+                        help="Maximum wall time of `python SCRIPT.py --help` (interpreter startup included)")
+    parser.add_argument("--runs", type=int, default=3, help="--help runs per script (the fastest counts)")
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = []
+    failures = []
+    for script in args.scripts:
+        import_ms, heavy, slowest, returncode = measure_import(script)
+        help_ms = measure_help(script, args.runs)
+        report.append({"script": script, "import_ms": round(import_ms, 1), "help_ms": round(help_ms, 1),
+                       "heavy_imports": heavy})
+        if returncode != 0:
+            failures.append(f"{script}: import failed")
+        if import_ms > args.import_budget_ms:
+            failures.append(f"{script}: import took {import_ms:.0f}ms (budget {args.import_budget_ms:.0f}ms); "
+                            f"slowest: {', '.join(f'{name} {cumulative / 1000:.0f}ms' for name, _, cumulative in slowest)}")
+        if help_ms > args.help_budget_ms:
+            failures.append(f"{script}: --help took {help_ms:.0f}ms (budget {args.help_budget_ms:.0f}ms)")
+        if heavy:
+            failures.append(f"{script}: imports {', '.join(heavy)} at startup")
+
+    columns = ["script", "import_ms", "help_ms", "heavy_imports"]
+    widths = [max(len(col), *(len(str(entry[col])) for entry in report)) for col in columns]
+    print("  ".join(col.ljust(width) for col, width in zip(columns, widths)))
+    for entry in report:
+        print("  ".join(str(entry[col]).ljust(width) for col, width in zip(columns, widths)))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if failures:
+        print("\nStartup budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll scripts within the startup budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,64 @@
-import anthropic
 import csv
 import json
 import os
 import argparse
 import time
+import itertools
+import functools
 from datetime import datetime
-from openpyxl import Workbook
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
-
-# Initialize the Anthropic client
-client = anthropic.Anthropic(
-    api_key="",
-)
-
-# Define directories
-csv_file = "/Users/navinnishanth/Downloads/BIO_TESTS/bios pr.csv"
-results_dir = "/Users/navinnishanth/Downloads/BIO_TESTS/bio_results"
-
-# Create results directory if it doesn't exist
-os.makedirs(results_dir, exist_ok=True)
+from output_writers import add_output_arguments, write_results
+from metrics import (add_metrics_arguments, finish_metrics, record_api_usage, record_error, set_queue_depth,
+                     start_metrics, time_stage)
+from retry_policy import RetryPolicy, ValidationError, add_retry_arguments, configure_retries
+from model_router import ModelRouter, TruncatedResponse, add_routing_arguments, check_truncated, configure_routing
+from text_reduction import CHARS_PER_TOKEN, estimate_tokens
+from streaming import JsonObjectMonitor, add_streaming_arguments, configure_streaming, create_message
+from hedging import add_hedging_arguments, configure_hedging
+import async_engine
+from async_engine import add_engine_arguments, configure_engine
+from llm_client import get_client
+from windowed_executor import submit_windowed
+from planner import Plan, add_plan_arguments, count_tokens, plan_options
+
+PIPELINE = "bios"
+
+# Defaults when run as a script; pipeline.py points these at its own input and results directory
+csv_file = "bios.csv"
+results_dir = os.path.join("results", "bios")
 
 # Create a log file
 log_file = os.path.join(results_dir, "generation_log.txt")
 
-# Excel file name
-excel_filename = os.path.join(results_dir, "bio_data.xlsx")
+# Output file name (extension follows --output_format; bio_data.xlsx is the Excel sidecar)
+output_filename = os.path.join(results_dir, "bio_data.xlsx")
+
+# Packed mode (--batch_size > 1): expected output tokens of all bios in one request, leaving
+# room under the model's output limit for the JSON array around them
+PACKED_OUTPUT_BUDGET = 3000
+# Profiles whose bio alone is expected to be longer than this are always sent on their own
+MAX_PACKED_PROFILE_TOKENS = 1000
+# JSON keys and quoting around each bio in the array
+PACKED_ENTRY_OVERHEAD_TOKENS = 40
+
+# Rating and a sentence or two of explanation, for --plan
+EVALUATION_OUTPUT_TOKENS = 80
+
+# Rows read from the input CSV at a time; profiles are validated and submitted as they are read
+CSV_CHUNK_ROWS = 10000
+# Profiles (or packed batches) in flight per worker thread; the rest of the input stays unread
+WINDOW_PER_WORKER = 2
+
+# Profile fields that carry information beyond the name
+DETAIL_FIELDS = ['CURRENT_POSITION', 'COMPANY_NAME', 'LOCATION', 'PREVIOUS_POSITION', 'COMPANY_NAME_PREV',
+                 'DEGREE', 'INSTITUTION_NAME']
+# Profiles with fewer detail fields than this get a rendered template bio instead of an LLM call
+# (name, title, company and location alone is 3); 0 sends every profile to the model. Template bios
+# run about 60-120 characters, so they are exempt from MIN_BIO_LENGTH and flagged length_ok=False
+TEMPLATE_THRESHOLD = 4
+# Generated bios are at least this long, or as long as the profile's existing PERSON_BIOGRAPHY
+MIN_BIO_LENGTH = 200
 
 def log_message(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -34,7 +66,12 @@ def log_message(message):
         f.write(f"[{timestamp}] {message}\n")
     print(message)
 
+retry_policy = RetryPolicy(PIPELINE, log=log_message)
+model_router = ModelRouter(PIPELINE, log=log_message)
+
 def check_csv_contents(csv_file):
+    import pandas as pd
+
     try:
         df = pd.read_csv(csv_file, encoding='utf-8', nrows=5)
         log_message(f"CSV file preview (comma delimiter):\n{df.to_string()}")
@@ -43,25 +80,8 @@ def check_csv_contents(csv_file):
     except Exception as e:
         log_message(f"Error reading CSV file: {str(e)}")
 
-def generate_bio(data, min_length, attempt=1):
-    log_message(f"Generating bio for data: {data} (Attempt: {attempt}, Min Length: {min_length})")
-    
-    # Check if all fields are 'N/A'
-    if all(value == 'N/A' for value in data.values()):
-        return {
-            "name": "N/A",
-            "profile_id": "N/A",
-            "bio": "Insufficient data provided to generate a biography.",
-            "input_tokens": 0,
-            "output_tokens": 0,
-            "input_cost": 0,
-            "output_cost": 0,
-            "total_cost": 0,
-            "time_taken": 0
-        }
-
-    prompt = f"""
-You are an AI assistant tasked with generating professional biographies for
+# Shared by the single-profile and packed prompts (f-strings so the {"..."} placeholders render as before)
+BIO_INSTRUCTIONS = f"""You are an AI assistant tasked with generating professional biographies for
 contacts in a specific format. Your task is to create a concise, informative biography for each contact using the following guidelines:
 
 1. Start with the contact's full name.
@@ -73,16 +93,41 @@ contacts in a specific format. Your task is to create a concise, informative bio
 
 The biography should be detailed and informative, highlighting the most relevant information about the person's current role, based in location, current responsibilities,
 previous experience (if available . Ignore if not available),
-and education. The bio must be at least {min_length} characters long.
+and education."""
 
-For ex:
+BIO_EXAMPLES = f"""For ex:
 For persons with current position available:
 {"Name"} is {"person's current position at current company"}, based in {"current location"}. He is responsible for {"current role's responsibilities"} .
 Prior to his current role, {"Name"} served as {"Previous Role"} at {"Previous Company"}.
 {"Name"} holds a {"Education Degree"} from {"College/Institution"}.
 For persons with current position not available:
 {"Name"} was {"person's most recent position at the most recent company"}, based in {"current location"}. He was responsible for {"most recent role's responsibilities"} .
-{"Name"} holds a {"Education Degree"} from {"College/Institution"}.
+{"Name"} holds a {"Education Degree"} from {"College/Institution"}."""
+
+def request_args(route, prompt, temperature):
+    # Messages API arguments shared by the thread and async engines
+    return {"model": route.model, "max_tokens": route.max_tokens, "temperature": temperature,
+            "messages": [{"role": "user", "content": prompt}]}
+
+def insufficient_data_bio():
+    return {
+        "name": "N/A",
+        "profile_id": "N/A",
+        "bio": "Insufficient data provided to generate a biography.",
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "input_cost": 0,
+        "output_cost": 0,
+        "total_cost": 0,
+        "time_taken": 0,
+        "model": None
+    }
+
+def bio_prompt(data, min_length, attempt):
+    return f"""
+{BIO_INSTRUCTIONS} The bio must be at least {min_length} characters long.
+
+{BIO_EXAMPLES}
 
 Name: {data.get('FULL_NAME', 'N/A')}
 Location: {data.get('LOCATION', 'N/A')}
@@ -109,41 +154,173 @@ Return the bio as a JSON string with the following structure:
 Please return ONLY the JSON string as described above, with no additional text before or after.
 """
 
+def parse_json_response(text):
+    # Malformed JSON is a validation failure, so the router retries it on a larger model
     try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValidationError(f"Response is not valid JSON: {e}") from e
+
+def read_bio_response(message, route, time_taken):
+    # Token counts, cost and time_taken are recorded in the shared metrics registry as well
+    usage = record_api_usage(PIPELINE, route.model, message.usage, time_taken)
+    check_truncated(message)
+
+    with time_stage(PIPELINE, "parse"):
+        json_match = parse_json_response(message.content[0].text)
+    if not isinstance(json_match, dict) or not json_match.get("bio"):
+        raise ValidationError("Response has no bio")
+    json_match.update(usage, model=route.model)
+    return json_match
+
+def generate_bio(data, min_length, attempt=1):
+    log_message(f"Generating bio for data: {data} (Attempt: {attempt}, Min Length: {min_length})")
+    
+    # Check if all fields are 'N/A'
+    if all(value == 'N/A' for value in data.values()):
+        return insufficient_data_bio()
+
+    prompt = bio_prompt(data, min_length, attempt)
+
+    def request_bio(route):
         start_time = time.time()
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=4000,
-            temperature=0.7,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        end_time = time.time()
-        
-        json_match = json.loads(message.content[0].text)
-        
-        input_tokens = message.usage.input_tokens
-        output_tokens = message.usage.output_tokens
-        input_cost = input_tokens * 0.25 / 1000000  # $0.25 per million tokens
-        output_cost = output_tokens * 1.25 / 1000000  # $1.25 per million tokens
-        total_cost = input_cost + output_cost
-        time_taken = end_time - start_time
-        
-        json_match["input_tokens"] = input_tokens
-        json_match["output_tokens"] = output_tokens
-        json_match["input_cost"] = input_cost
-        json_match["output_cost"] = output_cost
-        json_match["total_cost"] = total_cost
-        json_match["time_taken"] = time_taken
-        
-        return json_match
+        # Streamed (with --stream) until the JSON object closes
+        message = create_message(get_client(), JsonObjectMonitor(), pipeline=PIPELINE,
+                                 **request_args(route, prompt, 0.7))
+        return read_bio_response(message, route, time.time() - start_time)
+
+    description = f"bio for {data.get('FULL_NAME', 'Unknown')}"
+    try:
+        return model_router.complete(
+            "generate_bio", prompt,
+            lambda route: retry_policy.call(request_bio, route, stage="generate", description=description),
+            expected_output_tokens=min_length // CHARS_PER_TOKEN, description=description)
     except Exception as e:
+        record_error(PIPELINE, "generate")
         log_message(f"Error generating bio for {data.get('FULL_NAME', 'Unknown')}: {str(e)}")
         return None
 
-def evaluate_bio(name, bio):
-    prompt = f"""
+def profile_section(data, min_length):
+    return f"""Profile ID: {data.get('PROFILE_ID', 'N/A')}
+Minimum Length: {min_length} characters
+Name: {data.get('FULL_NAME', 'N/A')}
+Location: {data.get('LOCATION', 'N/A')}
+Current Company: {data.get('COMPANY_NAME', 'N/A')}
+Current Position: {data.get('CURRENT_POSITION', 'N/A')}
+Previous Company: {data.get('COMPANY_NAME_PREV', 'N/A')}
+Previous Position: {data.get('PREVIOUS_POSITION', 'N/A')}
+Degree: {data.get('DEGREE', 'N/A')}
+Institution: {data.get('INSTITUTION_NAME', 'N/A')}
+Social URL: {data.get('SOCIAL_URL', 'N/A')}"""
+
+def split_batch_usage(usage, input_weights, output_weights):
+    # Per-profile share of one packed call: input by prompt share, output and time by bio length
+    def shares(weights):
+        total = sum(weights)
+        if total <= 0:
+            return [1 / len(weights)] * len(weights)
+        return [weight / total for weight in weights]
+
+    input_shares = shares(input_weights)
+    output_shares = shares(output_weights)
+    split = []
+    for input_share, output_share in zip(input_shares, output_shares):
+        input_cost = usage["input_cost"] * input_share
+        output_cost = usage["output_cost"] * output_share
+        split.append({
+            "input_tokens": round(usage["input_tokens"] * input_share),
+            "output_tokens": round(usage["output_tokens"] * output_share),
+            "input_cost": input_cost,
+            "output_cost": output_cost,
+            "total_cost": input_cost + output_cost,
+            "time_taken": usage["time_taken"] * output_share,
+        })
+    return split
+
+def packed_prompt(profiles, sections):
+    profile_text = "\n\n".join(sections)
+    return f"""
+{BIO_INSTRUCTIONS} Each bio must be at least the Minimum Length given for its profile.
+
+{BIO_EXAMPLES}
+
+Write a separate bio for each of the following {len(profiles)} profiles, using only that profile's information.
+
+{profile_text}
+
+Return the bios as a JSON array with one object per profile, in the same order, with the following structure:
+[
+  {{
+    "profile_id": "PROFILE_ID",
+    "name": "FULL_NAME",
+    "bio": "GENERATED_BIO"
+  }}
+]
+
+Please return ONLY the JSON array as described above, with no additional text before or after.
+"""
+
+def packed_output_tokens(profiles):
+    return sum(min_length // CHARS_PER_TOKEN + PACKED_ENTRY_OVERHEAD_TOKENS for _, min_length in profiles)
+
+def read_packed_response(message, route, time_taken):
+    usage = record_api_usage(PIPELINE, route.model, message.usage, time_taken)
+    check_truncated(message)
+
+    with time_stage(PIPELINE, "parse"):
+        entries = parse_json_response(message.content[0].text)
+    if not isinstance(entries, list):
+        raise ValidationError("Response is not a JSON array")
+    return entries, usage, route.model
+
+def split_packed_bios(profiles, profile_ids, sections, prompt, entries, usage, model):
+    # {profile_id: bio_data} for the profiles the response covered, each charged its share of the call
+    by_id = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get("bio") and str(entry.get("profile_id")) in profile_ids:
+            by_id.setdefault(str(entry["profile_id"]), entry)
+
+    # Shared instructions are split evenly; each profile's own section is charged to it
+    shared_tokens = max(estimate_tokens(prompt) - sum(estimate_tokens(section) for section in sections), 0)
+    input_weights = [shared_tokens / len(profiles) + estimate_tokens(section) for section in sections]
+    output_weights = [len(by_id[profile_id]["bio"]) if profile_id in by_id else 0 for profile_id in profile_ids]
+    results = {}
+    for profile_id, (data, _), share in zip(profile_ids, profiles,
+                                            split_batch_usage(usage, input_weights, output_weights)):
+        if profile_id in by_id:
+            entry = by_id[profile_id]
+            results[profile_id] = dict(share, name=entry.get("name") or data.get('FULL_NAME', 'N/A'),
+                                       profile_id=entry["profile_id"], bio=entry["bio"], model=model)
+    return results
+
+def generate_bios_batch(profiles):
+    """Generates bios for several (data, min_length) profiles in one request.
+
+    Returns {profile_id: bio_data} for the profiles the response covered with a non-empty bio; the
+    caller retries the rest on their own. Token counts, cost and time of the call are split across
+    the returned profiles. Raises TruncatedResponse when even the largest output cap was not enough,
+    so the caller can split the batch.
+    """
+    profile_ids = [str(data.get('PROFILE_ID', 'N/A')) for data, _ in profiles]
+    log_message(f"Generating packed bios for profiles: {profile_ids}")
+    sections = [profile_section(data, min_length) for data, min_length in profiles]
+    prompt = packed_prompt(profiles, sections)
+
+    def request_bios(route):
+        start_time = time.time()
+        message = create_message(get_client(), JsonObjectMonitor(opening="["), pipeline=PIPELINE,
+                                 **request_args(route, prompt, 0.7))
+        return read_packed_response(message, route, time.time() - start_time)
+
+    description = f"packed bios for {len(profiles)} profiles"
+    entries, usage, model = model_router.complete(
+        "generate_bio_batch", prompt,
+        lambda route: retry_policy.call(request_bios, route, stage="generate", description=description),
+        expected_output_tokens=packed_output_tokens(profiles), description=description)
+    return split_packed_bios(profiles, profile_ids, sections, prompt, entries, usage, model)
+
+def evaluation_prompt(name, bio):
+    return f"""
 Please evaluate the following bio for {name} on a scale of 1-10 for quality and accuracy, where 1 is very poor and 10 is excellent. Provide a brief explanation for your rating.
 
 Bio: {bio}
@@ -158,40 +335,105 @@ Return your evaluation as a JSON string with the following structure:
 Please return ONLY the JSON string as described above, with no additional text before or after.
 """
 
-    try:
+def read_evaluation_response(message, route, time_taken):
+    usage = record_api_usage(PIPELINE, route.model, message.usage, time_taken)
+    check_truncated(message)
+
+    with time_stage(PIPELINE, "parse"):
+        json_match = parse_json_response(message.content[0].text)
+    if not isinstance(json_match, dict) or "rating" not in json_match or "explanation" not in json_match:
+        raise ValidationError("Response has no rating or explanation")
+    json_match.update(usage, model=route.model)
+    return json_match
+
+def evaluate_bio(name, bio):
+    prompt = evaluation_prompt(name, bio)
+
+    def request_evaluation(route):
         start_time = time.time()
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=4000,
-            temperature=0,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        end_time = time.time()
-        
-        json_match = json.loads(message.content[0].text)
-        
-        input_tokens = message.usage.input_tokens
-        output_tokens = message.usage.output_tokens
-        input_cost = input_tokens * 0.25 / 1000000  # $0.25 per million tokens
-        output_cost = output_tokens * 1.25 / 1000000  # $1.25 per million tokens
-        total_cost = input_cost + output_cost
-        time_taken = end_time - start_time
-        
-        json_match["input_tokens"] = input_tokens
-        json_match["output_tokens"] = output_tokens
-        json_match["input_cost"] = input_cost
-        json_match["output_cost"] = output_cost
-        json_match["total_cost"] = total_cost
-        json_match["time_taken"] = time_taken
-        
-        return json_match
+        message = create_message(get_client(), JsonObjectMonitor(), pipeline=PIPELINE,
+                                 **request_args(route, prompt, 0))
+        return read_evaluation_response(message, route, time.time() - start_time)
+
+    description = f"evaluation of bio for {name}"
+    try:
+        return model_router.complete(
+            "evaluate_bio", prompt,
+            lambda route: retry_policy.call(request_evaluation, route, stage="evaluate", description=description),
+            description=description)
     except Exception as e:
+        record_error(PIPELINE, "evaluate")
         log_message(f"Error evaluating bio for {name}: {str(e)}")
         return None
 
+def _known(data, key):
+    value = data.get(key, 'N/A')
+    if not isinstance(value, str):
+        return '' if value is None or value != value else str(value)
+    return '' if value.strip() in ('', 'N/A') else value.strip()
+
+def information_content(data):
+    return sum(1 for key in DETAIL_FIELDS if _known(data, key))
+
+def render_template_bio(data):
+    """Renders the bio format from BIO_EXAMPLES from the profile's known fields, without a model.
+
+    Deterministic: the same profile always renders the same text.
+    """
+    name = _known(data, 'FULL_NAME')
+    position, company = _known(data, 'CURRENT_POSITION'), _known(data, 'COMPANY_NAME')
+    previous_position, previous_company = _known(data, 'PREVIOUS_POSITION'), _known(data, 'COMPANY_NAME_PREV')
+    location = _known(data, 'LOCATION')
+    degree, institution = _known(data, 'DEGREE'), _known(data, 'INSTITUTION_NAME')
+    based_in = f", based in {location}" if location else ""
+
+    sentences = []
+    if position or company:
+        role = f"{position} at {company}" if position and company else position or f"with {company}"
+        sentences.append(f"{name} is {role}{based_in}.")
+        if previous_position:
+            prior = f"{previous_position} at {previous_company}" if previous_company else previous_position
+            sentences.append(f"Prior to the current role, {name} served as {prior}.")
+        elif previous_company:
+            sentences.append(f"Prior to the current role, {name} worked at {previous_company}.")
+    elif previous_position or previous_company:
+        role = (f"{previous_position} at {previous_company}" if previous_position and previous_company
+                else previous_position or f"with {previous_company}")
+        sentences.append(f"{name} was {role}{based_in}.")
+    elif location:
+        sentences.append(f"{name} is based in {location}.")
+
+    if degree:
+        # Abbreviations (MBA, MSc) take the article of their first letter's name
+        first_word = degree.split()[0]
+        abbreviation = first_word.isupper() or len(first_word) <= 4
+        article = "an" if degree[0].lower() in "aeiou" or (abbreviation and degree[0] in "FHLMNRSX") else "a"
+        sentences.append(f"{name} holds {article} {degree}" + (f" from {institution}." if institution else "."))
+    elif institution:
+        sentences.append(f"{name} studied at {institution}.")
+
+    return " ".join(sentences) or "Insufficient data provided to generate a biography."
+
+def use_template(data, threshold):
+    # Needs a name to render; nameless profiles keep going through generate_bio, as do profiles with an
+    # existing biography longer than MIN_BIO_LENGTH, since the new bio is expected to match its length
+    return (threshold > 0 and bool(_known(data, 'FULL_NAME')) and information_content(data) < threshold
+            and required_bio_length(data) <= MIN_BIO_LENGTH)
+
+def render_profile(row):
+    """Template counterpart of process_profile: a result row with no API calls and no evaluation."""
+    with time_stage(PIPELINE, "template"):
+        no_usage = {"input_tokens": 0, "output_tokens": 0, "input_cost": 0, "output_cost": 0, "total_cost": 0,
+                    "time_taken": 0, "model": None}
+        bio_data = dict(no_usage, name=row.get('FULL_NAME', 'N/A'), profile_id=row.get('PROFILE_ID', 'N/A'),
+                        bio=render_template_bio(row))
+        evaluation = dict(no_usage, rating=None, explanation="Rendered from a template; not evaluated")
+        return build_profile_result(bio_data, evaluation, len(row.get('PERSON_BIOGRAPHY', '')), 0, batch_size=0,
+                                    generation_method="template")
+
 def validate_row(row):
+    import pandas as pd
+
     required_keys = ['LOCATION', 'FULL_NAME', 'COMPANY_NAME', 'CURRENT_POSITION', 'PROFILE_ID', 'PERSON_BIOGRAPHY']
     for key in required_keys:
         if key not in row.index or pd.isna(row[key]) or row[key] == '':
@@ -203,55 +445,75 @@ def validate_row(row):
     
     return row
 
-def process_profile(row):
+def required_bio_length(row):
+    return max(len(row.get('PERSON_BIOGRAPHY', '')), MIN_BIO_LENGTH)
+
+def build_profile_result(bio_data, evaluation, person_bio_length, attempt, batch_size=1, generation_method="llm"):
+    return {
+        'name': bio_data['name'],
+        'profile_id': bio_data['profile_id'],
+        'bio': bio_data['bio'],
+        'rating': evaluation['rating'],
+        'explanation': evaluation['explanation'],
+        'bio_input_tokens': bio_data['input_tokens'],
+        'bio_output_tokens': bio_data['output_tokens'],
+        'bio_input_cost': bio_data['input_cost'],
+        'bio_output_cost': bio_data['output_cost'],
+        'bio_total_cost': bio_data['total_cost'],
+        'bio_time_taken': bio_data['time_taken'],
+        'bio_model': bio_data['model'],
+        'bio_batch_size': batch_size,
+        'eval_input_tokens': evaluation['input_tokens'],
+        'eval_output_tokens': evaluation['output_tokens'],
+        'eval_input_cost': evaluation['input_cost'],
+        'eval_output_cost': evaluation['output_cost'],
+        'eval_total_cost': evaluation['total_cost'],
+        'eval_time_taken': evaluation['time_taken'],
+        'eval_model': evaluation['model'],
+        'total_cost': bio_data['total_cost'] + evaluation['total_cost'],
+        'total_time_taken': bio_data['time_taken'] + evaluation['time_taken'],
+        'person_biography_length': person_bio_length,
+        'ai_generated_biography_length': len(bio_data['bio']),
+        'generation_attempts': attempt,
+        'generation_method': generation_method,
+        # False only for template bios, which are not held to the length of generated ones
+        'length_ok': len(bio_data['bio']) >= max(person_bio_length, MIN_BIO_LENGTH)
+    }
+
+def profile_steps(row):
+    """The generate/check length/evaluate loop of one profile, shared by the thread and async engines.
+
+    A generator: it yields ("generate", data, min_length, attempt) and ("evaluate", name, bio) requests,
+    is sent each result (or has its exception thrown in) by run_steps or arun_steps, and returns the
+    result row, or None when no suitable bio came back.
+    """
     try:
         log_message(f"Processing profile: {row.get('FULL_NAME', 'Unknown')}")
         log_message(f"Profile data: {row}")
         
         person_bio_length = len(row.get('PERSON_BIOGRAPHY', ''))
-        min_length = max(person_bio_length, 200)  # Ensure a minimum length of 200 characters
+        min_length = required_bio_length(row)
         attempt = 1
         max_attempts = 5  # Maximum number of attempts to generate a longer bio
         
         while attempt <= max_attempts:
-            bio_data = generate_bio(row, min_length, attempt)
-            if bio_data:
-                ai_bio_length = len(bio_data['bio'])
-                if ai_bio_length >= min_length:
-                    evaluation = evaluate_bio(bio_data['name'], bio_data['bio'])
-                    if evaluation:
-                        return {
-                            'name': bio_data['name'],
-                            'profile_id': bio_data['profile_id'],
-                            'bio': bio_data['bio'],
-                            'rating': evaluation['rating'],
-                            'explanation': evaluation['explanation'],
-                            'bio_input_tokens': bio_data['input_tokens'],
-                            'bio_output_tokens': bio_data['output_tokens'],
-                            'bio_input_cost': bio_data['input_cost'],
-                            'bio_output_cost': bio_data['output_cost'],
-                            'bio_total_cost': bio_data['total_cost'],
-                            'bio_time_taken': bio_data['time_taken'],
-                            'eval_input_tokens': evaluation['input_tokens'],
-                            'eval_output_tokens': evaluation['output_tokens'],
-                            'eval_input_cost': evaluation['input_cost'],
-                            'eval_output_cost': evaluation['output_cost'],
-                            'eval_total_cost': evaluation['total_cost'],
-                            'eval_time_taken': evaluation['time_taken'],
-                            'total_cost': bio_data['total_cost'] + evaluation['total_cost'],
-                            'total_time_taken': bio_data['time_taken'] + evaluation['time_taken'],
-                            'person_biography_length': person_bio_length,
-                            'ai_generated_biography_length': ai_bio_length,
-                            'generation_attempts': attempt
-                        }
-                else:
-                    log_message(f"AI-generated bio ({ai_bio_length} chars) is shorter than required length ({min_length} chars). Attempting again.")
-                    attempt += 1
-                    min_length = int(min_length * 1.2)  # Increase the required length by 20% for the next attempt
-            else:
+            bio_data = yield ("generate", row, min_length, attempt)
+            if not bio_data:
                 break
+            ai_bio_length = len(bio_data['bio'])
+            if ai_bio_length < min_length:
+                log_message(f"AI-generated bio ({ai_bio_length} chars) is shorter than required length ({min_length} chars). Attempting again.")
+                attempt += 1
+                min_length = int(min_length * 1.2)  # Increase the required length by 20% for the next attempt
+                continue
+            evaluation = yield ("evaluate", bio_data['name'], bio_data['bio'])
+            if evaluation:
+                return build_profile_result(bio_data, evaluation, person_bio_length, attempt)
+            # The evaluation already had its own retries; a new bio would not get it through
+            log_message(f"Evaluation failed for {row.get('FULL_NAME', 'Unknown')}; not regenerating the bio.")
+            break
         
-        log_message(f"Failed to generate a suitable bio for {row.get('FULL_NAME', 'Unknown')} after {max_attempts} attempts.")
+        log_message(f"Failed to generate a suitable bio for {row.get('FULL_NAME', 'Unknown')} after {attempt} attempts.")
         return None
     except KeyError as e:
         log_message(f"Missing data for profile {row.get('FULL_NAME', 'Unknown')}: {str(e)}")
@@ -259,77 +521,426 @@ def process_profile(row):
         log_message(f"Error processing profile {row.get('FULL_NAME', 'Unknown')}: {str(e)}")
     return None
 
-def process_csv(csv_file, max_rows=None):
-    # Delete existing output file if it exists
-    if os.path.exists(excel_filename):
-        os.remove(excel_filename)
-        log_message(f"Deleted existing output file: {excel_filename}")
+def profile_batch_steps(rows):
+    """Packed-mode counterpart of profile_steps: returns a list of results for the rows.
 
-    # Check CSV contents
-    check_csv_contents(csv_file)
+    Also yields ("generate_batch", profiles), ("profile", row) and ("batch", rows) requests. A truncated
+    batch is split in half and each half retried; profiles missing from the response, or whose bio is
+    too short, are retried one by one as single profiles.
+    """
+    if len(rows) == 1:
+        result = yield ("profile", rows[0])
+        return [result] if result else []
 
     try:
-        # Try reading with comma delimiter
-        df = pd.read_csv(csv_file, encoding='utf-8')
-        log_message(f"CSV file read successfully with comma delimiter. Shape: {df.shape}")
-        log_message(f"Columns: {df.columns.tolist()}")
-        log_message(f"First row of data: {df.iloc[0].to_dict()}")
+        bios = yield ("generate_batch", [(row, required_bio_length(row)) for row in rows])
+    except TruncatedResponse as e:
+        middle = len(rows) // 2
+        log_message(f"Packed request for {len(rows)} profiles was truncated ({e}); splitting into {middle} and {len(rows) - middle}")
+        first = yield ("batch", rows[:middle])
+        return first + (yield ("batch", rows[middle:]))
+    except Exception as e:
+        record_error(PIPELINE, "generate")
+        log_message(f"Error generating packed bios for {len(rows)} profiles: {str(e)}")
+        bios = {}
+
+    results = []
+    failed = []
+    for row in rows:
+        bio_data = bios.get(str(row.get('PROFILE_ID', 'N/A')))
+        if bio_data is None or len(bio_data['bio']) < required_bio_length(row):
+            failed.append(row)
+            continue
+        evaluation = yield ("evaluate", bio_data['name'], bio_data['bio'])
+        if evaluation:
+            results.append(build_profile_result(bio_data, evaluation, len(row.get('PERSON_BIOGRAPHY', '')),
+                                                1, batch_size=len(rows)))
+        else:
+            failed.append(row)
+
+    if failed:
+        log_message(f"Retrying {len(failed)} of {len(rows)} packed profiles individually: "
+                    f"{[row.get('PROFILE_ID', 'N/A') for row in failed]}")
+        for row in failed:
+            result = yield ("profile", row)
+            if result:
+                results.append(result)
+    return results
+
+def run_steps(steps, handlers):
+    # Drives a profile_steps / profile_batch_steps generator, calling handlers[kind](*args) for each request
+    result = error = None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        try:
+            result = handlers[step[0]](*step[1:])
+        except Exception as e:
+            error = e
+
+def thread_handlers():
+    return {"generate": generate_bio, "evaluate": evaluate_bio, "generate_batch": generate_bios_batch,
+            "profile": process_profile, "batch": process_profile_batch}
+
+def process_profile(row):
+    return run_steps(profile_steps(row), thread_handlers())
+
+def process_profile_batch(rows):
+    return run_steps(profile_batch_steps(rows), thread_handlers())
+
+def plan_bio_batches(rows, batch_size):
+    """Groups profile dicts into packed requests of up to batch_size profiles, yielding each batch.
+
+    Profiles with a missing or repeated PROFILE_ID, no data at all, or a bio too long to share an
+    output budget go alone, as does anything that would push a batch past PACKED_OUTPUT_BUDGET.
+    rows is consumed lazily.
+    """
+    current = []
+    current_tokens = 0
+    seen_ids = set()
+    for row in rows:
+        profile_id = str(row.get('PROFILE_ID', 'N/A'))
+        tokens = required_bio_length(row) // CHARS_PER_TOKEN + PACKED_ENTRY_OVERHEAD_TOKENS
+        if (batch_size <= 1 or profile_id == 'N/A' or profile_id in seen_ids or tokens > MAX_PACKED_PROFILE_TOKENS
+                or all(value == 'N/A' for value in row.values())):
+            yield [row]
+            continue
+        seen_ids.add(profile_id)
+        if current and (len(current) >= batch_size or current_tokens + tokens > PACKED_OUTPUT_BUDGET):
+            yield current
+            current, current_tokens = [], 0
+        current.append(row)
+        current_tokens += tokens
+    if current:
+        yield current
+
+def profile_tasks(df, batch_size, template_threshold, results):
+    """Validates the profile rows in df (a DataFrame or an iterable of chunks) as they are read and groups
+    them into tasks, lists of rows for process_profile_batch. Sparse profiles are rendered from the
+    template into results instead.
+    """
+    import pandas as pd
+
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+
+    def model_rows():
+        for chunk in chunks:
+            for _, row in chunk.iterrows():
+                row = validate_row(row).to_dict()
+                if use_template(row, template_threshold):
+                    results.append(render_profile(row))
+                else:
+                    yield row
+
+    rows = model_rows()
+    if batch_size > 1:
+        log_message(f"Packing profiles into requests of up to {batch_size}")
+        return plan_bio_batches(rows, batch_size)
+    return ([row] for row in rows)
+
+def log_templated(results):
+    templated = sum(1 for result in results if result['generation_method'] == "template")
+    if templated:
+        log_message(f"Rendered {templated} sparse profiles from the template without API calls")
+
+def generate_bios(df, batch_size=1, executor=None, window=None, template_threshold=TEMPLATE_THRESHOLD):
+    """Validates the profile rows in df and returns a DataFrame of generated and evaluated bios.
+
+    df may also be an iterable of DataFrame chunks; rows are validated and submitted as the pool
+    frees up, with at most `window` profiles (or packed batches) in flight. Profiles with fewer than
+    template_threshold detail fields are rendered from the template on this thread instead.
+    executor: thread pool to run the profiles on (pipeline.py shares one across stages); by default
+    one with a thread per CPU is created for this call. With --engine async the profiles run on an
+    event loop instead (see generate_bios_async) and executor is not used.
+    """
+    import pandas as pd
+
+    if async_engine.ENABLED:
+        return async_engine.run(lambda engine: generate_bios_async(engine, df, batch_size, template_threshold))
+
+    results = []
+
+    max_workers = multiprocessing.cpu_count()
+    window = window or WINDOW_PER_WORKER * max_workers
+    own_executor = executor is None
+    if own_executor:
+        # Use all available CPU cores
+        log_message(f"Using {max_workers} workers")
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    submitted = finished = 0
+
+    def counted(tasks):
+        nonlocal submitted
+        for batch in tasks:
+            submitted += len(batch)
+            yield batch
+
+    try:
+        tasks = profile_tasks(df, batch_size, template_threshold, results)
+        for batch, future in submit_windowed(executor, process_profile_batch, counted(tasks), window):
+            results.extend(future.result())
+            finished += len(batch)
+            # Profiles submitted and not yet finished
+            set_queue_depth(PIPELINE, "profiles", submitted - finished)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    log_templated(results)
+    return pd.DataFrame(results)
+
+# Async engine (--engine async): the same requests as generate_bio and evaluate_bio, awaiting
+# engine.create_message instead of blocking a thread per request; profile_steps and profile_batch_steps
+# drive both engines
+
+async def agenerate_bio(engine, data, min_length, attempt=1):
+    log_message(f"Generating bio for data: {data} (Attempt: {attempt}, Min Length: {min_length})")
+    if all(value == 'N/A' for value in data.values()):
+        return insufficient_data_bio()
+
+    prompt = bio_prompt(data, min_length, attempt)
+
+    async def request_bio(route):
+        start_time = time.time()
+        message = await engine.create_message(JsonObjectMonitor(), pipeline=PIPELINE, **request_args(route, prompt, 0.7))
+        return read_bio_response(message, route, time.time() - start_time)
+
+    description = f"bio for {data.get('FULL_NAME', 'Unknown')}"
+    try:
+        return await model_router.acomplete(
+            "generate_bio", prompt,
+            lambda route: retry_policy.acall(request_bio, route, stage="generate", description=description),
+            expected_output_tokens=min_length // CHARS_PER_TOKEN, description=description)
+    except Exception as e:
+        record_error(PIPELINE, "generate")
+        log_message(f"Error generating bio for {data.get('FULL_NAME', 'Unknown')}: {str(e)}")
+        return None
+
+async def agenerate_bios_batch(engine, profiles):
+    profile_ids = [str(data.get('PROFILE_ID', 'N/A')) for data, _ in profiles]
+    log_message(f"Generating packed bios for profiles: {profile_ids}")
+    sections = [profile_section(data, min_length) for data, min_length in profiles]
+    prompt = packed_prompt(profiles, sections)
+
+    async def request_bios(route):
+        start_time = time.time()
+        message = await engine.create_message(JsonObjectMonitor(opening="["), pipeline=PIPELINE,
+                                              **request_args(route, prompt, 0.7))
+        return read_packed_response(message, route, time.time() - start_time)
+
+    description = f"packed bios for {len(profiles)} profiles"
+    entries, usage, model = await model_router.acomplete(
+        "generate_bio_batch", prompt,
+        lambda route: retry_policy.acall(request_bios, route, stage="generate", description=description),
+        expected_output_tokens=packed_output_tokens(profiles), description=description)
+    return split_packed_bios(profiles, profile_ids, sections, prompt, entries, usage, model)
+
+async def aevaluate_bio(engine, name, bio):
+    prompt = evaluation_prompt(name, bio)
+
+    async def request_evaluation(route):
+        start_time = time.time()
+        message = await engine.create_message(JsonObjectMonitor(), pipeline=PIPELINE, **request_args(route, prompt, 0))
+        return read_evaluation_response(message, route, time.time() - start_time)
+
+    description = f"evaluation of bio for {name}"
+    try:
+        return await model_router.acomplete(
+            "evaluate_bio", prompt,
+            lambda route: retry_policy.acall(request_evaluation, route, stage="evaluate", description=description),
+            description=description)
+    except Exception as e:
+        record_error(PIPELINE, "evaluate")
+        log_message(f"Error evaluating bio for {name}: {str(e)}")
+        return None
+
+async def arun_steps(steps, handlers):
+    # run_steps for handlers that return coroutines
+    result = error = None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        try:
+            result = await handlers[step[0]](*step[1:])
+        except Exception as e:
+            error = e
+
+def engine_handlers(engine):
+    return {"generate": functools.partial(agenerate_bio, engine), "evaluate": functools.partial(aevaluate_bio, engine),
+            "generate_batch": functools.partial(agenerate_bios_batch, engine),
+            "profile": functools.partial(aprocess_profile, engine),
+            "batch": functools.partial(aprocess_profile_batch, engine)}
+
+async def aprocess_profile(engine, row):
+    return await arun_steps(profile_steps(row), engine_handlers(engine))
+
+async def aprocess_profile_batch(engine, rows):
+    return await arun_steps(profile_batch_steps(rows), engine_handlers(engine))
+
+async def generate_bios_async(engine, df, batch_size=1, template_threshold=TEMPLATE_THRESHOLD):
+    """generate_bios on the event loop: up to engine.concurrency profiles (or packed batches) in flight.
+
+    Reading, validating and templating the input rows and building the DataFrame run on worker threads.
+    """
+    import pandas as pd
+
+    log_message(f"Using the async engine with {engine.concurrency} requests in flight")
+    results = []
+    submitted = finished = 0
+
+    def counted(tasks):
+        nonlocal submitted
+        for batch in tasks:
+            submitted += len(batch)
+            yield batch
+
+    tasks = profile_tasks(df, batch_size, template_threshold, results)
+    async for batch, task in async_engine.map_bounded(lambda batch: aprocess_profile_batch(engine, batch),
+                                                      counted(tasks), engine.concurrency):
+        results.extend(task.result())
+        finished += len(batch)
+        set_queue_depth(PIPELINE, "profiles", submitted - finished)
+
+    log_templated(results)
+    return await async_engine.to_thread(pd.DataFrame, results)
+
+def read_profiles(csv_file, max_rows=None):
+    """Opens csv_file and returns an iterator of its DataFrame chunks, or None when it cannot be read."""
+    import pandas as pd
+
+    required_columns = ['PROFILE_ID', 'FULL_NAME', 'LOCATION', 'COMPANY_NAME', 'CURRENT_POSITION', 'PERSON_BIOGRAPHY']
+    try:
+        # Try reading with comma delimiter; the file is streamed in chunks rather than loaded whole
+        reader = pd.read_csv(csv_file, encoding='utf-8', chunksize=CSV_CHUNK_ROWS, nrows=max_rows or None)
+        first_chunk = next(reader)
+        log_message(f"CSV file opened successfully with comma delimiter. Reading {CSV_CHUNK_ROWS} rows at a time")
+        log_message(f"Columns: {first_chunk.columns.tolist()}")
+        log_message(f"First row of data: {first_chunk.iloc[0].to_dict()}")
         
         # Check for missing columns
-        required_columns = ['PROFILE_ID', 'FULL_NAME', 'LOCATION', 'COMPANY_NAME', 'CURRENT_POSITION', 'PERSON_BIOGRAPHY']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in first_chunk.columns]
         if missing_columns:
             log_message(f"Warning: The following required columns are missing: {missing_columns}")
         
-        # Check for empty or all-NA rows
-        empty_rows = df[required_columns].isna().all(axis=1)
-        if empty_rows.any():
-            log_message(f"Warning: {empty_rows.sum()} rows have all NA values in required columns")
-        
     except Exception as e:
         log_message(f"Error reading CSV file with comma delimiter: {str(e)}")
-        return
-
-    if max_rows:
-        df = df.iloc[:max_rows]
+        return None
 
-    df = df.apply(validate_row, axis=1)
+    def checked_chunks():
+        for chunk in itertools.chain([first_chunk], reader):
+            # Check for empty or all-NA rows
+            empty_rows = chunk[[col for col in required_columns if col in chunk.columns]].isna().all(axis=1)
+            if empty_rows.any():
+                log_message(f"Warning: {empty_rows.sum()} rows have all NA values in required columns")
+            yield chunk
 
-    results = []
+    return checked_chunks()
 
-    # Use all available CPU cores
-    max_workers = multiprocessing.cpu_count()
-    log_message(f"Using {max_workers} workers")
+def process_csv(csv_file, max_rows=None, output_format="auto", excel=None, batch_size=1,
+                template_threshold=TEMPLATE_THRESHOLD):
+    # Check CSV contents
+    check_csv_contents(csv_file)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_row = {executor.submit(process_profile, row.to_dict()): row for _, row in df.iterrows()}
-        for future in as_completed(future_to_row):
-            row_result = future.result()
-            if row_result:
-                results.append(row_result)
+    chunks = read_profiles(csv_file, max_rows)
+    if chunks is None:
+        return
 
     # Create the output dataframe
-    output_df = pd.DataFrame(results)
-
-    # Save to Excel
-    with pd.ExcelWriter(excel_filename) as writer:
-        output_df.to_excel(writer, sheet_name='Bio Data', index=False)
-
-    log_message(f"\nProcessing complete. Results saved to {excel_filename}")
+    output_df = generate_bios(chunks, batch_size=batch_size, template_threshold=template_threshold)
+
+    with time_stage(PIPELINE, "write"):
+        written = write_results(output_df, output_filename, output_format=output_format, excel=excel,
+                                sheet_name='Bio Data', log=log_message)
+
+    log_message(f"\nProcessing complete. Results saved to {', '.join(written)}")
+
+def plan_bios(df, batch_size=1, template_threshold=TEMPLATE_THRESHOLD):
+    """Dry run of generate_bios: a planner.Plan of the requests it would send for df, without sending any.
+
+    Rows go through the same validation, templating and packing (profile_tasks). Each model-bound
+    profile is counted as one generation, alone or as its share of a packed request, and one evaluation;
+    regenerations of bios that come back too short, and packed profiles retried alone, are not predicted.
+    """
+    plan = Plan(PIPELINE)
+    templated = []
+    for rows in profile_tasks(df, batch_size, template_threshold, templated):
+        profiles = [(row, required_bio_length(row)) for row in rows]
+        if len(rows) == 1 and all(value == 'N/A' for value in rows[0].values()):
+            # generate_bio answers these without a request
+            plan.skip("insufficient data")
+            continue
+        if len(rows) == 1:
+            # As generate_bio routes it: the bio alone, without a packed entry's overhead
+            data, min_length = profiles[0]
+            prompt = bio_prompt(data, min_length, 1)
+            task = "generate_bio"
+            expected = min_length // CHARS_PER_TOKEN
+        else:
+            prompt = packed_prompt(profiles, [profile_section(data, min_length) for data, min_length in profiles])
+            task = "generate_bio_batch"
+            expected = packed_output_tokens(profiles)
+        plan.add(task, model_router.route(task, prompt, expected).model, count_tokens(prompt), expected)
+        for data, min_length in profiles:
+            # The bio under evaluation is about min_length characters
+            prompt = evaluation_prompt(data.get('FULL_NAME', 'N/A'), "")
+            plan.add("evaluate_bio", model_router.route("evaluate_bio", prompt).model,
+                     count_tokens(prompt) + min_length // CHARS_PER_TOKEN, EVALUATION_OUTPUT_TOKENS)
+        plan.items += len(rows)
+    if templated:
+        plan.skip("template bios", len(templated))
+        plan.items += len(templated)
+    return plan
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate and evaluate professional bios from CSV data")
     parser.add_argument("--max_rows", type=int, help="Maximum number of rows to process")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Profiles packed into one generation request (1 sends each profile on its own)")
+    parser.add_argument("--template_threshold", type=int, default=TEMPLATE_THRESHOLD,
+                        help="Render a template bio, with no API calls, for profiles with fewer detail fields than "
+                             "this (0: send every profile to the model)")
+    add_output_arguments(parser)
+    add_metrics_arguments(parser)
+    add_retry_arguments(parser)
+    add_routing_arguments(parser)
+    add_streaming_arguments(parser)
+    add_hedging_arguments(parser)
+    add_engine_arguments(parser)
+    add_plan_arguments(parser)
     args = parser.parse_args()
 
+    os.makedirs(results_dir, exist_ok=True)
     if not os.path.exists(csv_file):
         log_message(f"Error: CSV file not found at {csv_file}")
         exit(1)
 
+    configure_retries(args)
+    configure_routing(args, routers=[model_router])
+    configure_streaming(args)
+    configure_hedging(args)
+    configure_engine(args)
+    if args.plan:
+        chunks = read_profiles(csv_file, args.max_rows)
+        if chunks is not None:
+            plan = plan_bios(chunks, batch_size=args.batch_size, template_threshold=args.template_threshold)
+            concurrency = async_engine.concurrency if async_engine.ENABLED else multiprocessing.cpu_count()
+            plan.report(os.path.join(results_dir, "plan.json"), concurrency, log=log_message, **plan_options(args))
+        exit(0)
+    start_metrics(args, log=log_message)
     try:
         check_csv_contents(csv_file)
-        process_csv(csv_file, max_rows=args.max_rows)
+        process_csv(csv_file, max_rows=args.max_rows, output_format=args.output_format, excel=args.excel,
+                    batch_size=args.batch_size, template_threshold=args.template_threshold)
     except KeyboardInterrupt:
         log_message("Script interrupted by user. Progress has been saved.")
     except Exception as e:
         log_message(f"An error occurred: {str(e)}")
+    finally:
+        finish_metrics(args, log=log_message)
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# Query parameters that only track the click and never change the article
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "yclid", "_ga", "_gl", "ref", "ref_src",
+    "ref_url", "referrer", "cmpid", "ocid", "spm", "sr_share", "guccounter", "guce_referrer", "guce_referrer_sig",
+    "smid", "smtyp", "s_cid", "mkt_tok", "_hsenc", "_hsmi", "trk", "trkcampaign", "outputtype",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_")
+
+SIMHASH_BITS = 64
+BANDS = 8
+BAND_BITS = SIMHASH_BITS // BANDS
+
+# Extracted texts shorter than this are too generic (error pages, paywalls) to fingerprint
+MIN_FINGERPRINT_WORDS = 50
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def canonicalize_url(url):
+    parsed = urlparse(url.strip())
+    scheme = (parsed.scheme or "http").lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (parsed.hostname or "").lower().removeprefix("www.").removeprefix("m.")
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+
+    path = re.sub(r"/+", "/", parsed.path or "/")
+    # AMP copies of an article share its canonical URL
+    path = re.sub(r"/amp/?$", "/", path)
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunparse((scheme, host, path, "", urlencode(sorted(query)), ""))
+
+
+def _shingles(text, size=2):
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) < size:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+
+def simhash(text):
+    weights = [0] * SIMHASH_BITS
+    for shingle in _shingles(text):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class DedupIndex:
+    """Persistent map from canonical URL and SimHash fingerprint to a previous extraction.
+
+    Any two fingerprints within max_distance bits share at least one of the 8-bit bands
+    (pigeonhole, for max_distance < BANDS), so candidates are found with indexed band lookups.
+    Extractions are stored under version (the caller's prompt and schema); lookups only return
+    extractions of the same version, so changing the prompt invalidates the index.
+    """
+
+    def __init__(self, path, max_distance=6, version=""):
+        self.path = path
+        self.max_distance = max_distance
+        self.version = version
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                id INTEGER PRIMARY KEY,
+                task_id TEXT,
+                canonical_url TEXT,
+                fingerprint INTEGER,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                canonical_url TEXT PRIMARY KEY,
+                extraction_id INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                extraction_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, value);
+            CREATE TABLE IF NOT EXISTS task_map (
+                task_id TEXT NOT NULL,
+                extraction_id INTEGER NOT NULL,
+                match_type TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(extractions)")]
+        if "version" not in columns:
+            # Indexes written before extractions were versioned; their rows never match again
+            self.conn.execute("ALTER TABLE extractions ADD COLUMN version TEXT")
+        self.conn.commit()
+
+    def _load(self, extraction_id):
+        row = self.conn.execute("SELECT task_id, result FROM extractions WHERE id = ? AND version = ?",
+                                (extraction_id, self.version)).fetchone()
+        if row is None:
+            return None
+        return {"extraction_id": extraction_id, "task_id": row[0], "result": json.loads(row[1])}
+
+    def lookup_url(self, canonical_url):
+        with self.lock:
+            row = self.conn.execute("SELECT extraction_id FROM urls WHERE canonical_url = ?", (canonical_url,)).fetchone()
+            return self._load(row[0]) if row else None
+
+    def lookup_fingerprint(self, fingerprint):
+        with self.lock:
+            candidates = set()
+            for band, value in enumerate(_bands(fingerprint)):
+                rows = self.conn.execute("SELECT extraction_id FROM bands WHERE band = ? AND value = ?", (band, value))
+                candidates.update(row[0] for row in rows)
+            best = None
+            for extraction_id in candidates:
+                row = self.conn.execute("SELECT fingerprint FROM extractions WHERE id = ? AND version = ?",
+                                        (extraction_id, self.version)).fetchone()
+                if row is None:
+                    continue
+                distance = hamming_distance(fingerprint, _to_unsigned(row[0]))
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, extraction_id)
+            return self._load(best[1]) if best else None
+
+    def add(self, task_id, canonical_urls, fingerprint, result):
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO extractions (task_id, canonical_url, fingerprint, result, created_at, version) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(task_id), canonical_urls[0], _to_signed(fingerprint) if fingerprint is not None else None,
+                 json.dumps(result, default=str), time.time(), self.version),
+            )
+            extraction_id = cursor.lastrowid
+            # Replaces the mapping of a URL last extracted under an older version
+            for canonical_url in canonical_urls:
+                self.conn.execute("INSERT OR REPLACE INTO urls (canonical_url, extraction_id) VALUES (?, ?)",
+                                  (canonical_url, extraction_id))
+            if fingerprint is not None:
+                self.conn.executemany("INSERT INTO bands (band, value, extraction_id) VALUES (?, ?, ?)",
+                                      [(band, value, extraction_id) for band, value in enumerate(_bands(fingerprint))])
+            self.conn.execute("INSERT INTO task_map (task_id, extraction_id, match_type, created_at) VALUES (?, ?, ?, ?)",
+                              (str(task_id), extraction_id, "original", time.time()))
+            self.conn.commit()
+            return extraction_id
+
+    def add_urls(self, canonical_urls, extraction_id):
+        with self.lock:
+            for canonical_url in canonical_urls:
+                self.conn.execute("INSERT OR REPLACE INTO urls (canonical_url, extraction_id) VALUES (?, ?)",
+                                  (canonical_url, extraction_id))
+            self.conn.commit()
+
+    def map_task(self, task_id, extraction_id, match_type):
+        with self.lock:
+            self.conn.execute("INSERT INTO task_map (task_id, extraction_id, match_type, created_at) VALUES (?, ?, ?, ?)",
+                              (str(task_id), extraction_id, match_type, time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def fingerprint_text(text):
+    if len(_TOKEN.findall(text.lower())) < MIN_FINGERPRINT_WORDS:
+        return None
+    return simhash(text)
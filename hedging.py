@@ -0,0 +1,245 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from metrics import record_api_usage, record_hedge
+from retry_policy import RetryBudget
+
+# Per-call deadline: time to the first token plus max_tokens at a slow but healthy output rate
+DEADLINE_BASE_SECONDS = 30.0
+DEADLINE_TOKENS_PER_SECOND = 20.0
+
+# Hedge a call once it outlasts this percentile of recent calls of the same shape
+HEDGE_PERCENTILE = 95
+LATENCY_WINDOW = 200
+# With fewer samples the percentile is noise, so a call shape is not hedged until it has this many
+MIN_SAMPLES = 20
+DEFAULT_HEDGE_RATIO = 0.05
+
+# Multiplier on request_deadline(); 0 leaves calls without a deadline
+deadline_scale = 1.0
+
+
+def request_deadline(max_tokens):
+    """Seconds a call generating up to max_tokens may take before it is abandoned as hung."""
+    if not deadline_scale:
+        return None
+    return deadline_scale * (DEADLINE_BASE_SECONDS + (max_tokens or 0) / DEADLINE_TOKENS_PER_SECOND)
+
+
+class LatencyTracker:
+    """Rolling window of successful call durations per call shape."""
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = self.samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, pct):
+        # None until the shape has min_samples observations
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+class _WorkerPool:
+    """Daemon threads that run attempts and are reused: a thread is only started when every existing one is
+    busy, so the pool grows to the peak number of attempts in flight and no further.
+
+    Daemon threads, unlike concurrent.futures', so a non-streamed loser still running does not hold up exit.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.tasks = queue.Queue()
+        self.idle = 0
+        self.lock = threading.Lock()
+
+    def submit(self, fn):
+        with self.lock:
+            spawn = self.idle == 0
+            if not spawn:
+                self.idle -= 1
+        self.tasks.put(fn)
+        if spawn:
+            threading.Thread(target=self._work, name=self.name, daemon=True).start()
+
+    def _work(self):
+        while True:
+            self.tasks.get()()
+            with self.lock:
+                self.idle += 1
+
+
+class _Attempt:
+    # One run of the call on a pool thread; cancel tells it the other attempt already won
+    __slots__ = ("future", "cancel", "started", "finished")
+
+    def __init__(self):
+        self.future = Future()
+        self.cancel = threading.Event()
+        self.started = time.perf_counter()
+        self.finished = None
+
+
+class Hedger:
+    """Sends a duplicate of a call that outlasts the p95 of recent calls of the same shape; the first
+    response wins.
+
+    call(pipeline, key, attempt) runs attempt(cancel) and returns its result. key identifies the call
+    shape (model, output cap, streamed or not), since their latencies differ. cancel is a
+    threading.Event set on the losing attempt: a streamed attempt checks it between chunks and closes
+    its connection, which stops generation. A non-streamed request cannot be interrupted, so the loser
+    runs to completion or its deadline and its response is dropped. The loser's tokens are recorded
+    either way, since they are billed.
+
+    Hedges are capped like retries: every call deposits `ratio` tokens in a bucket and every hedge
+    spends one, so at most that fraction of calls is duplicated even when the whole API slows down.
+
+    Cost: a shape without enough history runs inline on the caller's thread. Once it has a p95, the
+    primary runs on a pooled worker thread (so the caller can stop waiting on it when the hedge wins) and
+    the caller blocks on its future: a queue hand-off per call, not a new thread. Worker threads are
+    reused and only started when all are busy, so there are at most as many as attempts in flight.
+    """
+
+    def __init__(self, ratio=DEFAULT_HEDGE_RATIO, percentile=HEDGE_PERCENTILE, tracker=None):
+        self.budget = RetryBudget(ratio=ratio, initial=1.0, max_tokens=10.0)
+        self.percentile = percentile
+        self.tracker = tracker or LatencyTracker()
+        self.pool = _WorkerPool("api-attempt")
+
+    def _start(self, key, attempt):
+        run = _Attempt()
+
+        def target():
+            try:
+                result = attempt(run.cancel)
+            except BaseException as e:
+                run.future.set_exception(e)
+                return
+            run.finished = time.perf_counter()
+            if not run.cancel.is_set():
+                self.tracker.observe(key, run.finished - run.started)
+            run.future.set_result(result)
+
+        self.pool.submit(target)
+        return run
+
+    def call(self, pipeline, key, attempt):
+        self.budget.deposit()
+        delay = self.tracker.percentile(key, self.percentile) if self.budget.ratio > 0 else None
+        if delay is None or self.budget.tokens < 1.0:
+            # No history for this shape yet, or no hedge budget left: a plain call on this thread
+            start = time.perf_counter()
+            result = attempt(threading.Event())
+            self.tracker.observe(key, time.perf_counter() - start)
+            return result
+
+        primary = self._start(key, attempt)
+        done, _ = wait([primary.future], timeout=delay)
+        if done:
+            return primary.future.result()
+        if not self.budget.withdraw():
+            record_hedge(pipeline, "denied")
+            return primary.future.result()
+
+        hedge = self._start(key, attempt)
+        pending = {primary.future, hedge.future}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                winner, loser = (primary, hedge) if future is primary.future else (hedge, primary)
+                record_hedge(pipeline, "hedge_won" if winner is hedge else "primary_won")
+                loser.cancel.set()
+                loser.future.add_done_callback(lambda f, run=loser: _record_loser(pipeline, run))
+                return future.result()
+        raise error
+
+    async def acall(self, pipeline, key, attempt):
+        """call() for an attempt() that returns a coroutine. The loser is cancelled as a task, which closes
+        its connection and stops generation whether it was streamed or not."""
+        import asyncio
+
+        async def timed():
+            start = time.perf_counter()
+            result = await attempt()
+            self.tracker.observe(key, time.perf_counter() - start)
+            return result
+
+        self.budget.deposit()
+        delay = self.tracker.percentile(key, self.percentile) if self.budget.ratio > 0 else None
+        if delay is None or self.budget.tokens < 1.0:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            if not self.budget.withdraw():
+                record_hedge(pipeline, "denied")
+                return await primary
+
+            hedge = asyncio.ensure_future(timed())
+            pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    record_hedge(pipeline, "hedge_won" if task is hedge else "primary_won")
+                    return task.result()
+            raise error
+        finally:
+            # The loser, or both attempts when the caller itself is cancelled
+            for task in pending:
+                task.cancel()
+
+
+def _record_loser(pipeline, run):
+    # The losing response is discarded, but its tokens were generated (and billed) all the same
+    if run.future.exception() is not None:
+        return
+    message = run.future.result()
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        record_api_usage(pipeline, getattr(message, "model", None), usage, (run.finished or time.perf_counter()) - run.started)
+
+
+HEDGER = Hedger()
+
+
+def add_hedging_arguments(parser):
+    parser.add_argument("--hedge_ratio", type=float, default=DEFAULT_HEDGE_RATIO,
+                        help="Fraction of API calls that may be duplicated when slower than the recent p95 "
+                             "(0 disables hedging)")
+    parser.add_argument("--deadline_scale", type=float, default=deadline_scale,
+                        help=f"Scale on the per-call deadline of {DEADLINE_BASE_SECONDS:g}s plus max_tokens at "
+                             f"{DEADLINE_TOKENS_PER_SECOND:g} tokens/s (0 disables deadlines)")
+    return parser
+
+
+def configure_hedging(args):
+    global deadline_scale
+    HEDGER.budget.ratio = getattr(args, "hedge_ratio", HEDGER.budget.ratio)
+    deadline_scale = getattr(args, "deadline_scale", deadline_scale)
@@ -0,0 +1,219 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from urllib.parse import urlparse
+
+ROBOTS_TIMEOUT = 5
+USER_AGENT = "*"
+
+# Fetch outcomes reported back to the scheduler
+FETCH_OK = "ok"
+FETCH_TIMEOUT = "timeout"
+FETCH_ERROR = "error"
+
+
+def host_of(url):
+    return (urlparse(url).hostname or "").lower().removeprefix("www.")
+
+
+def fetch_crawl_delay(host, timeout=ROBOTS_TIMEOUT):
+    # Returns the robots.txt Crawl-delay (or Request-rate interval) for host, or None
+    import urllib.request
+    from urllib.robotparser import RobotFileParser
+
+    for scheme in ("https", "http"):
+        try:
+            with urllib.request.urlopen(f"{scheme}://{host}/robots.txt", timeout=timeout) as response:
+                lines = response.read().decode("utf-8", errors="replace").splitlines()
+        except Exception:
+            continue
+        parser = RobotFileParser()
+        parser.parse(lines)
+        delay = parser.crawl_delay(USER_AGENT)
+        if delay is None:
+            rate = parser.request_rate(USER_AGENT)
+            if rate and rate.requests:
+                delay = rate.seconds / rate.requests
+        return float(delay) if delay is not None else None
+    return None
+
+
+class HostState:
+    __slots__ = ("name", "pending", "in_flight", "next_allowed", "crawl_delay", "backoff", "ready",
+                 "attempts", "failures", "timeouts", "skipped")
+
+    def __init__(self, name, ready):
+        self.name = name
+        self.pending = collections.deque()
+        self.in_flight = 0
+        self.next_allowed = 0.0
+        self.crawl_delay = 0.0
+        self.backoff = 0.0
+        self.ready = ready
+        self.attempts = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = False
+
+
+class HostScheduler:
+    """Queue of scrape rows that interleaves hosts instead of serving them in input order.
+
+    A host is eligible when it has fewer than per_host_limit fetches in flight and its politeness
+    interval has elapsed: max(host_delay, robots.txt crawl delay, timeout backoff) after its last fetch.
+    Hosts whose fetch failure rate reaches max_failure_rate (after min_attempts fetches) are skipped;
+    their remaining rows are handed out immediately with a skip reason.
+
+    Workers call get(), then finish_fetch() as soon as the page is fetched (which frees the host slot
+    while the rest of the row is processed) and task_done() when the row is complete.
+    """
+
+    def __init__(self, per_host_limit=2, host_delay=0.0, respect_robots=True, max_crawl_delay=30.0,
+                 backoff_base=5.0, max_backoff=120.0, max_failure_rate=0.8, min_attempts=5, log=print):
+        self.per_host_limit = per_host_limit
+        self.host_delay = host_delay
+        self.respect_robots = respect_robots
+        self.max_crawl_delay = max_crawl_delay
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.max_failure_rate = max_failure_rate
+        self.min_attempts = min_attempts
+        self.log = log
+        self.hosts = {}
+        # Round-robin order of hosts; rotated on every dispatch
+        self.order = collections.deque()
+        self.pending = 0
+        self.unfinished = 0
+        self.condition = threading.Condition()
+        self.local = threading.local()
+        self.robots_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="robots") if respect_robots else None
+
+    def put(self, item, url):
+        host = host_of(url)
+        with self.condition:
+            state = self.hosts.get(host)
+            if state is None:
+                state = self.hosts[host] = HostState(host, ready=not self.respect_robots)
+                self.order.append(state)
+                if self.respect_robots:
+                    self.robots_executor.submit(self._load_robots, state)
+            state.pending.append(item)
+            self.pending += 1
+            self.unfinished += 1
+            self.condition.notify()
+
+    def _load_robots(self, state):
+        delay = fetch_crawl_delay(state.name)
+        with self.condition:
+            if delay:
+                state.crawl_delay = min(delay, self.max_crawl_delay)
+                self.log(f"{state.name}: robots.txt crawl delay {state.crawl_delay:g}s")
+            state.ready = True
+            self.condition.notify_all()
+
+    def qsize(self):
+        return self.pending
+
+    def _interval(self, state):
+        return max(self.host_delay, state.crawl_delay, state.backoff)
+
+    def _select(self, polite):
+        # Returns (state, item, skip_reason) for the first eligible host in round-robin order, or the
+        # earliest time a host becomes eligible
+        now = time.monotonic()
+        wake_at = None
+        for _ in range(len(self.order)):
+            state = self.order[0]
+            self.order.rotate(-1)
+            if not state.pending:
+                continue
+            if state.skipped:
+                return state, state.pending.popleft(), (
+                    f"Skipped: {state.name} failed {state.failures} of {state.attempts} fetches")
+            if not polite:
+                return state, state.pending.popleft(), None
+            if not state.ready or state.in_flight >= self.per_host_limit:
+                continue
+            if state.next_allowed > now:
+                wake_at = state.next_allowed if wake_at is None else min(wake_at, state.next_allowed)
+                continue
+            state.in_flight += 1
+            state.next_allowed = now + self._interval(state)
+            return state, state.pending.popleft(), None
+        return wake_at
+
+    def get(self, timeout=None, polite=True):
+        """Returns (item, skip_reason). With polite=False (rows that will not be started anyway)
+        host limits are ignored so the backlog can be cleared quickly. Raises queue.Empty on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                selected = self._select(polite)
+                if isinstance(selected, tuple):
+                    state, item, skip_reason = selected
+                    self.pending -= 1
+                    # Only a polite dispatch holds a host slot
+                    self.local.host = state if polite and skip_reason is None else None
+                    return item, skip_reason
+                now = time.monotonic()
+                wait = None if deadline is None else deadline - now
+                if wait is not None and wait <= 0:
+                    raise Empty
+                if selected is not None:
+                    wait = selected - now if wait is None else min(wait, selected - now)
+                self.condition.wait(wait)
+
+    def finish_fetch(self, outcome=None):
+        # Frees the calling thread's host slot; outcome (FETCH_OK/TIMEOUT/ERROR) feeds backoff and failure rate
+        state = getattr(self.local, "host", None)
+        if state is None:
+            return
+        self.local.host = None
+        with self.condition:
+            state.in_flight -= 1
+            if outcome is not None:
+                self._record(state, outcome)
+            self.condition.notify_all()
+
+    def _record(self, state, outcome):
+        state.attempts += 1
+        if outcome == FETCH_OK:
+            state.backoff = 0.0
+        else:
+            state.failures += 1
+            if outcome == FETCH_TIMEOUT:
+                state.timeouts += 1
+                # Timeouts usually mean the host is throttling us: back off exponentially
+                state.backoff = min(self.max_backoff, max(self.backoff_base, state.backoff * 2))
+        # Measured from the end of the fetch, so slow responses also slow the next request down
+        state.next_allowed = max(state.next_allowed, time.monotonic() + self._interval(state))
+        if (not state.skipped and state.attempts >= self.min_attempts
+                and state.failures / state.attempts >= self.max_failure_rate):
+            state.skipped = True
+            self.log(f"Skipping {state.name}: {state.failures} of {state.attempts} fetches failed; "
+                     f"{len(state.pending)} queued rows will not be fetched")
+
+    def task_done(self):
+        self.finish_fetch()
+        with self.condition:
+            self.unfinished -= 1
+            self.condition.notify_all()
+
+    def join(self):
+        with self.condition:
+            while self.unfinished:
+                self.condition.wait()
+
+    def close(self):
+        if self.robots_executor is not None:
+            self.robots_executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self):
+        with self.condition:
+            return [
+                {"host": state.name, "fetches": state.attempts, "failures": state.failures, "timeouts": state.timeouts,
+                 "crawl_delay": state.crawl_delay, "skipped": state.skipped}
+                for state in sorted(self.hosts.values(), key=lambda s: s.name)
+            ]
@@ -0,0 +1,181 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+from text_reduction import DEFAULT_TOKEN_BUDGET, reduce_blocks, split_into_blocks
+
+# Used when no domain-specific rule matches (same order scrape_content always used)
+DEFAULT_CONTENT_SELECTORS = ["main", "article", "div.content"]
+
+# Tags whose text is never article content
+NON_CONTENT_TAGS = ["script", "style", "noscript", "template", "svg"]
+
+# domain -> list of CSS selectors, or a picklable callable(html) -> text
+CONTENT_RULES = {}
+
+
+def register_content_rule(domain, rule):
+    CONTENT_RULES[domain.lower().removeprefix("www.")] = rule
+
+
+def load_content_rules(path):
+    # JSON file of {"example.com": ["div.article-body", "article"], ...}
+    with open(path, encoding="utf-8") as f:
+        for domain, selectors in json.load(f).items():
+            register_content_rule(domain, list(selectors))
+
+
+def rule_for_url(url, rules=None):
+    rules = CONTENT_RULES if rules is None else rules
+    host = (urlparse(url).hostname or "").lower().removeprefix("www.") if url else ""
+    # Longest matching domain suffix wins, so news.example.com can override example.com
+    while host:
+        if host in rules:
+            return rules[host]
+        host = host.partition(".")[2]
+    return DEFAULT_CONTENT_SELECTORS
+
+
+def detect_parser():
+    try:
+        import selectolax.parser  # noqa: F401
+        return "selectolax"
+    except ImportError:
+        pass
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+# Paragraph-level elements scored individually by the text reduction stage
+BLOCK_TAGS = ["p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "td", "figcaption", "dd"]
+# Blocks that wrap <p> elements are skipped so their text is not counted twice
+CONTAINER_TAGS = {"li", "td", "blockquote", "dd"}
+
+
+def _link_density(text_length, link_length):
+    return min(1.0, link_length / text_length) if text_length else 0.0
+
+
+def _extract_selectolax(html, selectors):
+    from selectolax.parser import HTMLParser
+
+    tree = HTMLParser(html)
+    tree.strip_tags(NON_CONTENT_TAGS)
+    root = None
+    for selector in selectors:
+        root = tree.css_first(selector)
+        if root is not None:
+            break
+    if root is None:
+        root = tree.body or tree.root
+    if root is None:
+        return "", []
+
+    blocks = []
+    for node in root.css(",".join(BLOCK_TAGS)):
+        if node.tag in CONTAINER_TAGS and node.css_first("p") is not None:
+            continue
+        text = node.text(separator=" ", strip=True)
+        if text:
+            link_length = sum(len(link.text(separator=" ", strip=True)) for link in node.css("a"))
+            blocks.append((text, _link_density(len(text), link_length)))
+    return root.text(separator=" ", strip=True), blocks
+
+
+def _extract_soup(html, selectors, parser):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, parser)
+    for tag in soup(NON_CONTENT_TAGS):
+        tag.decompose()
+    root = None
+    for selector in selectors:
+        root = soup.select_one(selector)
+        if root is not None:
+            break
+    if root is None:
+        root = soup
+
+    blocks = []
+    for node in root.find_all(BLOCK_TAGS):
+        if node.name in CONTAINER_TAGS and node.find("p") is not None:
+            continue
+        text = node.get_text(separator=" ", strip=True)
+        if text:
+            link_length = sum(len(link.get_text(separator=" ", strip=True)) for link in node.find_all("a"))
+            blocks.append((text, _link_density(len(text), link_length)))
+    return root.get_text(separator=" ", strip=True), blocks
+
+
+def extract_document(html, url=None, parser=None, rules=None):
+    # Returns (full text, [(block text, link density), ...]) for the page's main content
+    if not html:
+        return "", []
+    rule = rule_for_url(url, rules)
+    if callable(rule):
+        text = rule(html)
+        return text, split_into_blocks(text)
+    parser = parser or detect_parser()
+    if parser == "selectolax":
+        text, blocks = _extract_selectolax(html, rule)
+    else:
+        text, blocks = _extract_soup(html, rule, parser)
+    # Pages that keep their prose in bare <div>s have few block elements; fall back to sentence blocks
+    if sum(len(block) for block, _ in blocks) < len(text) // 2:
+        blocks = split_into_blocks(text)
+    return text, blocks
+
+
+def extract_text(html, url=None, parser=None, rules=None):
+    return extract_document(html, url, parser=parser, rules=rules)[0]
+
+
+def parse_page(html, url=None, title=None, token_budget=DEFAULT_TOKEN_BUDGET, parser=None, rules=None):
+    text, blocks = extract_document(html, url, parser=parser, rules=rules)
+    reduced_text = reduce_blocks(blocks, title=title, token_budget=token_budget) if blocks else text
+    return {"text": text, "reduced_text": reduced_text}
+
+
+# Per-process state for pool workers, set by _init_worker
+_worker_parser = None
+_worker_rules = None
+
+
+def _init_worker(parser, rules):
+    global _worker_parser, _worker_rules
+    _worker_parser = parser
+    _worker_rules = rules
+
+
+def _parse_in_worker(html, url, title, token_budget):
+    return parse_page(html, url, title=title, token_budget=token_budget, parser=_worker_parser, rules=_worker_rules)
+
+
+class HtmlParsingStage:
+    """Runs HTML extraction and text reduction in worker processes so parsing does not hold the I/O threads' GIL."""
+
+    def __init__(self, max_workers=None, parser=None):
+        self.parser = parser or detect_parser()
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        # Rules are passed explicitly because spawned workers (macOS/Windows) do not inherit runtime registrations
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                            initargs=(self.parser, dict(CONTENT_RULES)))
+
+    def submit(self, html, url=None, title=None, token_budget=DEFAULT_TOKEN_BUDGET):
+        return self.executor.submit(_parse_in_worker, html, url, title, token_budget)
+
+    def parse(self, html, url=None, title=None, token_budget=DEFAULT_TOKEN_BUDGET):
+        return self.submit(html, url, title, token_budget).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
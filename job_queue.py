@@ -0,0 +1,240 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Lease:
+    """A claimed work unit. Only the holder of the current token may heartbeat, complete or fail it."""
+
+    __slots__ = ("unit_id", "job", "seq", "label", "payload", "token", "attempt")
+
+    def __init__(self, unit_id, job, seq, label, payload, token, attempt):
+        self.unit_id = unit_id
+        self.job = job
+        self.seq = seq
+        self.label = label
+        self.payload = payload
+        self.token = token
+        self.attempt = attempt
+
+
+class JobQueue:
+    """Work units of named jobs in one SQLite file, shared by any number of worker processes or hosts.
+
+    A worker claims the oldest pending unit with a lease that it keeps alive with heartbeats. A unit whose
+    lease expires (its worker died or hung) goes back to pending for the next claim, up to max_attempts
+    claims in total; after that it is marked failed. Completing a unit stores its result next to it, and
+    a completion from a worker that has lost its lease is rejected, so each unit keeps exactly one result.
+
+    Every worker must see the same file: a local disk for several processes on one machine, or a shared
+    volume whose locking SQLite supports for several hosts.
+    """
+
+    def __init__(self, path, worker_id=None, lease_seconds=300.0, max_attempts=3):
+        self.path = path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Autocommit mode; writes take BEGIN IMMEDIATE so concurrent claims serialize on the file lock
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                reduced_by TEXT,
+                reduced_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS units (
+                id INTEGER PRIMARY KEY,
+                job TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_token TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (job, seq)
+            );
+            CREATE INDEX IF NOT EXISTS units_state ON units (job, state, id);
+        """)
+
+    def _write(self, statements):
+        # Runs statements(conn) in one immediate transaction and returns its result
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def has_job(self, job):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM jobs WHERE job = ?", (job,)).fetchone() is not None
+
+    def enqueue(self, job, units):
+        """Adds the job's units, given as (label, payload) pairs, unless the job already exists.
+
+        Returns the number of units added, 0 when another worker enqueued the job first.
+        """
+        def insert(conn):
+            if conn.execute("SELECT 1 FROM jobs WHERE job = ?", (job,)).fetchone():
+                return 0
+            now = time.time()
+            conn.execute("INSERT INTO jobs (job, created_at) VALUES (?, ?)", (job, now))
+            rows = [(job, seq, label, payload, now) for seq, (label, payload) in enumerate(units)]
+            conn.executemany("INSERT INTO units (job, seq, label, payload, updated_at) VALUES (?, ?, ?, ?, ?)", rows)
+            return len(rows)
+
+        return self._write(insert)
+
+    def _requeue_expired(self, conn, job, now):
+        conn.execute("""UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                               error = 'lease expired on ' || worker, lease_token = NULL, updated_at = ?
+                        WHERE job = ? AND state = 'leased' AND lease_expires < ?""",
+                     (self.max_attempts, now, job, now))
+
+    def claim(self, job):
+        """Leases the oldest pending unit of job to this worker, or returns None when none is pending."""
+        def take(conn):
+            now = time.time()
+            self._requeue_expired(conn, job, now)
+            row = conn.execute("SELECT id, seq, label, payload, attempts FROM units "
+                               "WHERE job = ? AND state = 'pending' ORDER BY id LIMIT 1", (job,)).fetchone()
+            if row is None:
+                return None
+            unit_id, seq, label, payload, attempts = row
+            token = uuid.uuid4().hex
+            conn.execute("""UPDATE units SET state = 'leased', worker = ?, lease_token = ?, lease_expires = ?,
+                                   attempts = attempts + 1, updated_at = ?
+                            WHERE id = ?""",
+                         (self.worker_id, token, now + self.lease_seconds, now, unit_id))
+            return Lease(unit_id, job, seq, label, payload, token, attempts + 1)
+
+        return self._write(take)
+
+    def heartbeat(self, lease):
+        """Extends the lease; returns False when it was lost (expired and requeued or claimed elsewhere)."""
+        def extend(conn):
+            now = time.time()
+            cursor = conn.execute("UPDATE units SET lease_expires = ?, updated_at = ? "
+                                  "WHERE id = ? AND state = 'leased' AND lease_token = ?",
+                                  (now + self.lease_seconds, now, lease.unit_id, lease.token))
+            return cursor.rowcount == 1
+
+        return self._write(extend)
+
+    def complete(self, lease, result):
+        """Stores the unit's result; returns False (and stores nothing) when the lease was lost."""
+        def finish(conn):
+            cursor = conn.execute("""UPDATE units SET state = 'done', result = ?, error = NULL, lease_token = NULL,
+                                            updated_at = ?
+                                     WHERE id = ? AND state = 'leased' AND lease_token = ?""",
+                                  (result, time.time(), lease.unit_id, lease.token))
+            return cursor.rowcount == 1
+
+        return self._write(finish)
+
+    def fail(self, lease, error):
+        """Returns the unit to pending for another attempt, or marks it failed after max_attempts."""
+        def release(conn):
+            cursor = conn.execute("""UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                            error = ?, lease_token = NULL, updated_at = ?
+                                     WHERE id = ? AND state = 'leased' AND lease_token = ?""",
+                                  (self.max_attempts, str(error), time.time(), lease.unit_id, lease.token))
+            return cursor.rowcount == 1
+
+        return self._write(release)
+
+    def counts(self, job):
+        """Units of job by state, after requeueing expired leases."""
+        def count(conn):
+            self._requeue_expired(conn, job, time.time())
+            rows = conn.execute("SELECT state, COUNT(*) FROM units WHERE job = ? GROUP BY state", (job,))
+            return dict(rows.fetchall())
+
+        counts = self._write(count)
+        return {state: counts.get(state, 0) for state in ("pending", "leased", "done", "failed")}
+
+    def claim_reduce(self, job):
+        """True for exactly one caller once the job is finished; that caller merges the results."""
+        def mark(conn):
+            cursor = conn.execute("UPDATE jobs SET reduced_by = ?, reduced_at = ? WHERE job = ? AND reduced_by IS NULL",
+                                  (self.worker_id, time.time(), job))
+            return cursor.rowcount == 1
+
+        return self._write(mark)
+
+    def reduced(self, job):
+        """(worker, time) that merged job's results, or None while it has not been merged."""
+        with self.lock:
+            row = self.conn.execute("SELECT reduced_by, reduced_at FROM jobs WHERE job = ? AND reduced_by IS NOT NULL",
+                                    (job,)).fetchone()
+        return tuple(row) if row else None
+
+    def results(self, job):
+        """Yields (label, result) of the job's finished units in enqueue order."""
+        with self.lock:
+            rows = self.conn.execute("SELECT label, result FROM units WHERE job = ? AND state = 'done' ORDER BY seq",
+                                     (job,)).fetchall()
+        yield from rows
+
+    def failures(self, job):
+        with self.lock:
+            return self.conn.execute("SELECT label, error FROM units WHERE job = ? AND state = 'failed' ORDER BY seq",
+                                     (job,)).fetchall()
+
+    def keep_alive(self, lease, log=print):
+        return Heartbeat(self, lease, log=log)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class Heartbeat:
+    """Context manager that renews a lease from a background thread while the unit is processed."""
+
+    def __init__(self, queue, lease, log=print):
+        self.queue = queue
+        self.lease = lease
+        self.log = log
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"heartbeat-{lease.unit_id}", daemon=True)
+
+    def _run(self):
+        interval = max(self.queue.lease_seconds / 3, 0.05)
+        while not self.stopped.wait(interval):
+            try:
+                if not self.queue.heartbeat(self.lease):
+                    self.lost = True
+                    self.log(f"Lost the lease on {self.lease.label}; another worker will redo it")
+                    return
+            except sqlite3.Error as e:
+                # Missed beats are fine as long as one lands before the lease expires
+                self.log(f"Heartbeat for {self.lease.label} failed: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        return False
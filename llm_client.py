@@ -0,0 +1,55 @@
+import os
+import threading
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide Anthropic client, created on first use.
+
+    One client (and its HTTP connection pool) is shared by every pipeline in the process. Retries are
+    handled by retry_policy, so the SDK's own are disabled. The key comes from ANTHROPIC_API_KEY.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                # Deferred so jobs that never call the API (and --help) do not pay for importing the SDK
+                import anthropic
+
+                _client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY", ""), max_retries=0)
+    return _client
+
+
+def set_client(client):
+    # Replaces the shared client, e.g. with one pointed at a mock server
+    global _client
+    with _lock:
+        _client = client
+
+
+_async_factory = None
+
+
+def create_async_client(max_connections):
+    """A new AsyncAnthropic client for one async engine run, pooling up to max_connections connections.
+
+    Async clients are bound to the event loop they are used on, so each run (one asyncio.run) creates
+    its own and closes it at the end. Like get_client, it leaves retries to retry_policy.
+    """
+    if _async_factory is not None:
+        return _async_factory(max_connections)
+    import anthropic
+    import httpx
+
+    http_client = anthropic.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+    return anthropic.AsyncAnthropic(api_key=os.environ.get("ANTHROPIC_API_KEY", ""), max_retries=0,
+                                    http_client=http_client)
+
+
+def set_async_client_factory(factory):
+    # Replaces how create_async_client builds clients, e.g. pointed at a mock server; None restores the default
+    global _async_factory
+    _async_factory = factory
@@ -0,0 +1,327 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from profiling import DEFAULT_INTERVAL_MS, finish_profiling, span, start_profiling
+
+# USD per million tokens: (input, output)
+MODEL_PRICES = {
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+    "claude-3-opus-20240229": (15.00, 75.00),
+}
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            return self.values.get(key, 0.0)
+
+    def totals(self):
+        # {label values: value}, copied under the lock so writers can keep updating
+        with self.lock:
+            return dict(self.values)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield f"{self.name}_total{_format_labels(self.label_names, key)} {_format_number(value)}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            self.values[key] = float(value)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+
+
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def totals(self):
+        # {label values: (count, sum)}
+        with self.lock:
+            return {key: (series["count"], series["sum"]) for key, series in self.series.items()}
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, dict(series, counts=list(series["counts"]))) for key, series in self.series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, [("le", _format_number(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_count{labels} {series['count']}"
+            yield f"{self.name}_sum{labels} {_format_number(series['sum'])}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pipeline_stage_seconds", "Wall-clock seconds spent per pipeline stage", labels=("pipeline", "stage")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens", "Tokens sent to and received from the Messages API", labels=("pipeline", "model", "direction")))
+LLM_COST = REGISTRY.register(Counter(
+    "llm_cost_dollars", "Estimated Messages API spend in USD", labels=("pipeline", "model")))
+LLM_CALLS = REGISTRY.register(Counter(
+    "llm_calls", "Completed Messages API calls", labels=("pipeline", "model")))
+RETRIES = REGISTRY.register(Counter(
+    "pipeline_retries", "Retried operations", labels=("pipeline", "stage", "error_class")))
+LLM_ESCALATIONS = REGISTRY.register(Counter(
+    "llm_escalations", "Calls re-routed to a larger model or output cap", labels=("pipeline", "task", "reason")))
+LLM_EARLY_STOPS = REGISTRY.register(Counter(
+    "llm_early_stops", "Streamed responses closed before the model finished", labels=("pipeline", "reason")))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "llm_hedges", "Duplicate requests sent for calls slower than the recent p95, by outcome", labels=("pipeline", "outcome")))
+RETRIES_DENIED = REGISTRY.register(Counter(
+    "pipeline_retries_denied", "Retries refused by the global retry budget", labels=("pipeline", "error_class")))
+ERRORS = REGISTRY.register(Counter(
+    "pipeline_errors", "Failed operations", labels=("pipeline", "stage")))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "pipeline_queue_depth", "Work items waiting or in flight", labels=("pipeline", "queue")))
+
+
+@contextmanager
+def time_stage(pipeline, stage):
+    # Also a named span in the --profile flamegraph and stage summary
+    start = time.perf_counter()
+    try:
+        with span(f"{pipeline}:{stage}"):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, pipeline=pipeline, stage=stage)
+
+
+def observe_stage(pipeline, stage, seconds):
+    STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=stage)
+
+
+def calculate_cost(model, input_tokens, output_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES[DEFAULT_MODEL])
+    input_cost = input_tokens * input_price / 1000000
+    output_cost = output_tokens * output_price / 1000000
+    return input_cost, output_cost
+
+
+def record_api_usage(pipeline, model, usage, time_taken):
+    """Record one Messages API call and return the token/cost/time fields the scripts report."""
+    input_tokens = usage.input_tokens
+    output_tokens = usage.output_tokens
+    input_cost, output_cost = calculate_cost(model, input_tokens, output_tokens)
+
+    STAGE_SECONDS.observe(time_taken, pipeline=pipeline, stage="api")
+    LLM_CALLS.inc(pipeline=pipeline, model=model)
+    LLM_TOKENS.inc(input_tokens, pipeline=pipeline, model=model, direction="input")
+    LLM_TOKENS.inc(output_tokens, pipeline=pipeline, model=model, direction="output")
+    LLM_COST.inc(input_cost + output_cost, pipeline=pipeline, model=model)
+
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "input_cost": input_cost,
+        "output_cost": output_cost,
+        "total_cost": input_cost + output_cost,
+        "time_taken": time_taken,
+    }
+
+
+def record_retry(pipeline, stage, error_class=""):
+    RETRIES.inc(pipeline=pipeline, stage=stage, error_class=error_class)
+
+
+def record_retry_denied(pipeline, error_class):
+    RETRIES_DENIED.inc(pipeline=pipeline, error_class=error_class)
+
+
+def record_escalation(pipeline, task, reason):
+    LLM_ESCALATIONS.inc(pipeline=pipeline, task=task, reason=reason)
+
+
+def record_early_stop(pipeline, reason):
+    LLM_EARLY_STOPS.inc(pipeline=pipeline, reason=reason)
+
+
+def record_hedge(pipeline, outcome):
+    LLM_HEDGES.inc(pipeline=pipeline, outcome=outcome)
+
+
+def record_error(pipeline, stage):
+    ERRORS.inc(pipeline=pipeline, stage=stage)
+
+
+def set_queue_depth(pipeline, queue, depth):
+    QUEUE_DEPTH.set(depth, pipeline=pipeline, queue=queue)
+
+
+def render_openmetrics():
+    return REGISTRY.render()
+
+
+def write_metrics_file(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_openmetrics())
+    os.replace(tmp_path, path)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    # http.server is only imported when metrics are actually served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stage_summary():
+    # (pipeline, stage, count, total seconds), slowest stage first
+    rows = [(pipeline, stage, count, total) for (pipeline, stage), (count, total) in STAGE_SECONDS.totals().items()]
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def log_stage_summary(log):
+    for pipeline, stage, count, total in stage_summary():
+        log(f"Stage {pipeline}/{stage}: {count} calls, {total:.2f}s total, {total / count:.3f}s avg")
+    for (pipeline, model), cost in sorted(LLM_COST.totals().items()):
+        log(f"Cost {pipeline}/{model}: ${cost:.4f}")
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics_port", type=int, help="Serve OpenMetrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics_file", help="Write OpenMetrics text to this file when the run finishes")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="PREFIX",
+                        help="Sample the run's stacks and write PREFIX.svg (flamegraph), PREFIX.folded, "
+                             "PREFIX.speedscope.json and a per-stage wall/CPU summary (default PREFIX: profile)")
+    parser.add_argument("--profile_interval", type=float, default=DEFAULT_INTERVAL_MS,
+                        help="Milliseconds between profiler samples")
+    parser.add_argument("--profile_idle", action="store_true",
+                        help="Keep samples of threads waiting on a lock or queue in the profile")
+    return parser
+
+
+def start_metrics(args, log=print):
+    if getattr(args, "profile", None):
+        start_profiling(interval=args.profile_interval / 1000.0, include_idle=args.profile_idle)
+        log(f"Profiling every {args.profile_interval:g}ms; results go to {args.profile}.*")
+    if getattr(args, "metrics_port", None):
+        start_metrics_server(args.metrics_port)
+        log(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+
+def finish_metrics(args, log=print):
+    if getattr(args, "profile", None):
+        finish_profiling(args.profile, log=log)
+    log_stage_summary(log)
+    if getattr(args, "metrics_file", None):
+        write_metrics_file(args.metrics_file)
+        log(f"Metrics written to {args.metrics_file}")
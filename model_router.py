@@ -0,0 +1,135 @@
+from metrics import record_escalation
+from retry_policy import ValidationError
+from text_reduction import estimate_tokens
+
+# Cheapest first; a task moves up one tier only when its output fails validation
+MODEL_TIERS = ["claude-3-haiku-20240307", "claude-3-5-haiku-20241022", "claude-3-5-sonnet-20241022"]
+
+# Hard output limit for every tier above
+MODEL_MAX_OUTPUT_TOKENS = 4096
+
+# task -> max_tokens: output cap sized for the task's response format
+#         max_output_tokens: ceiling when a truncated response is retried with a doubled cap
+#         large_prompt_tokens: prompts above this start one tier up (None: always start on the cheapest tier)
+TASK_PROFILES = {
+    "generate_bio": {"max_tokens": 1024, "max_output_tokens": 4096, "large_prompt_tokens": None},
+    "generate_bio_batch": {"max_tokens": 2048, "max_output_tokens": 4096, "large_prompt_tokens": None},
+    "evaluate_bio": {"max_tokens": 200, "max_output_tokens": 800, "large_prompt_tokens": None},
+    "funding_extraction": {"max_tokens": 800, "max_output_tokens": 2048, "large_prompt_tokens": None},
+    "contact_selection": {"max_tokens": 1500, "max_output_tokens": 4096, "large_prompt_tokens": 12000},
+    "company_info": {"max_tokens": 600, "max_output_tokens": 2048, "large_prompt_tokens": None},
+}
+
+
+class TruncatedResponse(Exception):
+    """The response stopped at max_tokens; the router retries it with a larger cap on the same model.
+
+    Deliberately not a ValidationError, so retry_policy does not re-ask with the same cap first.
+    """
+
+
+def check_truncated(message):
+    if getattr(message, "stop_reason", None) == "max_tokens":
+        raise TruncatedResponse(f"Response truncated at {message.usage.output_tokens} output tokens")
+
+
+class Route:
+    __slots__ = ("task", "tier", "model", "max_tokens")
+
+    def __init__(self, task, tier, model, max_tokens):
+        self.task = task
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def __repr__(self):
+        return f"Route({self.task}, {self.model}, max_tokens={self.max_tokens})"
+
+
+class ModelRouter:
+    """Picks the model and max_tokens for each call from the task type and prompt size.
+
+    router.complete(task, prompt, attempt) calls attempt(route) and returns its result. attempt makes
+    the API call with route.model / route.max_tokens and raises ValidationError when the output is
+    unusable (the task then moves to the next model tier) or TruncatedResponse when it hit max_tokens
+    (same model, doubled cap). Any other error propagates unchanged.
+    """
+
+    def __init__(self, pipeline, tiers=None, profiles=None, escalate=True, log=print):
+        self.pipeline = pipeline
+        self.tiers = tiers
+        self.profiles = profiles or TASK_PROFILES
+        self.escalate = escalate
+        self.log = log
+
+    def model_tiers(self):
+        # Read at call time so --model_tiers applies to routers created at import
+        return self.tiers or MODEL_TIERS
+
+    def route(self, task, prompt, expected_output_tokens=None):
+        profile = self.profiles[task]
+        tiers = self.model_tiers()
+        tier = 0
+        if profile["large_prompt_tokens"] and estimate_tokens(prompt) > profile["large_prompt_tokens"]:
+            tier = min(1, len(tiers) - 1)
+        max_tokens = profile["max_tokens"]
+        if expected_output_tokens:
+            # Leave room for the JSON wrapper around the expected text
+            max_tokens = max(max_tokens, int(expected_output_tokens * 1.25) + 100)
+        max_tokens = min(max_tokens, profile["max_output_tokens"], MODEL_MAX_OUTPUT_TOKENS)
+        return Route(task, tier, tiers[tier], max_tokens)
+
+    def next_route(self, route, error):
+        profile = self.profiles[route.task]
+        if isinstance(error, TruncatedResponse):
+            ceiling = min(profile["max_output_tokens"], MODEL_MAX_OUTPUT_TOKENS)
+            if route.max_tokens < ceiling:
+                return Route(route.task, route.tier, route.model, min(route.max_tokens * 2, ceiling))
+            return None
+        tiers = self.model_tiers()
+        if not self.escalate or route.tier + 1 >= len(tiers):
+            return None
+        return Route(route.task, route.tier + 1, tiers[route.tier + 1], route.max_tokens)
+
+    def _reroute(self, task, route, error, description):
+        # The route to try after a validation or truncation failure; re-raises the error when there is none
+        next_route = self.next_route(route, error)
+        if next_route is None:
+            raise error
+        reason = "truncated" if isinstance(error, TruncatedResponse) else "validation"
+        record_escalation(self.pipeline, task, reason)
+        self.log(f"Re-routing {description or task} from {route} to {next_route} after {reason} failure: {error}")
+        return next_route
+
+    def complete(self, task, prompt, attempt, expected_output_tokens=None, description=""):
+        route = self.route(task, prompt, expected_output_tokens)
+        while True:
+            try:
+                return attempt(route)
+            except (ValidationError, TruncatedResponse) as e:
+                route = self._reroute(task, route, e, description)
+
+    async def acomplete(self, task, prompt, attempt, expected_output_tokens=None, description=""):
+        # complete() for an attempt that returns a coroutine
+        route = self.route(task, prompt, expected_output_tokens)
+        while True:
+            try:
+                return await attempt(route)
+            except (ValidationError, TruncatedResponse) as e:
+                route = self._reroute(task, route, e, description)
+
+
+def add_routing_arguments(parser):
+    parser.add_argument("--model_tiers", help="Comma-separated models, cheapest first "
+                                              f"(default: {','.join(MODEL_TIERS)})")
+    parser.add_argument("--no_escalation", action="store_true",
+                        help="Never move a task to a bigger model when its output fails validation")
+    return parser
+
+
+def configure_routing(args, routers=()):
+    if getattr(args, "model_tiers", None):
+        MODEL_TIERS[:] = [model.strip() for model in args.model_tiers.split(",") if model.strip()]
+    if getattr(args, "no_escalation", False):
+        for router in routers:
+            router.escalate = False
@@ -1,40 +1,50 @@
-import anthropic
 import csv
 import json
 import os
 import argparse
 import time
 from datetime import datetime
-from openpyxl import Workbook
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
-from unidecode import unidecode
 import re
-import chardet
 import glob
-import tiktoken
-import nbformat
-import requests
+from contextlib import nullcontext
+from functools import lru_cache
 from urllib.parse import urlparse, unquote
-import snowflake.connector
-from snowflake.connector.errors import ProgrammingError, DatabaseError
-
-client = anthropic.Anthropic(
-    api_key="",
-)
-
-input_dir = "/Users/navinnishanth/Downloads/BIO_TESTS/notebook/input/fortune500"
-results_dir = "/Users/navinnishanth/Downloads/BIO_TESTS/notebook/results/fortune500"
-
-MAX_TOKENS = 8000  # Increased token limit
-MAX_RETRIES = 5
+from output_writers import add_output_arguments, write_results
+from metrics import (add_metrics_arguments, finish_metrics, record_api_usage, record_error, set_queue_depth,
+                     start_metrics, time_stage)
+from retry_policy import RetryPolicy, ValidationError, add_retry_arguments, configure_retries
+from model_router import ModelRouter, add_routing_arguments, check_truncated, configure_routing
+from streaming import LabeledBlocksMonitor, add_streaming_arguments, configure_streaming, create_message
+from hedging import add_hedging_arguments, configure_hedging
+import async_engine
+from async_engine import add_engine_arguments, configure_engine
+from llm_client import get_client
+from text_reduction import estimate_tokens
+from windowed_executor import submit_windowed
+
+PIPELINE = "company_info"
+
+# Defaults when run as a script; pipeline.py points these at its own input and results directory
+input_dir = os.path.join("input", "company_info")
+results_dir = os.path.join("results", "company_info")
+
+# Documents up to this many tokens are sent whole in one request; longer ones are split into windows
+# of this size. Leaves room in the model's 200k context for the prompt and the response.
+DEFAULT_CONTEXT_BUDGET = 150000
+context_budget = DEFAULT_CONTEXT_BUDGET
 CHUNK_OVERLAP = 1000  # Token overlap between chunks
+# Documents whose character estimate is below this share of the budget are sent whole without loading
+# the tokenizer (the estimate can be off by about this much on number-heavy text)
+ESTIMATE_MARGIN = 0.75
 
-os.makedirs(results_dir, exist_ok=True)
+MAX_WORKERS = 5
+# URLs / files in flight at once; the rest of the input is only read as these finish
+WINDOW = 2 * MAX_WORKERS
 
 log_file = os.path.join(results_dir, "generation_log.txt")
-excel_filename = os.path.join(results_dir, "result.xlsx")
+output_filename = os.path.join(results_dir, "result.xlsx")
 
 OKTA_USER = 'NKS'
 
@@ -44,6 +54,9 @@ def log_message(message):
         f.write(f"[{timestamp}] {message}\n")
     print(message)
 
+retry_policy = RetryPolicy(PIPELINE, log=log_message)
+model_router = ModelRouter(PIPELINE, log=log_message)
+
 def extract_company_info(text):
     company_pattern = r'Company Name: (.*?)\nCompany Address:\n- Street: (.*?)\n- City: (.*?)\n- County: (.*?)\n- State: (.*?)\n- Country: (.*?)\n- ZIP: (.*?)\nCompany Revenue: (.*?)\nCompany Headcount: (.*?)\nCompany Industry: (.*?)\nNAICS Code: (.*?)\nSIC Code: (.*?)\nCompany Website: (.*?)\nCompany Website Status: (.*?)\nCompany Description: (.*?)\nCompany Phone: (.*?)\nHeadquarter Identification: (.*?)(?:\n\n|\Z)'
     match = re.search(company_pattern, text, re.DOTALL)
@@ -69,24 +82,54 @@ def extract_company_info(text):
         }
     return None
 
+@lru_cache(maxsize=None)
+def get_encoding():
+    # tiktoken (and its encoding files) only load once a document is actually chunked
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
 def count_tokens(text):
-    encoding = tiktoken.get_encoding("cl100k_base")
+    encoding = get_encoding()
     return len(encoding.encode(text))
 
-def chunk_text(text):
-    encoding = tiktoken.get_encoding("cl100k_base")
+def chunk_text(text, budget=None):
+    """Splits text into windows of up to budget tokens (context_budget by default).
+
+    Text that fits the budget comes back as a single chunk; the tokenizer is only loaded when the
+    character estimate alone cannot tell.
+    """
+    budget = budget or context_budget
+    if budget <= CHUNK_OVERLAP:
+        raise ValueError(f"Context budget of {budget} tokens must be larger than the {CHUNK_OVERLAP}-token chunk overlap")
+    if estimate_tokens(text) <= budget * ESTIMATE_MARGIN:
+        return [text]
+
+    encoding = get_encoding()
     tokens = encoding.encode(text)
+    if len(tokens) <= budget:
+        return [text]
+
     chunks = []
-    
-    for i in range(0, len(tokens), MAX_TOKENS - CHUNK_OVERLAP):
-        chunk = encoding.decode(tokens[i:i + MAX_TOKENS])
+    for i in range(0, len(tokens), budget - CHUNK_OVERLAP):
+        chunk = encoding.decode(tokens[i:i + budget])
         chunks.append(chunk)
     
     return chunks
 
-def process_text_chunk(chunk, file_path, chunk_number):
+def context_budget_arg(value):
+    # argparse type for --context_budget: windows must advance past their overlap
+    budget = int(value)
+    if budget <= CHUNK_OVERLAP:
+        raise argparse.ArgumentTypeError(f"must be larger than the {CHUNK_OVERLAP}-token chunk overlap")
+    return budget
+
+def company_info_prompt(chunk, chunk_number, chunk_count=None):
+    if chunk_count == 1:
+        scope = "the full text of this document"
+    else:
+        scope = f"the content of this text chunk. This is chunk {chunk_number} of the file"
     prompt_template = """
-    As an AI assistant, your task is to extract comprehensive information about a specific company based on the content of this text chunk. This is chunk {chunk_number} of the file. Please gather and present any available details in a structured format:
+    As an AI assistant, your task is to extract comprehensive information about a specific company based on {scope}. Please gather and present any available details in a structured format:
 
     1. Company Name
     2. Full Company Address (including Street, City, County, State, Country, and ZIP)
@@ -127,88 +170,99 @@ def process_text_chunk(chunk, file_path, chunk_number):
     Text content chunk: {content}
     """
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            start_time = time.time()
-            message = client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                temperature=0.2,
-                messages=[
-                    {"role": "user", "content": prompt_template.format(content=chunk, chunk_number=chunk_number)}
-                ]
-            )
-            end_time = time.time()
-            
-            response_text = message.content[0].text
-            company_info = extract_company_info(response_text)
-            
-            if company_info:
-                log_message(f"Extracted company info from file chunk {file_path} (chunk {chunk_number})")
-                input_tokens = message.usage.input_tokens
-                output_tokens = message.usage.output_tokens
-                input_cost = input_tokens * 0.25 / 1000000
-                output_cost = output_tokens * 1.25 / 1000000
-                total_cost = input_cost + output_cost
-                time_taken = end_time - start_time
-                
-                log_message(f"File chunk processed: {file_path} (chunk {chunk_number}), Input Tokens: {input_tokens}, Output Tokens: {output_tokens}, Total Cost: ${total_cost:.2f}, Time Taken: {time_taken:.2f}s")
-                
-                return company_info
-            else:
-                log_message(f"No company info extracted from file chunk {file_path} (chunk {chunk_number})")
-        except Exception as e:
-            log_message(f"Error processing file chunk {file_path} (chunk {chunk_number}), attempt {attempt + 1}: {str(e)}")
-            if attempt == MAX_RETRIES - 1:
-                log_message(f"Max retries reached for file chunk {file_path} (chunk {chunk_number}). Skipping.")
-                return None
-            time.sleep(5)
+    return prompt_template.format(content=chunk, scope=scope)
+
+def request_args(route, prompt):
+    # Messages API arguments shared by the thread and async engines
+    return {"model": route.model, "max_tokens": route.max_tokens, "temperature": 0.2,
+            "messages": [{"role": "user", "content": prompt}]}
+
+def read_company_info_response(message, route, time_taken):
+    usage = record_api_usage(PIPELINE, route.model, message.usage, time_taken)
+    check_truncated(message)
     
-    return None
+    response_text = message.content[0].text
+    with time_stage(PIPELINE, "parse"):
+        company_info = extract_company_info(response_text)
+    if not company_info:
+        record_error(PIPELINE, "parse")
+        raise ValidationError("No company info extracted from the response")
+    return company_info, usage
+
+def log_chunk_result(file_path, chunk_number, usage):
+    log_message(f"Extracted company info from file chunk {file_path} (chunk {chunk_number})")
+    log_message(f"File chunk processed: {file_path} (chunk {chunk_number}), Input Tokens: {usage['input_tokens']}, Output Tokens: {usage['output_tokens']}, Total Cost: ${usage['total_cost']:.2f}, Time Taken: {usage['time_taken']:.2f}s")
+
+def process_text_chunk(chunk, file_path, chunk_number, chunk_count=None):
+    prompt = company_info_prompt(chunk, chunk_number, chunk_count)
+
+    def request_company_info(route):
+        start_time = time.time()
+        # Streamed (with --stream) until the last field of the format arrives
+        message = create_message(
+            get_client(), LabeledBlocksMonitor("Company Name:", "Headquarter Identification:"), pipeline=PIPELINE,
+            **request_args(route, prompt))
+        return read_company_info_response(message, route, time.time() - start_time)
+
+    description = f"file chunk {file_path} (chunk {chunk_number})"
+    try:
+        company_info, usage = model_router.complete(
+            "company_info", prompt,
+            lambda route: retry_policy.call(request_company_info, route, stage="api", description=description),
+            description=description)
+    except Exception as e:
+        record_error(PIPELINE, "api")
+        log_message(f"Error processing file chunk {file_path} (chunk {chunk_number}): {str(e)}. Skipping.")
+        return None
+
+    log_chunk_result(file_path, chunk_number, usage)
+    return company_info
 
 def download_file(url):
+    import requests
+
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        def fetch():
+            response = requests.get(url, timeout=60)
+            # Raised inside the retried call so 429/5xx responses are retried with backoff
+            response.raise_for_status()
+            return response
+
+        with time_stage(PIPELINE, "fetch"):
+            response = retry_policy.call(fetch, stage="fetch", description=f"download of {url}")
         return response.text
     except requests.RequestException as e:
+        record_error(PIPELINE, "fetch")
         log_message(f"Error downloading file from {url}: {str(e)}")
         return None
 
 def process_url(url):
     log_message(f"Processing URL: {url}")
     
-    content = download_file(url)
+    content = save_download(url)
     if not content:
         return None
     
-    file_name = os.path.join(input_dir, os.path.basename(urlparse(url).path))
-    with open(file_name, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    chunks = chunk_text(content)
-    log_message(f"Created {len(chunks)} chunks for {url}")
-    
-    all_info = []
-    for i, chunk in enumerate(chunks, start=1):
-        log_message(f"Processing chunk {i}/{len(chunks)} for {url}")
-        chunk_info = process_text_chunk(chunk, url, i)
-        if chunk_info:
-            all_info.append(chunk_info)
-    
-    combined_info = {}
-    for info in all_info:
-        for key, value in info.items():
-            if value and value != "N/A":
-                if key not in combined_info or len(value) > len(combined_info[key]):
-                    combined_info[key] = value
-    
+    combined_info = process_text(content, url)
     if combined_info:
         combined_info['source_url'] = url
     
     return combined_info if combined_info else None
 
+def save_download(url):
+    # Keeps a copy of the downloaded file in input_dir
+    content = download_file(url)
+    if content:
+        file_name = os.path.join(input_dir, os.path.basename(urlparse(url).path))
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(content)
+    return content
+
 def get_urls_from_snowflake():
+    # The connector is large and only needed for this source
+    import snowflake.connector
+    from snowflake.connector.errors import ProgrammingError, DatabaseError
+
     max_retries = 3
     for attempt in range(max_retries):
         try:
@@ -235,46 +289,96 @@ def get_urls_from_snowflake():
 
     return []
 
-def process_urls(urls):
+def process_in_parallel(fn, items, queue, executor=None, afn=None):
+    # Runs fn(*item) for each item and returns the non-empty results, with at most WINDOW items in
+    # flight; executor is a shared thread pool (pipeline.py), by default MAX_WORKERS threads for this call.
+    # With --engine async, afn (fn's coroutine counterpart) runs on an event loop instead
+    if afn is not None and async_engine.ENABLED:
+        return async_engine.run(lambda engine: aprocess_in_parallel(engine, afn, items, queue))
+
     all_company_info = []
     
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_url = {executor.submit(process_url, url): url for url in urls}
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) if executor is None else nullcontext(executor) as executor:
+        submitted = finished = 0
+
+        def counted(items):
+            nonlocal submitted
+            for item in items:
+                submitted += 1
+                yield item
+
+        for item, future in submit_windowed(executor, lambda item: fn(*item), counted(items), WINDOW):
+            finished += 1
+            # Items submitted and not yet finished
+            set_queue_depth(PIPELINE, queue, submitted - finished)
             try:
                 company_info = future.result()
                 if company_info:
                     all_company_info.append(company_info)
             except Exception as e:
-                log_message(f"Error processing {url}: {str(e)}")
+                log_message(f"Error processing {item[0]}: {str(e)}")
     
+    return all_company_info
+
+def process_urls(urls, executor=None):
+    all_company_info = process_in_parallel(process_url, ((url,) for url in urls), "urls", executor, aprocess_url)
     log_message(f"Total companies processed: {len(all_company_info)}")
     return all_company_info
 
-def process_text_file(file_path):
-    log_message(f"Processing file: {file_path}")
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+def log_chunks(chunks, content, source):
+    if len(chunks) == 1:
+        log_message(f"Sending {source} whole (~{estimate_tokens(content)} tokens)")
+    else:
+        log_message(f"Created {len(chunks)} chunks for {source}")
+
+def combine_chunk_info(all_info):
+    # Keeps the longest value found for every field
+    combined_info = {}
+    for info in all_info:
+        for key, value in info.items():
+            if value and value != "N/A":
+                if key not in combined_info or len(value) > len(combined_info[key]):
+                    combined_info[key] = value
     
-    chunks = chunk_text(content)
-    log_message(f"Created {len(chunks)} chunks for {file_path}")
+    return combined_info
+
+def process_text(content, source):
+    # Extracts the whole document in one request when it fits context_budget; otherwise each chunk,
+    # keeping the longest value found for every field
+    with time_stage(PIPELINE, "chunk"):
+        chunks = chunk_text(content)
+    log_chunks(chunks, content, source)
     
     all_info = []
     for i, chunk in enumerate(chunks, start=1):
-        log_message(f"Processing chunk {i}/{len(chunks)} for {file_path}")
-        chunk_info = process_text_chunk(chunk, file_path, i)
+        log_message(f"Processing chunk {i}/{len(chunks)} for {source}")
+        chunk_info = process_text_chunk(chunk, source, i, len(chunks))
         if chunk_info:
             all_info.append(chunk_info)
     
-    combined_info = {}
-    for info in all_info:
-        for key, value in info.items():
-            if value and value != "N/A":
-                if key not in combined_info or len(value) > len(combined_info[key]):
-                    combined_info[key] = value
+    return combine_chunk_info(all_info)
+
+def process_source_text(source, content):
+    log_message(f"Processing text from: {source}")
+    combined_info = process_text(content, source)
+    if combined_info:
+        combined_info['source'] = source
+    
+    return combined_info if combined_info else None
+
+def process_texts(items, executor=None):
+    # items: (source, text) pairs, e.g. pages scraped by an earlier pipeline stage
+    all_company_info = process_in_parallel(process_source_text, items, "texts", executor, aprocess_source_text)
+    log_message(f"Total companies processed from texts: {len(all_company_info)}")
+    return all_company_info
+
+def process_text_file(file_path):
+    log_message(f"Processing file: {file_path}")
     
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    combined_info = process_text(content, file_path)
     if combined_info:
         combined_info['source_file'] = file_path
     
@@ -285,24 +389,146 @@ def get_txt_files_from_input_dir():
     log_message(f"Found {len(txt_files)} .txt files in the input directory")
     return txt_files
 
-def process_input_files(file_paths):
-    all_company_info = []
-    
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_file = {executor.submit(process_text_file, file_path): file_path for file_path in file_paths}
-        for future in as_completed(future_to_file):
-            file_path = future_to_file[future]
-            try:
-                company_info = future.result()
-                if company_info:
-                    all_company_info.append(company_info)
-            except Exception as e:
-                log_message(f"Error processing {file_path}: {str(e)}")
-    
+def process_input_files(file_paths, executor=None):
+    all_company_info = process_in_parallel(process_text_file, ((file_path,) for file_path in file_paths), "files",
+                                           executor, aprocess_text_file)
     log_message(f"Total companies processed from input files: {len(all_company_info)}")
     return all_company_info
 
+# Async engine (--engine async): the same steps as process_text_chunk, process_text and the per-item
+# functions above, awaiting engine.create_message instead of blocking one of MAX_WORKERS threads per
+# request. Tokenizing, response parsing and file and network I/O run on worker threads.
+
+async def aprocess_text_chunk(engine, chunk, file_path, chunk_number, chunk_count=None):
+    prompt = company_info_prompt(chunk, chunk_number, chunk_count)
+
+    async def request_company_info(route):
+        start_time = time.time()
+        message = await engine.create_message(
+            LabeledBlocksMonitor("Company Name:", "Headquarter Identification:"), pipeline=PIPELINE,
+            **request_args(route, prompt))
+        return await async_engine.to_thread(read_company_info_response, message, route, time.time() - start_time)
+
+    description = f"file chunk {file_path} (chunk {chunk_number})"
+    try:
+        company_info, usage = await model_router.acomplete(
+            "company_info", prompt,
+            lambda route: retry_policy.acall(request_company_info, route, stage="api", description=description),
+            description=description)
+    except Exception as e:
+        record_error(PIPELINE, "api")
+        log_message(f"Error processing file chunk {file_path} (chunk {chunk_number}): {str(e)}. Skipping.")
+        return None
+
+    log_chunk_result(file_path, chunk_number, usage)
+    return company_info
+
+def timed_chunk_text(content):
+    with time_stage(PIPELINE, "chunk"):
+        return chunk_text(content)
+
+async def aprocess_text(engine, content, source):
+    chunks = await async_engine.to_thread(timed_chunk_text, content)
+    log_chunks(chunks, content, source)
+
+    all_info = []
+    for i, chunk in enumerate(chunks, start=1):
+        log_message(f"Processing chunk {i}/{len(chunks)} for {source}")
+        chunk_info = await aprocess_text_chunk(engine, chunk, source, i, len(chunks))
+        if chunk_info:
+            all_info.append(chunk_info)
+
+    return combine_chunk_info(all_info)
+
+async def aprocess_url(engine, url):
+    log_message(f"Processing URL: {url}")
+    content = await async_engine.to_thread(save_download, url)
+    if not content:
+        return None
+
+    combined_info = await aprocess_text(engine, content, url)
+    if combined_info:
+        combined_info['source_url'] = url
+    return combined_info if combined_info else None
+
+async def aprocess_source_text(engine, source, content):
+    log_message(f"Processing text from: {source}")
+    combined_info = await aprocess_text(engine, content, source)
+    if combined_info:
+        combined_info['source'] = source
+    return combined_info if combined_info else None
+
+def read_text_file(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+async def aprocess_text_file(engine, file_path):
+    log_message(f"Processing file: {file_path}")
+    content = await async_engine.to_thread(read_text_file, file_path)
+    combined_info = await aprocess_text(engine, content, file_path)
+    if combined_info:
+        combined_info['source_file'] = file_path
+    return combined_info if combined_info else None
+
+async def aprocess_in_parallel(engine, afn, items, queue):
+    # process_in_parallel on the event loop, with up to engine.concurrency items in flight
+    log_message(f"Using the async engine with {engine.concurrency} requests in flight")
+    all_company_info = []
+    submitted = finished = 0
+
+    def counted(items):
+        nonlocal submitted
+        for item in items:
+            submitted += 1
+            yield item
+
+    async for item, task in async_engine.map_bounded(lambda item: afn(engine, *item), counted(items),
+                                                     engine.concurrency):
+        finished += 1
+        set_queue_depth(PIPELINE, queue, submitted - finished)
+        try:
+            company_info = task.result()
+            if company_info:
+                all_company_info.append(company_info)
+        except Exception as e:
+            log_message(f"Error processing {item[0]}: {str(e)}")
+
+    return all_company_info
+
+def save_results(all_company_info, output_format="auto", excel=None):
+    import pandas as pd
+
+    output_df = pd.DataFrame(all_company_info)
+    log_message(f"Output DataFrame shape: {output_df.shape}")
+    log_message(f"Output DataFrame columns: {output_df.columns}")
+
+    with time_stage(PIPELINE, "write"):
+        written = write_results(output_df, output_filename, output_format=output_format, excel=excel,
+                                sheet_name='Processed Data', log=log_message)
+
+    log_message(f"\nProcessing complete. Results saved to {', '.join(written)}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract company information from Snowflake URLs or input .txt files")
+    parser.add_argument("--context_budget", type=context_budget_arg, default=DEFAULT_CONTEXT_BUDGET,
+                        help="Tokens of document text sent in one request; longer documents are chunked to this size")
+    add_output_arguments(parser)
+    add_metrics_arguments(parser)
+    add_retry_arguments(parser)
+    add_routing_arguments(parser)
+    add_streaming_arguments(parser)
+    add_hedging_arguments(parser)
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+    context_budget = args.context_budget
+    os.makedirs(results_dir, exist_ok=True)
+    start_metrics(args, log=log_message)
+    configure_retries(args)
+    configure_routing(args, routers=[model_router])
+    configure_streaming(args)
+    configure_hedging(args)
+    configure_engine(args)
+
     try:
         log_message("Attempting to connect to Snowflake...")
         try:
@@ -323,14 +549,7 @@ if __name__ == "__main__":
             all_company_info = process_urls(urls)
         
         if all_company_info:
-            output_df = pd.DataFrame(all_company_info)
-            log_message(f"Output DataFrame shape: {output_df.shape}")
-            log_message(f"Output DataFrame columns: {output_df.columns}")
-
-            with pd.ExcelWriter(excel_filename) as writer:
-                output_df.to_excel(writer, sheet_name='Processed Data', index=False)
-
-            log_message(f"\nProcessing complete. Results saved to {excel_filename}")
+            save_results(all_company_info, args.output_format, args.excel)
         else:
             log_message("No company information was processed. Please check the input sources and try again.")
     except KeyboardInterrupt:
@@ -352,15 +571,10 @@ if __name__ == "__main__":
         if file_paths:
             all_company_info = process_input_files(file_paths)
             if all_company_info:
-                output_df = pd.DataFrame(all_company_info)
-                log_message(f"Output DataFrame shape: {output_df.shape}")
-                log_message(f"Output DataFrame columns: {output_df.columns}")
-
-                with pd.ExcelWriter(excel_filename) as writer:
-                    output_df.to_excel(writer, sheet_name='Processed Data', index=False)
-
-                log_message(f"\nProcessing complete. Results saved to {excel_filename}")
+                save_results(all_company_info, args.output_format, args.excel)
             else:
                 log_message("No company information was processed from .txt files.")
         else:
             log_message("No .txt files found in the input directory. Exiting.")
+
+    finish_metrics(args, log=log_message)
@@ -0,0 +1,156 @@
+import os
+
+# Output formats supported as the primary (columnar / text) result file
+OUTPUT_FORMATS = ["auto", "parquet", "arrow", "csv"]
+
+FORMAT_EXTENSIONS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "csv": ".csv",
+}
+
+# Excel worksheets cannot hold more than this many rows (including the header)
+EXCEL_MAX_ROWS = 1048576
+
+# Above this many rows the Excel sidecar is skipped unless explicitly requested
+EXCEL_SIDECAR_AUTO_MAX_ROWS = 100000
+
+
+def resolve_output_format(output_format):
+    if output_format in (None, "auto"):
+        return "parquet"
+    if output_format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported output format: {output_format}. Choose from {OUTPUT_FORMATS}")
+    return output_format
+
+
+def output_path(base_path, output_format):
+    root, _ = os.path.splitext(base_path)
+    return root + FORMAT_EXTENSIONS[output_format]
+
+
+def _stringify_object_columns(df):
+    # Arrow needs a single type per column; LLM output mixes str/int/list freely. Missing values
+    # (None, NaN, NA) stay null rather than becoming the string "nan"
+    import pandas as pd
+
+    def stringify(value):
+        if value is None or isinstance(value, str):
+            return value
+        if pd.api.types.is_scalar(value) and pd.isna(value):
+            return None
+        return str(value)
+
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(stringify)
+    return df
+
+
+def write_parquet(df, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(_stringify_object_columns(df), preserve_index=False)
+    pq.write_table(table, path, compression="zstd")
+
+
+def write_arrow(df, path):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    table = pa.Table.from_pandas(_stringify_object_columns(df), preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def write_csv(df, path):
+    df.to_csv(path, index=False)
+
+
+WRITERS = {
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+    "csv": write_csv,
+}
+
+
+def _excel_cell(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, dict, tuple, set)):
+        return str(value)
+    try:
+        import pandas as pd
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(value, "item"):
+        # numpy scalars -> plain python values
+        return value.item()
+    return value
+
+
+def write_excel_streaming(df, path, sheet_name="Sheet1", columns=None):
+    from openpyxl import Workbook
+
+    columns = list(columns) if columns is not None else list(df.columns)
+    if len(df) + 1 > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(df)} rows exceed the Excel limit of {EXCEL_MAX_ROWS - 1} data rows")
+
+    # write_only workbooks stream rows to disk instead of building every cell in memory
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=sheet_name)
+    worksheet.append(columns)
+    for row in df[columns].itertuples(index=False, name=None):
+        worksheet.append([_excel_cell(value) for value in row])
+    workbook.save(path)
+
+
+def write_results(df, base_path, output_format="auto", excel=None, sheet_name="Sheet1", columns=None, log=print):
+    """Write df next to base_path in the chosen format; returns the list of files written.
+
+    excel=None writes the Excel sidecar only for jobs small enough for it to be useful,
+    excel=True forces it (failing over the Excel row limit), excel=False disables it.
+    """
+    if columns is not None:
+        df = df[list(columns)]
+
+    output_format = resolve_output_format(output_format)
+    written = []
+
+    path = output_path(base_path, output_format)
+    if os.path.exists(path):
+        os.remove(path)
+    WRITERS[output_format](df, path)
+    written.append(path)
+    log(f"Wrote {len(df)} rows to {path}")
+
+    if excel is None:
+        excel = len(df) <= EXCEL_SIDECAR_AUTO_MAX_ROWS
+        if not excel:
+            log(f"Skipping Excel sidecar for {len(df)} rows (use --excel to force it)")
+
+    if excel:
+        excel_path = os.path.splitext(base_path)[0] + ".xlsx"
+        if os.path.exists(excel_path):
+            os.remove(excel_path)
+        write_excel_streaming(df, excel_path, sheet_name=sheet_name)
+        written.append(excel_path)
+        log(f"Wrote Excel sidecar to {excel_path}")
+
+    return written
+
+
+def add_output_arguments(parser):
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="auto",
+                        help="Primary output format (auto = parquet)")
+    excel_group = parser.add_mutually_exclusive_group()
+    excel_group.add_argument("--excel", dest="excel", action="store_true", default=None,
+                             help="Always write the .xlsx sidecar")
+    excel_group.add_argument("--no_excel", dest="excel", action="store_false",
+                             help="Never write the .xlsx sidecar")
+    return parser
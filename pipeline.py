@@ -0,0 +1,501 @@
+"""Runs any of the pipelines as source -> transforms -> sinks in one process.
+
+    python pipeline.py --source csv:bios.csv bios
+    python pipeline.py --source csv:contacts.csv contacts --top_k 25 --sink file --sink jsonl
+    python pipeline.py --source dir:input/fortune500 company-info
+    python pipeline.py --source urls:urls.txt company-info
+    python pipeline.py --source snowflake company-info
+    python pipeline.py --source csv:INPUT.csv scrape company-info
+
+    # Distributed: start the same command on any number of hosts sharing jobs.sqlite
+    python pipeline.py --source csv:contacts.csv contacts --queue /shared/jobs.sqlite
+
+Sources and transforms exchange DataFrames. Every transform in a run shares one thread pool, the
+Anthropic client (llm_client), the process-wide retry budget, model routing and metrics. Transform
+modules, and the libraries only they need (selenium, snowflake, tiktoken), are imported when a job
+first uses them.
+
+With --queue, the first worker splits the source into work units (rows grouped by TASK_ID, PROFILE_ID
+or COMPANY_ID, depending on the first transform) in a job_queue.JobQueue. Every worker then leases
+units, runs the transforms on them and stores the results in the queue; the worker that sees the job
+finish first merges all results into the sinks.
+"""
+import argparse
+import importlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from async_engine import add_engine_arguments, configure_engine
+from hedging import add_hedging_arguments, configure_hedging
+from job_queue import JobQueue, default_worker_id
+from metrics import add_metrics_arguments, finish_metrics, set_queue_depth, start_metrics, time_stage
+from model_router import add_routing_arguments, configure_routing
+from output_writers import add_output_arguments, write_results
+from retry_policy import add_retry_arguments, configure_retries
+from streaming import add_streaming_arguments, configure_streaming
+from text_reduction import DEFAULT_TOKEN_BUDGET
+
+PIPELINE = "pipeline"
+
+DEFAULT_RESULTS_DIR = os.path.join("results", "pipeline")
+
+
+def use_results_dir(module, results_dir):
+    # Points a pipeline module's log and output files into results_dir
+    os.makedirs(results_dir, exist_ok=True)
+    module.results_dir = results_dir
+    module.log_file = os.path.join(results_dir, f"{module.PIPELINE}_{os.path.basename(module.log_file)}")
+    module.output_filename = os.path.join(results_dir, f"{module.PIPELINE}_{os.path.basename(module.output_filename)}")
+
+
+class PipelineContext:
+    """State shared by the stages of one run: arguments, results directory, log and thread pool."""
+
+    def __init__(self, args):
+        self.args = args
+        self.results_dir = args.results_dir
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.log_file = os.path.join(self.results_dir, "pipeline_log.txt")
+        self.modules = {}
+        self._executor = None
+        # Page snapshots written by scrape and read by company-info (None with --no_snapshots)
+        self.snapshot_dir = None if args.no_snapshots else os.path.join(self.results_dir, "snapshots")
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(self.log_file, "a") as f:
+            f.write(f"[{timestamp}] {message}\n")
+        print(message)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            workers = self.args.workers or multiprocessing.cpu_count()
+            self.log(f"Using {workers} workers")
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+        return self._executor
+
+    def module(self, name):
+        # Imports a pipeline script on first use and wires it to this run's directory and settings
+        if name not in self.modules:
+            module = importlib.import_module(name)
+            use_results_dir(module, self.results_dir)
+            configure_routing(self.args, routers=[module.model_router])
+            self.modules[name] = module
+        return self.modules[name]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def _split_spec(spec):
+    # "csv:path/to/file.csv" -> ("csv", "path/to/file.csv"); "snowflake" -> ("snowflake", "")
+    kind, _, value = spec.partition(":")
+    return kind, value
+
+
+# Sources: (context, argument) -> DataFrame
+
+def read_csv_source(ctx, path):
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(path, encoding="utf-8", low_memory=False)
+    except UnicodeDecodeError:
+        import chardet
+
+        with open(path, "rb") as f:
+            encoding = chardet.detect(f.read())["encoding"]
+        ctx.log(f"{path} is not UTF-8; reading it as {encoding}")
+        df = pd.read_csv(path, encoding=encoding, low_memory=False)
+    return df
+
+
+def directory_source(ctx, path):
+    import glob
+    import pandas as pd
+
+    paths = sorted(glob.glob(os.path.join(path, "*.txt")))
+    return pd.DataFrame({"path": paths})
+
+
+def url_list_source(ctx, path):
+    import pandas as pd
+
+    with open(path, encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return pd.DataFrame({"url": urls})
+
+
+def snowflake_source(ctx, _):
+    import pandas as pd
+
+    return pd.DataFrame({"url": ctx.module("notebook").get_urls_from_snowflake()})
+
+
+SOURCES = {
+    "csv": read_csv_source,
+    "dir": directory_source,
+    "urls": url_list_source,
+    "snowflake": snowflake_source,
+}
+
+
+# Transforms: (context, DataFrame) -> DataFrame
+
+def bios_transform(ctx, df):
+    bios = ctx.module("bios")
+    return bios.generate_bios(df, batch_size=ctx.args.batch_size, executor=ctx.executor,
+                              template_threshold=ctx.args.template_threshold)
+
+
+def contacts_transform(ctx, df):
+    import pandas as pd
+
+    aaron = ctx.module("aaron")
+    contacts = aaron.select_contacts(aaron.clean_contacts(df), top_k=ctx.args.top_k)
+    return contacts if contacts is not None else pd.DataFrame(columns=aaron.OUTPUT_COLUMNS)
+
+
+def company_info_transform(ctx, df):
+    import pandas as pd
+
+    notebook = ctx.module("notebook")
+    notebook.context_budget = ctx.args.context_budget
+    if "path" in df.columns:
+        company_info = notebook.process_input_files(df["path"].tolist(), executor=ctx.executor)
+    elif "url" in df.columns:
+        notebook.input_dir = os.path.join(ctx.results_dir, "downloads")
+        os.makedirs(notebook.input_dir, exist_ok=True)
+        company_info = notebook.process_urls(df["url"].tolist(), executor=ctx.executor)
+    elif "SCRAPED_CONTENT" in df.columns:
+        rows = df[df["SCRAPED_CONTENT"].fillna("") != ""]
+        company_info = notebook.process_texts(list(zip(rows["SOURCE"], rows["SCRAPED_CONTENT"])), executor=ctx.executor)
+    elif "TEXT_SNAPSHOT" in df.columns:
+        from snapshot_store import SnapshotStore
+
+        # Texts are read from the scrape step's snapshots as the extraction window frees up
+        store = SnapshotStore(ctx.snapshot_dir)
+        rows = df[df["TEXT_SNAPSHOT"].fillna("") != ""]
+        try:
+            company_info = notebook.process_texts(
+                ((source, store.get(ref)) for source, ref in zip(rows["SOURCE"], rows["TEXT_SNAPSHOT"])),
+                executor=ctx.executor)
+        finally:
+            store.close()
+    else:
+        raise ValueError("company-info needs a path, url, SCRAPED_CONTENT or TEXT_SNAPSHOT column")
+    return pd.DataFrame(company_info)
+
+
+def scrape_transform(ctx, df):
+    import pandas as pd
+
+    scraper = ctx.module("webscraping_anthropic")
+    scraper.output_file_path = os.path.join(ctx.results_dir, "scraper_partial.csv")
+    scraper.setup_logging()
+    if "SOURCE" not in df.columns and "url" in df.columns:
+        df = pd.DataFrame({"TASK_ID": range(1, len(df) + 1), "SOURCE": df["url"], "ARTICLE TITLE": ""})
+    args = ctx.args
+    # The scraper paces itself per host, so it runs its own fetch threads rather than the shared pool;
+    # --reextract parses and extracts from the snapshots of an earlier run instead
+    results = (scraper.reextract_rows if args.reextract else scraper.scrape_rows)(
+        df, parse_workers=args.parse_workers, max_content_tokens=args.max_content_tokens,
+        dedup_path=None if args.no_dedup else os.path.join(ctx.results_dir, "dedup_index.sqlite"),
+        num_workers=args.scrape_workers, per_host_workers=args.per_host_workers, host_delay=args.host_delay,
+        respect_robots=not args.ignore_robots, snapshot_dir=ctx.snapshot_dir)
+    return pd.DataFrame(results)
+
+
+TRANSFORMS = {
+    "scrape": scrape_transform,
+    "bios": bios_transform,
+    "contacts": contacts_transform,
+    "company-info": company_info_transform,
+}
+
+
+# Sinks: (context, DataFrame, argument, name) -> list of files written
+
+def file_sink(ctx, df, path, name):
+    base_path = path or os.path.join(ctx.results_dir, f"{name}.xlsx")
+    return write_results(df, base_path, output_format=ctx.args.output_format, excel=ctx.args.excel,
+                         sheet_name="Results", log=ctx.log)
+
+
+def jsonl_sink(ctx, df, path, name):
+    path = path or os.path.join(ctx.results_dir, f"{name}.jsonl")
+    df.to_json(path, orient="records", lines=True, force_ascii=False)
+    ctx.log(f"Wrote {len(df)} rows to {path}")
+    return [path]
+
+
+SINKS = {
+    "file": file_sink,
+    "jsonl": jsonl_sink,
+}
+
+
+def read_source(ctx, source):
+    kind, value = _split_spec(source)
+    with time_stage(PIPELINE, f"source_{kind}"):
+        df = SOURCES[kind](ctx, value)
+    if ctx.args.max_rows:
+        df = df.iloc[:ctx.args.max_rows]
+    ctx.log(f"Read {len(df)} rows from {source}")
+    return df
+
+
+def apply_transforms(ctx, df, transforms):
+    for name in transforms:
+        ctx.log(f"Running {name} on {len(df)} rows")
+        with time_stage(PIPELINE, name):
+            df = TRANSFORMS[name](ctx, df)
+        ctx.log(f"{name} produced {len(df)} rows")
+    return df
+
+
+def write_sinks(ctx, df, sinks, transforms):
+    written = []
+    for sink in sinks:
+        kind, value = _split_spec(sink)
+        with time_stage(PIPELINE, "write"):
+            written.extend(SINKS[kind](ctx, df, value, transforms[-1].replace("-", "_")))
+    ctx.log(f"\nProcessing complete. Results saved to {', '.join(written)}")
+    return written
+
+
+def run(ctx, source, transforms, sinks):
+    df = apply_transforms(ctx, read_source(ctx, source), transforms)
+    write_sinks(ctx, df, sinks, transforms)
+    return df
+
+
+# Distributed runs
+
+# Column whose rows must stay in one work unit, by first transform (contacts ranks a company's rows together)
+UNIT_KEYS = {
+    "scrape": "TASK_ID",
+    "bios": "PROFILE_ID",
+    "contacts": "COMPANY_ID",
+}
+
+
+def split_units(df, key_column, unit_size):
+    """Yields (label, rows) work units of unit_size keys each (or unit_size rows without a key column)."""
+    import numpy as np
+    import pandas as pd
+
+    if key_column not in df.columns:
+        for start in range(0, len(df), unit_size):
+            yield f"rows {start}-{min(start + unit_size, len(df)) - 1}", df.iloc[start:start + unit_size]
+        return
+
+    codes, keys = pd.factorize(df[key_column].astype(str))
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    for start in range(0, len(keys), unit_size):
+        end = min(start + unit_size, len(keys))
+        low, high = np.searchsorted(sorted_codes, [start, end])
+        label = f"{key_column} {keys[start]}" + (f"..{keys[end - 1]} ({end - start} keys)" if end - start > 1 else "")
+        yield label, df.iloc[np.sort(order[low:high])]
+
+
+def frame_to_payload(df):
+    return df.to_json(orient="split", date_format="iso", default_handler=str, force_ascii=False)
+
+
+def payload_to_frame(payload):
+    import pandas as pd
+
+    # dtype=False keeps JSON types as they are, so IDs like "00123" stay strings
+    return pd.read_json(io.StringIO(payload), orient="split", dtype=False)
+
+
+def work(ctx, queue, job, transforms, poll_interval=5.0):
+    """Leases and processes units until none is pending or leased anywhere."""
+    while True:
+        lease = queue.claim(job)
+        if lease is None:
+            counts = queue.counts(job)
+            set_queue_depth(PIPELINE, "units", counts["pending"] + counts["leased"])
+            if counts["leased"] == 0 and counts["pending"] == 0:
+                return
+            # Units leased by other workers come back here if their leases expire
+            time.sleep(poll_interval)
+            continue
+
+        ctx.log(f"Leased {lease.label} (attempt {lease.attempt})")
+        with queue.keep_alive(lease, log=ctx.log):
+            try:
+                df = apply_transforms(ctx, payload_to_frame(lease.payload), transforms)
+            except Exception as e:
+                ctx.log(f"Failed {lease.label}: {str(e)}")
+                queue.fail(lease, e)
+                continue
+        if queue.complete(lease, frame_to_payload(df)):
+            ctx.log(f"Completed {lease.label}: {len(df)} rows")
+        else:
+            ctx.log(f"Discarded the result for {lease.label}: its lease expired and it was requeued")
+
+
+def reduce_job(ctx, queue, job, sinks, transforms):
+    """Merges the finished units' results, in source order, into the sinks."""
+    import pandas as pd
+
+    frames = [payload_to_frame(result) for _, result in queue.results(job)]
+    for label, error in queue.failures(job):
+        ctx.log(f"Warning: {label} failed after {queue.max_attempts} attempts and is missing from the results: {error}")
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    ctx.log(f"Merged {len(frames)} units into {len(df)} rows")
+    write_sinks(ctx, df, sinks, transforms)
+    return df
+
+
+def run_distributed(ctx, queue, job, source, transforms, sinks):
+    if ctx.args.reduce_only and not queue.has_job(job):
+        ctx.log(f"Job {job!r} is not in {queue.path}")
+        return None
+    reduced = queue.reduced(job)
+    if reduced and not ctx.args.reduce_only:
+        worker, reduced_at = reduced
+        ctx.log(f"Job {job!r} is already complete: {worker} merged its results at "
+                f"{datetime.fromtimestamp(reduced_at):%Y-%m-%d %H:%M:%S}. Run with --reduce_only to write them "
+                f"again, or with a new --job name to process the source afresh")
+        return None
+    if not queue.has_job(job):
+        df = read_source(ctx, source)
+        units = split_units(df, UNIT_KEYS.get(transforms[0]), ctx.args.unit_size)
+        added = queue.enqueue(job, ((label, frame_to_payload(rows)) for label, rows in units))
+        if added:
+            ctx.log(f"Enqueued job {job!r} as {added} units")
+
+    if not ctx.args.reduce_only:
+        work(ctx, queue, job, transforms)
+
+    counts = queue.counts(job)
+    ctx.log(f"Job {job!r}: {counts['done']} units done, {counts['failed']} failed, "
+            f"{counts['pending'] + counts['leased']} remaining")
+    if counts["pending"] or counts["leased"]:
+        ctx.log("Job is not finished yet; run with --reduce_only again once the workers are done")
+        return None
+    if ctx.args.reduce_only or queue.claim_reduce(job):
+        return reduce_job(ctx, queue, job, sinks, transforms)
+    ctx.log("Another worker is merging the results")
+    return None
+
+
+def _check_spec(registry, label):
+    def check(spec):
+        if _split_spec(spec)[0] not in registry:
+            raise argparse.ArgumentTypeError(f"unknown {label} {spec!r} (choose from {', '.join(registry)})")
+        return spec
+    return check
+
+
+def _context_budget(value):
+    # notebook.context_budget_arg without importing notebook at startup; 1000 is notebook.CHUNK_OVERLAP
+    budget = int(value)
+    if budget <= 1000:
+        raise argparse.ArgumentTypeError("must be larger than the 1000-token chunk overlap")
+    return budget
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a source -> transforms -> sinks pipeline")
+    parser.add_argument("transforms", nargs="+", choices=list(TRANSFORMS), help="Transforms, applied in order")
+    parser.add_argument("--source", required=True, type=_check_spec(SOURCES, "source"),
+                        help="csv:PATH, dir:PATH (.txt files), urls:PATH (one URL per line) or snowflake")
+    parser.add_argument("--sink", action="append", type=_check_spec(SINKS, "sink"),
+                        help="file[:BASE_PATH] (--output_format plus Excel sidecar) or jsonl[:PATH]; repeatable "
+                             "(default: file)")
+    parser.add_argument("--results_dir", default=DEFAULT_RESULTS_DIR, help="Directory for logs and results")
+    parser.add_argument("--max_rows", type=int, help="Maximum number of source rows to process")
+    parser.add_argument("--workers", type=int, help="Threads shared by all transforms (default: CPU count)")
+
+    bios_group = parser.add_argument_group("bios")
+    bios_group.add_argument("--batch_size", type=int, default=1,
+                            help="Profiles packed into one generation request (1 sends each profile on its own)")
+    bios_group.add_argument("--template_threshold", type=int, default=4,
+                            help="Render a template bio for profiles with fewer detail fields than this (0: never)")
+
+    contacts_group = parser.add_argument_group("contacts")
+    contacts_group.add_argument("--top_k", type=int, default=25,
+                                help="Contacts per company sent to the model after local title scoring (0: send all)")
+
+    company_info_group = parser.add_argument_group("company-info")
+    company_info_group.add_argument("--context_budget", type=_context_budget, default=150000,
+                                    help="Tokens of document text sent in one request; longer documents are chunked "
+                                         "to this size")
+
+    queue_group = parser.add_argument_group("distributed")
+    queue_group.add_argument("--queue", help="SQLite job queue shared by all workers; enables distributed mode")
+    queue_group.add_argument("--job", help="Job name in the queue (default: derived from the source and transforms)")
+    queue_group.add_argument("--worker_id", help="Name of this worker in the queue (default: HOSTNAME-PID)")
+    queue_group.add_argument("--unit_size", type=int, default=20,
+                             help="Keys (TASK_ID, PROFILE_ID or COMPANY_ID) or rows per work unit")
+    queue_group.add_argument("--lease_seconds", type=float, default=300.0,
+                             help="Seconds a worker may go without a heartbeat before its unit is requeued")
+    queue_group.add_argument("--max_attempts", type=int, default=3, help="Claims of one unit before it is marked failed")
+    queue_group.add_argument("--reduce_only", action="store_true",
+                             help="Do not process units; merge the finished job's results into the sinks")
+
+    scrape_group = parser.add_argument_group("scrape")
+    scrape_group.add_argument("--scrape_workers", type=int, default=5, help="Scraping threads")
+    scrape_group.add_argument("--parse_workers", type=int, help="Processes used for HTML parsing (default: CPU count)")
+    scrape_group.add_argument("--max_content_tokens", type=int, default=DEFAULT_TOKEN_BUDGET,
+                              help="Token budget for the article text sent to the model")
+    scrape_group.add_argument("--no_dedup", action="store_true", help="Scrape and extract every row, even duplicates")
+    scrape_group.add_argument("--no_snapshots", action="store_true",
+                              help="Keep no page snapshots and carry the full SCRAPED_CONTENT between steps")
+    scrape_group.add_argument("--reextract", action="store_true",
+                              help="Parse and extract again from the snapshots of an earlier run, without fetching")
+    scrape_group.add_argument("--per_host_workers", type=int, default=2, help="Maximum concurrent fetches per host")
+    scrape_group.add_argument("--host_delay", type=float, default=0.0,
+                              help="Minimum seconds between fetches from one host")
+    scrape_group.add_argument("--ignore_robots", action="store_true", help="Do not read crawl delays from robots.txt")
+
+    add_output_arguments(parser)
+    add_metrics_arguments(parser)
+    add_retry_arguments(parser)
+    add_routing_arguments(parser)
+    add_streaming_arguments(parser)
+    add_hedging_arguments(parser)
+    add_engine_arguments(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    ctx = PipelineContext(args)
+
+    start_metrics(args, log=ctx.log)
+    configure_retries(args)
+    configure_routing(args)
+    configure_streaming(args)
+    configure_hedging(args)
+    configure_engine(args)
+    queue = None
+    try:
+        if args.queue:
+            queue = JobQueue(args.queue, worker_id=args.worker_id or default_worker_id(),
+                             lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+            job = args.job or f"{'+'.join(args.transforms)}:{args.source}"
+            run_distributed(ctx, queue, job, args.source, args.transforms, args.sink or ["file"])
+        else:
+            run(ctx, args.source, args.transforms, args.sink or ["file"])
+    except KeyboardInterrupt:
+        ctx.log("Pipeline interrupted by user.")
+    except Exception as e:
+        ctx.log(f"An error occurred: {str(e)}")
+    finally:
+        if queue is not None:
+            queue.close()
+        ctx.close()
+        finish_metrics(args, log=ctx.log)
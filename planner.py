@@ -0,0 +1,197 @@
+import json
+import os
+import re
+
+from metrics import calculate_cost
+from text_reduction import estimate_tokens
+
+# Per-call latency model: time to the first token plus the output at this rate, scaled to the mean
+# call time of earlier runs when --plan_history is given
+FIRST_TOKEN_SECONDS = 1.0
+OUTPUT_TOKENS_PER_SECOND = 60.0
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Prompt tokens counted locally with tiktoken's cl100k_base, a close stand-in for Claude's tokenizer.
+
+    Falls back to the characters-per-token estimate when tiktoken or its encoding file is unavailable.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding is False:
+        return estimate_tokens(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def tokenizer_name():
+    count_tokens("")
+    return "tiktoken cl100k_base" if _encoding else "character estimate"
+
+
+def read_history(paths, pipeline):
+    """Totals for pipeline from the OpenMetrics files of earlier runs (written with --metrics_file).
+
+    Returns {"stages": {stage: (count, seconds)}, "calls", "input_tokens", "output_tokens", "retries"};
+    files that do not exist are skipped.
+    """
+    history = {"stages": {}, "calls": 0.0, "input_tokens": 0.0, "output_tokens": 0.0, "retries": 0.0}
+    for path in paths or ():
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                match = _SAMPLE.match(line.strip())
+                if not match:
+                    continue
+                name, labels, value = match.group(1), dict(_LABEL.findall(match.group(2))), float(match.group(3))
+                if labels.get("pipeline") != pipeline:
+                    continue
+                if name in ("pipeline_stage_seconds_count", "pipeline_stage_seconds_sum"):
+                    count, seconds = history["stages"].get(labels["stage"], (0.0, 0.0))
+                    if name.endswith("_count"):
+                        count += value
+                    else:
+                        seconds += value
+                    history["stages"][labels["stage"]] = (count, seconds)
+                elif name == "llm_calls_total":
+                    history["calls"] += value
+                elif name == "llm_tokens_total":
+                    history[f"{labels['direction']}_tokens"] += value
+                elif name == "pipeline_retries_total":
+                    history["retries"] += value
+    return history
+
+
+class Plan:
+    """Calls, tokens, cost and wall time a run would take, added up without calling the API.
+
+    The scripts walk their input with the same grouping, batching and chunking as a real run and
+    add(task, model, input_tokens, output_tokens) for every request it would send; skip(reason, count)
+    records work that needs no request. estimate() turns the totals into dollars and wall time.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.items = 0
+        self.tasks = {}
+        self.skipped = {}
+        # (task, model) -> [input tokens, output tokens], priced per model
+        self.by_model = {}
+
+    def add(self, task, model, input_tokens, output_tokens):
+        totals = self.tasks.setdefault(task, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "models": {}})
+        totals["calls"] += 1
+        totals["input_tokens"] += input_tokens
+        totals["output_tokens"] += output_tokens
+        totals["models"][model] = totals["models"].get(model, 0) + 1
+        tokens = self.by_model.setdefault((task, model), [0, 0])
+        tokens[0] += input_tokens
+        tokens[1] += output_tokens
+
+    def skip(self, reason, count=1):
+        self.skipped[reason] = self.skipped.get(reason, 0) + count
+
+    def estimate(self, concurrency, history=None, rpm=None, input_tpm=None, output_tpm=None):
+        history = history or read_history((), self.pipeline)
+        calls = sum(totals["calls"] for totals in self.tasks.values())
+        input_tokens = sum(totals["input_tokens"] for totals in self.tasks.values())
+        output_tokens = sum(totals["output_tokens"] for totals in self.tasks.values())
+        cost = sum(sum(calculate_cost(model, inputs, outputs)) for (_, model), (inputs, outputs) in self.by_model.items())
+
+        # Earlier runs scale the default latency model to their mean call time and give the share of retried calls
+        latency_scale = 1.0
+        api_count, api_seconds = history["stages"].get("api", (0, 0.0))
+        if api_count and history["calls"]:
+            mean_output = history["output_tokens"] / history["calls"]
+            latency_scale = (api_seconds / api_count) / (FIRST_TOKEN_SECONDS + mean_output / OUTPUT_TOKENS_PER_SECOND)
+        # Retries (429s, 5xx, timeouts) add calls and wall time, but no billed tokens
+        retry_share = history["retries"] / history["calls"] if history["calls"] else 0.0
+        call_factor = 1.0 + retry_share
+
+        request_seconds = (calls * FIRST_TOKEN_SECONDS + output_tokens / OUTPUT_TOKENS_PER_SECOND) * latency_scale
+        request_seconds *= call_factor
+        bounds = {"concurrency": request_seconds / max(concurrency, 1)}
+        if rpm:
+            bounds["requests per minute"] = 60.0 * calls * call_factor / rpm
+        if input_tpm:
+            bounds["input tokens per minute"] = 60.0 * input_tokens * call_factor / input_tpm
+        if output_tpm:
+            bounds["output tokens per minute"] = 60.0 * output_tokens * call_factor / output_tpm
+        bottleneck = max(bounds, key=bounds.get)
+
+        # Local stages (parse, validate, write, ...) scale with the calls of the earlier runs
+        local_seconds = 0.0
+        if history["calls"]:
+            local_seconds = sum(seconds for stage, (_, seconds) in history["stages"].items() if stage != "api")
+            local_seconds *= calls / history["calls"]
+
+        return {
+            "pipeline": self.pipeline,
+            "items": self.items,
+            "tokenizer": tokenizer_name(),
+            "calls": calls,
+            "expected_retries": round(calls * retry_share, 1),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_dollars": round(cost, 4),
+            "tasks": self.tasks,
+            "skipped": dict(self.skipped),
+            "concurrency": concurrency,
+            "latency_scale": round(latency_scale, 3),
+            "calibrated": bool(api_count),
+            "wall_seconds": round(bounds[bottleneck] + local_seconds, 1),
+            "bottleneck": bottleneck,
+        }
+
+    def report(self, path, concurrency, history_paths=None, rpm=None, input_tpm=None, output_tpm=None, log=print):
+        """Logs the estimate and writes it to path as JSON; history_paths are --plan_history files."""
+        history = read_history(history_paths, self.pipeline)
+        estimate = self.estimate(concurrency, history, rpm=rpm, input_tpm=input_tpm, output_tpm=output_tpm)
+        log(f"Plan for {estimate['pipeline']}: {estimate['items']} input rows, no API calls made")
+        for task, totals in estimate["tasks"].items():
+            models = ", ".join(f"{model} x{count}" for model, count in totals["models"].items())
+            log(f"  {task}: {totals['calls']} calls, {totals['input_tokens']} input tokens "
+                f"({estimate['tokenizer']}), ~{totals['output_tokens']} output tokens on {models}")
+        for reason, count in estimate["skipped"].items():
+            log(f"  {reason}: {count} (no API call)")
+        log(f"  Total: {estimate['calls']} calls (+{estimate['expected_retries']} expected retries), "
+            f"{estimate['input_tokens']} input / ~{estimate['output_tokens']} output tokens, "
+            f"~${estimate['cost_dollars']:.2f}")
+        latency = (f"latency x{estimate['latency_scale']} of the default, from earlier runs" if estimate["calibrated"]
+                   else "default latency, no --plan_history")
+        log(f"  Wall time: ~{estimate['wall_seconds'] / 60:.1f} min, bound by {estimate['bottleneck']} "
+            f"({estimate['concurrency']} in flight, {latency})")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(estimate, f, indent=2)
+        log(f"Plan written to {path}")
+        return estimate
+
+
+def add_plan_arguments(parser):
+    parser.add_argument("--plan", action="store_true",
+                        help="Estimate calls, tokens, cost and wall time for the input without calling the API")
+    parser.add_argument("--plan_history", nargs="+", metavar="METRICS_FILE",
+                        help="--metrics_file outputs of earlier runs to calibrate latency and retries on")
+    parser.add_argument("--rpm", type=float, help="Requests per minute allowed by the API rate limit (for --plan)")
+    parser.add_argument("--input_tpm", type=float, help="Input tokens per minute rate limit (for --plan)")
+    parser.add_argument("--output_tpm", type=float, help="Output tokens per minute rate limit (for --plan)")
+    return parser
+
+
+def plan_options(args):
+    # Keyword arguments of Plan.report from the parsed --plan flags
+    return {"history_paths": args.plan_history, "rpm": args.rpm, "input_tpm": args.input_tpm,
+            "output_tpm": args.output_tpm}
@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager, nullcontext
+from xml.sax.saxutils import escape
+
+DEFAULT_INTERVAL_MS = 10.0
+
+# Leaf frames of threads parked on a lock, queue or condition; these samples are idle time, not work
+IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select")}
+
+FLAMEGRAPH_WIDTH = 1200
+FLAMEGRAPH_ROW_HEIGHT = 16
+# Frames narrower than this many pixels are left out of the SVG (they stay in the folded stacks)
+FLAMEGRAPH_MIN_WIDTH = 0.5
+
+# The profiler of this process while --profile is active
+active = None
+
+
+def _short_path(path):
+    # site-packages/anthropic/_client.py -> anthropic/_client.py; repo files keep their base name
+    marker = path.rfind("site-packages")
+    if marker != -1:
+        return path[marker + len("site-packages") + 1:]
+    return os.path.basename(path)
+
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread at a fixed interval and times named spans.
+
+    Each sample is folded into "thread;span;span;frame;frame" with the spans open on that thread at
+    the time, so the flamegraph splits by pipeline stage before it splits by function. Spans also
+    record wall and CPU (thread) time for the per-stage summary.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL_MS / 1000.0, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = {}
+        self.idle_samples = 0
+        self.span_stacks = {}
+        self.span_totals = {}
+        self.lock = threading.Lock()
+        self.frame_names = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def _frame_name(self, code):
+        name = self.frame_names.get(code)
+        if name is None:
+            name = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self.frame_names[code] = name
+        return name
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            threads = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in IDLE_LEAVES and not self.include_idle:
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                # Pool threads are numbered per thread; folding them together keeps one tower per pool
+                thread_name = re.sub(r"_\d+$", "", threads.get(thread_id, "thread"))
+                spans = tuple(self.span_stacks.get(thread_id, ()))
+                key = (thread_name, *spans, *stack)
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    @contextmanager
+    def span(self, name):
+        thread_id = threading.get_ident()
+        stack = self.span_stacks.setdefault(thread_id, [])
+        stack.append(f"[{name}]")
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            with self.lock:
+                count, wall_total, cpu_total = self.span_totals.get(name, (0, 0.0, 0.0))
+                self.span_totals[name] = (count + 1, wall_total + wall, cpu_total + cpu)
+
+    def folded(self):
+        # Brendan Gregg's folded format, read by flamegraph.pl, inferno and speedscope
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.samples.items()))
+
+    def speedscope(self, name):
+        frames = []
+        frame_index = {}
+        samples = []
+        weights = []
+        for stack, count in sorted(self.samples.items()):
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame})
+                indices.append(frame_index[frame])
+            samples.append(indices)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": name, "unit": "seconds", "startValue": 0,
+                "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+            "name": name,
+            "activeProfileIndex": 0,
+            "exporter": "profiling.py",
+        }
+
+    def flamegraph_svg(self, title):
+        root = {"count": 0, "children": {}}
+        for stack, count in self.samples.items():
+            node = root
+            node["count"] += count
+            for frame in stack:
+                node = node["children"].setdefault(frame, {"count": 0, "children": {}})
+                node["count"] += count
+        depth = _tree_depth(root)
+        height = (depth + 2) * FLAMEGRAPH_ROW_HEIGHT
+        scale = FLAMEGRAPH_WIDTH / root["count"] if root["count"] else 0
+        rects = []
+
+        def draw(node, x, level):
+            for name, child in sorted(node["children"].items()):
+                width = child["count"] * scale
+                if width >= FLAMEGRAPH_MIN_WIDTH:
+                    y = height - (level + 2) * FLAMEGRAPH_ROW_HEIGHT
+                    share = 100.0 * child["count"] / root["count"]
+                    hue = zlib.crc32(name.encode("utf-8")) % 60
+                    label = escape(name[:max(int(width / 7) - 1, 0)]) if width > 21 else ""
+                    rects.append(
+                        f'<g><title>{escape(name)} ({child["count"]} samples, {share:.1f}%)</title>'
+                        f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FLAMEGRAPH_ROW_HEIGHT - 1}" '
+                        f'fill="hsl({hue},85%,60%)"/>'
+                        f'<text x="{x + 3:.1f}" y="{y + FLAMEGRAPH_ROW_HEIGHT - 4}">{label}</text></g>')
+                    draw(child, x, level + 1)
+                x += width
+
+        draw(root, 0.0, 0)
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAMEGRAPH_WIDTH}" height="{height}" '
+                f'font-family="monospace" font-size="11">'
+                f'<text x="4" y="12">{escape(title)}: {root["count"]} samples every {self.interval * 1000:.0f}ms</text>'
+                + "".join(rects) + "</svg>\n")
+
+    def summary(self):
+        # (span, count, wall seconds, CPU seconds), most wall time first
+        with self.lock:
+            rows = [(name, *totals) for name, totals in self.span_totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def write(self, prefix, log=print):
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        name = os.path.basename(prefix)
+        written = []
+        with open(f"{prefix}.folded", "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        written.append(f"{prefix}.folded")
+        with open(f"{prefix}.svg", "w", encoding="utf-8") as f:
+            f.write(self.flamegraph_svg(name))
+        written.append(f"{prefix}.svg")
+        with open(f"{prefix}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(name), f)
+        written.append(f"{prefix}.speedscope.json")
+
+        lines = [f"Profiled {self.elapsed:.2f}s: {sum(self.samples.values())} samples, "
+                 f"{self.idle_samples} idle samples skipped",
+                 f"{'span':40} {'count':>7} {'wall_s':>10} {'cpu_s':>10} {'cpu%':>6}"]
+        for span, count, wall, cpu in self.summary():
+            lines.append(f"{span:40} {count:7d} {wall:10.3f} {cpu:10.3f} {100.0 * cpu / wall if wall else 0:6.1f}")
+        with open(f"{prefix}.summary.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        written.append(f"{prefix}.summary.txt")
+
+        for line in lines:
+            log(line)
+        log(f"Profile written to {', '.join(written)}")
+        return written
+
+
+def _tree_depth(node):
+    return 1 + max((_tree_depth(child) for child in node["children"].values()), default=0) if node["children"] else 0
+
+
+def span(name):
+    """Names a region of work in the profile; free when profiling is off."""
+    if active is None:
+        return nullcontext()
+    return active.span(name)
+
+
+def start_profiling(interval=DEFAULT_INTERVAL_MS / 1000.0, include_idle=False):
+    global active
+    active = SamplingProfiler(interval=interval, include_idle=include_idle).start()
+    return active
+
+
+def finish_profiling(prefix, log=print):
+    global active
+    if active is None:
+        return []
+    profiler, active = active, None
+    profiler.stop()
+    return profiler.write(prefix, log=log)
@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+
+from metrics import record_retry, record_retry_denied
+
+# Error classes, each with its own retry budget and backoff
+RATE_LIMIT = "rate_limit"
+OVERLOADED = "overloaded"
+TIMEOUT = "timeout"
+NETWORK = "network"
+VALIDATION = "validation"
+FATAL = "fatal"
+
+# error class -> (max retries, base delay seconds, max delay seconds)
+DEFAULT_RULES = {
+    RATE_LIMIT: (6, 2.0, 60.0),
+    OVERLOADED: (5, 5.0, 120.0),
+    TIMEOUT: (3, 1.0, 30.0),
+    NETWORK: (4, 1.0, 30.0),
+    # A parse/validation failure usually repeats on the same prompt, so it gets one immediate re-ask
+    VALIDATION: (1, 0.0, 0.0),
+    FATAL: (0, 0.0, 0.0),
+}
+
+# Exception class names (anywhere in the MRO) for each error class, so anthropic, requests and
+# selenium errors can be classified without importing those packages here
+_CLASS_NAMES = [
+    (RATE_LIMIT, {"RateLimitError"}),
+    (OVERLOADED, {"OverloadedError", "InternalServerError", "ServiceUnavailableError"}),
+    (TIMEOUT, {"APITimeoutError", "Timeout", "TimeoutError", "TimeoutException", "ReadTimeout", "ConnectTimeout"}),
+    (NETWORK, {"APIConnectionError", "ConnectionError", "ChunkedEncodingError", "WebDriverException"}),
+    (VALIDATION, {"ValidationError", "JSONDecodeError"}),
+]
+
+
+class ValidationError(ValueError):
+    """Raised by a retried operation when the model's response cannot be parsed or fails validation."""
+
+
+def classify_error(exc):
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429:
+        return RATE_LIMIT
+    if status == 408:
+        return TIMEOUT
+    if status is not None and (status == 529 or status >= 500):
+        return OVERLOADED
+    # Timeout classes subclass connection errors in several libraries, so they are checked first
+    for error_class, class_names in _CLASS_NAMES:
+        if names & class_names:
+            return error_class
+    return FATAL
+
+
+def retry_after(exc):
+    # Server-suggested delay in seconds from Retry-After / retry-after-ms, if present
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class RetryBudget:
+    """Process-wide token bucket capping retries at a fraction of calls.
+
+    Every first attempt deposits `ratio` tokens and every retry spends one, so during an outage the
+    retries add at most `ratio` extra load instead of multiplying it by the per-class retry counts.
+    """
+
+    def __init__(self, ratio=0.2, initial=10.0, max_tokens=100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = initial
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+GLOBAL_BUDGET = RetryBudget()
+
+
+class RetryPolicy:
+    """Retries an operation with per-class budgets and full-jitter exponential backoff.
+
+    policy.call(fn, *args, stage="api", description="...", **kwargs) returns fn's result or raises
+    the last error once its class budget (or the global retry budget) is exhausted.
+    """
+
+    def __init__(self, pipeline, rules=None, budget=None, log=print, sleep=time.sleep):
+        self.pipeline = pipeline
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.budget = budget or GLOBAL_BUDGET
+        self.log = log
+        self.sleep = sleep
+        self.rng = random.Random()
+
+    def backoff(self, error_class, retry_number, exc=None):
+        suggested = retry_after(exc) if exc is not None else None
+        if suggested is not None:
+            # The server knows when capacity frees up; a little jitter keeps workers from returning in lockstep
+            return suggested * (1.0 + self.rng.uniform(0, 0.2))
+        _, base, cap = self.rules[error_class]
+        return self.rng.uniform(0, min(cap, base * 2 ** retry_number))
+
+    def _retry_delay(self, e, retries, stage, description):
+        # Seconds to wait before retrying after e, counting the retry; re-raises e when it is out of budget
+        error_class = classify_error(e)
+        used = retries.get(error_class, 0)
+        if used >= self.rules[error_class][0]:
+            raise e
+        if not self.budget.withdraw():
+            record_retry_denied(self.pipeline, error_class)
+            self.log(f"Retry budget exhausted; not retrying {description or stage} after {error_class} error: {e}")
+            raise e
+        retries[error_class] = used + 1
+        delay = self.backoff(error_class, used, e)
+        record_retry(self.pipeline, stage, error_class)
+        self.log(f"Retrying {description or stage} after {error_class} error "
+                 f"({used + 1}/{self.rules[error_class][0]}) in {delay:.1f}s: {e}")
+        return delay
+
+    def call(self, fn, *args, stage="api", description="", **kwargs):
+        self.budget.deposit()
+        retries = {}
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, retries, stage, description)
+                if delay > 0:
+                    self.sleep(delay)
+
+    async def acall(self, fn, *args, stage="api", description="", **kwargs):
+        # call() for a coroutine function; the backoff waits without blocking the event loop
+        import asyncio
+
+        self.budget.deposit()
+        retries = {}
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, retries, stage, description)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+
+def add_retry_arguments(parser):
+    parser.add_argument("--retry_ratio", type=float, default=GLOBAL_BUDGET.ratio,
+                        help="Retries allowed per call across the run (caps retry storms during outages)")
+    return parser
+
+
+def configure_retries(args):
+    GLOBAL_BUDGET.ratio = getattr(args, "retry_ratio", GLOBAL_BUDGET.ratio)
@@ -0,0 +1,213 @@
+import collections
+import json
+import os
+import threading
+import time
+
+COMMANDS = ["pause", "resume", "toggle", "drain", "stop", "workers N", "max_rows N", "status"]
+
+
+class Cancelled(BaseException):
+    # BaseException (like KeyboardInterrupt) so the scraper's broad `except Exception` handlers let it through
+    pass
+
+
+class RunController:
+    """Live control of a scraper run.
+
+    Commands arrive from a control file (one per line, consumed when read) or from the SIGINT handler,
+    which only appends to a deque and therefore never blocks inside the signal handler. A background
+    thread applies them; workers observe the state at checkpoints between (and during) pipeline stages.
+
+      pause / resume / toggle  park workers at their next checkpoint, keeping in-flight progress
+      drain                    stop dispatching rows; in-flight rows finish and the run ends normally
+      stop                     cancel in-flight rows at their next checkpoint, then drain
+      workers N                grow or shrink the worker pool
+      max_rows N               start no more than N rows in total
+    """
+
+    def __init__(self, control_file=None, status_file=None, poll_interval=0.5, max_rows=None, workers=1, log=print):
+        self.control_file = control_file
+        self.status_file = status_file
+        self.poll_interval = poll_interval
+        self.max_rows = max_rows
+        self.target_workers = workers
+        self.log = log
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.paused = False
+        self.draining = False
+        self.cancelling = False
+        self.finished = False
+        self.dispatched = 0
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.resize_callbacks = []
+        self.thread = None
+
+    def request(self, command):
+        # Safe to call from a signal handler: deque.append takes no lock the interrupted thread might hold
+        self.pending.append(command)
+
+    def on_resize(self, callback):
+        self.resize_callbacks.append(callback)
+
+    def start(self):
+        if self.control_file and os.path.exists(self.control_file):
+            # Commands left over from an earlier run must not stop this one
+            self.log(f"Discarding stale control file {self.control_file}")
+            os.remove(self.control_file)
+        self.thread = threading.Thread(target=self._run, name="run-controller", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self._write_status()
+
+    def _run(self):
+        while not self.finished:
+            self._read_control_file()
+            while self.pending:
+                self.apply(self.pending.popleft())
+            self._write_status()
+            with self.condition:
+                self.condition.wait(self.poll_interval)
+
+    def _read_control_file(self):
+        if not self.control_file or not os.path.exists(self.control_file):
+            return
+        # Rename first so commands appended while we read are not lost
+        reading = f"{self.control_file}.reading"
+        try:
+            os.replace(self.control_file, reading)
+            with open(reading) as f:
+                lines = f.read().splitlines()
+            os.remove(reading)
+        except OSError as e:
+            self.log(f"Could not read control file {self.control_file}: {e}")
+            return
+        self.pending.extend(line.strip() for line in lines if line.strip() and not line.startswith("#"))
+
+    def apply(self, command):
+        name, _, argument = command.partition(" ")
+        name = name.lower()
+        with self.condition:
+            if name == "toggle":
+                name = "resume" if self.paused else "pause"
+            if name == "pause":
+                self.paused = True
+                self.log("Paused. Workers will stop at their next checkpoint. Press Ctrl+C again or send 'resume'.")
+            elif name == "resume":
+                self.paused = False
+                self.log("Resuming...")
+            elif name == "drain":
+                self.draining = True
+                self.paused = False
+                self.log("Draining: no new rows will be dispatched; in-flight rows will finish.")
+            elif name == "stop":
+                self.draining = True
+                self.cancelling = True
+                self.paused = False
+                self.log("Stopping: cancelling in-flight rows at their next checkpoint.")
+            elif name in ("workers", "max_rows"):
+                try:
+                    value = int(argument)
+                except ValueError:
+                    self.log(f"Ignoring control command '{command}': expected an integer")
+                    return
+                if name == "workers":
+                    self.target_workers = max(1, value)
+                    self.log(f"Resizing worker pool to {self.target_workers}")
+                else:
+                    self.max_rows = max(0, value)
+                    self.log(f"Limiting the run to {self.max_rows} rows")
+            elif name == "status":
+                self.log(f"Status: {json.dumps(self.status())}")
+            else:
+                self.log(f"Ignoring unknown control command '{command}'. Known commands: {', '.join(COMMANDS)}")
+                return
+            self.condition.notify_all()
+        if name == "workers":
+            for callback in self.resize_callbacks:
+                callback(self.target_workers)
+
+    def status(self):
+        return {
+            "paused": self.paused,
+            "draining": self.draining,
+            "cancelling": self.cancelling,
+            "workers": self.target_workers,
+            "max_rows": self.max_rows,
+            "dispatched": self.dispatched,
+            "started": self.started,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def _write_status(self):
+        if not self.status_file:
+            return
+        tmp_path = f"{self.status_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp_path, self.status_file)
+
+    def checkpoint(self):
+        # Called by workers between stages: blocks while paused, raises Cancelled once 'stop' was sent
+        with self.condition:
+            while self.paused and not self.cancelling and not self.finished:
+                self.condition.wait()
+            if self.cancelling:
+                raise Cancelled()
+
+    def check_cancelled(self):
+        # Non-blocking variant for use inside waits (e.g. WebDriverWait conditions)
+        if self.cancelling:
+            raise Cancelled()
+
+    def wait_while_paused(self):
+        with self.condition:
+            while self.paused and not self.draining and not self.finished:
+                self.condition.wait()
+
+    def can_dispatch(self):
+        if self.draining:
+            return False
+        return self.max_rows is None or self.dispatched < self.max_rows
+
+    def accepting(self):
+        return not self.draining and (self.max_rows is None or self.started < self.max_rows)
+
+    def try_start(self):
+        # Rows buffered before a drain/stop or a lowered max_rows are refused here, not just at dispatch
+        with self.condition:
+            if self.draining or (self.max_rows is not None and self.started >= self.max_rows):
+                self.skipped += 1
+                return False
+            self.started += 1
+            return True
+
+    def worker_should_exit(self, worker_index):
+        return self.finished or worker_index >= self.target_workers
+
+    def record_dispatched(self):
+        with self.condition:
+            self.dispatched += 1
+
+    def record_completed(self):
+        with self.condition:
+            self.completed += 1
+
+    def record_cancelled(self):
+        with self.condition:
+            self.cancelled += 1
+
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+
+# Blob file extension by codec; reads try every one, so a store written with either codec stays readable
+EXTENSIONS = {"zstd": ".zst", "zlib": ".zz"}
+
+
+def detect_codec():
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "zlib"
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class SnapshotStore:
+    """Content-addressed, compressed copies of fetched HTML and extracted text, plus a manifest of rows.
+
+    put(text) stores the text under the SHA-256 of its UTF-8 bytes and returns that hex digest as the
+    reference; storing the same text again is free. Blobs live in objects/<2 hex>/<digest><ext> under
+    root and are written atomically, so concurrent threads and processes can share a store. The
+    manifest (manifest.sqlite) maps each TASK_ID to the snapshots of its latest fetch.
+    """
+
+    def __init__(self, root, codec=None):
+        self.root = root
+        self.codec = codec or detect_codec()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "manifest.sqlite"), timeout=60, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                task_id TEXT NOT NULL,
+                source TEXT,
+                final_url TEXT,
+                title TEXT,
+                html_ref TEXT,
+                text_ref TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_task ON snapshots (task_id, id);
+        """)
+        self.conn.commit()
+
+    def _path(self, ref, codec):
+        return os.path.join(self.root, "objects", ref[:2], ref + EXTENSIONS[codec])
+
+    def put(self, text):
+        if not text:
+            return ""
+        data = text.encode("utf-8")
+        ref = hashlib.sha256(data).hexdigest()
+        if any(os.path.exists(self._path(ref, codec)) for codec in EXTENSIONS):
+            return ref
+        path = self._path(ref, self.codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_compress(data, self.codec))
+        os.replace(temp_path, path)
+        return ref
+
+    def get(self, ref):
+        if not ref:
+            return ""
+        for codec in EXTENSIONS:
+            path = self._path(ref, codec)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return _decompress(f.read(), codec).decode("utf-8")
+        raise KeyError(f"No snapshot {ref} in {self.root}")
+
+    def record(self, task_id, source, final_url, title, html_ref, text_ref):
+        with self.lock:
+            self.conn.execute("INSERT INTO snapshots (task_id, source, final_url, title, html_ref, text_ref, fetched_at) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (str(task_id), source, final_url, title, html_ref, text_ref, time.time()))
+            self.conn.commit()
+
+    def latest(self, task_id):
+        with self.lock:
+            row = self.conn.execute("SELECT source, final_url, title, html_ref, text_ref, fetched_at FROM snapshots "
+                                    "WHERE task_id = ? ORDER BY id DESC LIMIT 1", (str(task_id),)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("source", "final_url", "title", "html_ref", "text_ref", "fetched_at"), row))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,236 @@
+import copy
+import re
+import time
+from types import SimpleNamespace
+
+from hedging import HEDGER, request_deadline
+from metrics import record_api_usage, record_early_stop
+from profiling import span
+from retry_policy import ValidationError
+from text_reduction import estimate_tokens
+
+# Off by default; --stream turns it on for every create_message call that passes a monitor
+ENABLED = False
+
+
+class MalformedStream(ValidationError):
+    """The streamed output cannot match the expected structure; generation was aborted."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """A streamed call ran past its deadline; classified as a timeout and retried as one."""
+
+
+class JsonObjectMonitor:
+    """Complete once the top-level JSON object closes; malformed if the output does not start with '{'.
+
+    opening="[" does the same for a top-level JSON array.
+    """
+
+    def __init__(self, opening="{"):
+        self.opening = opening
+        self.position = 0
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        # Returns the end offset of the structure once it is complete, else None
+        for index in range(self.position, len(text)):
+            char = text[index]
+            if not self.started:
+                if char.isspace():
+                    continue
+                if char != self.opening:
+                    raise MalformedStream(f"Expected JSON starting with {self.opening!r}, got {text[:60]!r}")
+                self.started = True
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return index + 1
+        self.position = len(text)
+        return None
+
+
+class LabeledBlocksMonitor:
+    """Complete once `count` blocks have their final `last_label` line; malformed if `first_label`
+    has not appeared within `grace_chars` characters (e.g. a refusal or free-form prose)."""
+
+    def __init__(self, first_label, last_label, count=1, grace_chars=400):
+        self.first_label = first_label
+        self.count = count
+        self.grace_chars = grace_chars
+        self.last_line = re.compile(rf"^\s*{re.escape(last_label)}[^\n]*\n", re.MULTILINE)
+
+    def feed(self, text):
+        if self.first_label not in text:
+            if len(text) > self.grace_chars:
+                raise MalformedStream(f"No '{self.first_label}' in the first {self.grace_chars} characters")
+            return None
+        matches = list(self.last_line.finditer(text))
+        if len(matches) >= self.count:
+            # Stop before the newline that closed the last line
+            return matches[self.count - 1].end() - 1
+        return None
+
+
+class _StreamReader:
+    # Event handling shared by stream_message and astream_message
+
+    def __init__(self, monitor, pipeline, kwargs):
+        self.monitor = monitor
+        self.pipeline = pipeline
+        self.model = kwargs.get("model")
+        self.deadline = kwargs.get("timeout")
+        self.start_time = time.time()
+        self.text = ""
+        self.input_tokens = self.output_tokens = 0
+        self.stop_reason = None
+
+    def stop(self, reason):
+        self.output_tokens = estimate_tokens(self.text)
+        self.stop_reason = reason
+
+    def feed(self, event):
+        # True once the stream should be closed
+        if self.deadline is not None and time.time() - self.start_time > self.deadline:
+            raise DeadlineExceeded(f"No complete response after {self.deadline:.0f}s")
+        if event.type == "message_start":
+            self.model = event.message.model or self.model
+            self.input_tokens = event.message.usage.input_tokens
+        elif event.type == "content_block_delta":
+            delta = getattr(event.delta, "text", None)
+            if not delta:
+                return False
+            self.text += delta
+            end = self.monitor.feed(self.text)
+            if end is not None:
+                self.stop("early_stop")
+                self.text = self.text[:end]
+                record_early_stop(self.pipeline or "", "complete")
+                return True
+        elif event.type == "message_delta":
+            self.stop_reason = event.delta.stop_reason
+            self.output_tokens = event.usage.output_tokens
+        return False
+
+    def malformed(self):
+        record_early_stop(self.pipeline or "", "malformed")
+        if self.pipeline:
+            usage = SimpleNamespace(input_tokens=self.input_tokens, output_tokens=estimate_tokens(self.text))
+            record_api_usage(self.pipeline, self.model, usage, time.time() - self.start_time)
+
+    def message(self):
+        return SimpleNamespace(
+            model=self.model,
+            content=[SimpleNamespace(type="text", text=self.text)],
+            stop_reason=self.stop_reason,
+            usage=SimpleNamespace(input_tokens=self.input_tokens, output_tokens=self.output_tokens),
+        )
+
+
+def stream_message(client, monitor, pipeline=None, cancel=None, **kwargs):
+    """Streams a Messages API call, feeding the text to monitor as it arrives.
+
+    Returns a message-like object (content[0].text, usage, stop_reason, model). When the monitor
+    reports the structure complete, the connection is closed, which stops generation, and
+    stop_reason is "early_stop". MalformedStream from the monitor aborts the call the same way;
+    the partial call is recorded against pipeline first so its tokens are not lost from the metrics.
+    Setting the cancel event (a hedged request won) closes the stream with stop_reason "cancelled".
+    The SDK's timeout only bounds each read of a stream, so the timeout is also enforced on the whole
+    call here, raising DeadlineExceeded.
+    """
+    reader = _StreamReader(monitor, pipeline, kwargs)
+    stream = client.messages.create(stream=True, **kwargs)
+    try:
+        for event in stream:
+            if cancel is not None and cancel.is_set():
+                reader.stop("cancelled")
+                break
+            if reader.feed(event):
+                break
+    except MalformedStream:
+        reader.malformed()
+        raise
+    finally:
+        stream.close()
+    return reader.message()
+
+
+async def astream_message(client, monitor, pipeline=None, **kwargs):
+    # stream_message for an AsyncAnthropic client; a hedged loser is cancelled as a task instead
+    reader = _StreamReader(monitor, pipeline, kwargs)
+    stream = await client.messages.create(stream=True, **kwargs)
+    try:
+        async for event in stream:
+            if reader.feed(event):
+                break
+    except MalformedStream:
+        reader.malformed()
+        raise
+    finally:
+        await stream.close()
+    return reader.message()
+
+
+def create_message(client, monitor=None, pipeline=None, **kwargs):
+    """Drop-in for client.messages.create; streams with early stop when enabled and a monitor is given.
+
+    Every call gets a deadline sized to its max_tokens (see hedging.request_deadline), and calls slower
+    than the recent p95 of their shape are hedged with a duplicate request.
+    """
+    deadline = request_deadline(kwargs.get("max_tokens"))
+    if deadline is not None:
+        kwargs.setdefault("timeout", deadline)
+    streamed = ENABLED and monitor is not None
+    # Monitors keep parse state, so a hedged attempt gets a fresh copy of its own
+    monitors = [copy.deepcopy(monitor), monitor] if streamed else []
+
+    def attempt(cancel):
+        if not streamed:
+            return client.messages.create(**kwargs)
+        return stream_message(client, monitors.pop(), pipeline=pipeline, cancel=cancel, **kwargs)
+
+    with span(f"{pipeline}:api"):
+        return HEDGER.call(pipeline or "", (pipeline, kwargs.get("model"), kwargs.get("max_tokens"), streamed), attempt)
+
+
+async def acreate_message(client, monitor=None, pipeline=None, **kwargs):
+    """create_message for an AsyncAnthropic client: same deadline, streaming and hedging, without a thread
+    per request. A hedged loser is cancelled outright, streamed or not."""
+    deadline = request_deadline(kwargs.get("max_tokens"))
+    if deadline is not None:
+        kwargs.setdefault("timeout", deadline)
+    streamed = ENABLED and monitor is not None
+    monitors = [copy.deepcopy(monitor), monitor] if streamed else []
+
+    def attempt():
+        if not streamed:
+            return client.messages.create(**kwargs)
+        return astream_message(client, monitors.pop(), pipeline=pipeline, **kwargs)
+
+    return await HEDGER.acall(pipeline or "", (pipeline, kwargs.get("model"), kwargs.get("max_tokens"), streamed),
+                              attempt)
+
+
+def add_streaming_arguments(parser):
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses and stop generation as soon as the expected structure is complete")
+    return parser
+
+
+def configure_streaming(args):
+    global ENABLED
+    ENABLED = getattr(args, "stream", False)
@@ -0,0 +1,136 @@
+import re
+
+# Roughly 4 characters per token for English prose; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+DEFAULT_TOKEN_BUDGET = 2000
+
+FUNDING_KEYWORDS = [
+    "raise", "raised", "raises", "raising", "funding", "round", "series", "seed", "pre-seed", "investor",
+    "investors", "invest", "invested", "investment", "led by", "participation", "valuation", "venture",
+    "capital", "backed", "million", "billion", "acquire", "acquired", "acquisition", "financing",
+]
+
+BOILERPLATE_PATTERNS = re.compile(
+    r"all rights reserved|cookie|privacy policy|terms of (use|service)|subscribe|sign up|newsletter|"
+    r"related (articles|stories|posts)|read more|share (this|on)|follow us|advertisement|"
+    r"click here|log in|sign in|most popular|trending now",
+    re.IGNORECASE,
+)
+
+# Article dates usually sit in short byline blocks that would otherwise score as boilerplate
+_DATE = re.compile(
+    r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{1,2},? \d{4}\b|\b\d{4}-\d{2}-\d{2}\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[A-Za-z0-9$%][A-Za-z0-9$%.,'-]*")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'$])")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_into_blocks(text, words_per_block=60):
+    # Pseudo-paragraphs for text that arrives without markup (link density unknown, assumed 0)
+    sentences = _SENTENCE_END.split(text)
+    blocks, current, count = [], [], 0
+    for sentence in sentences:
+        current.append(sentence)
+        count += len(sentence.split())
+        if count >= words_per_block:
+            blocks.append((" ".join(current), 0.0))
+            current, count = [], 0
+    if current:
+        blocks.append((" ".join(current), 0.0))
+    return blocks
+
+
+def density_score(text, link_density):
+    # Readability-style content score: long, comma-rich, link-poor blocks look like article prose
+    words = len(_WORD.findall(text))
+    if words == 0:
+        return 0.0
+    score = min(words, 120) / 20.0 + text.count(",") * 0.5
+    if words < 8:
+        score -= 2.0
+    if BOILERPLATE_PATTERNS.search(text) and words < 40:
+        score -= 4.0
+    return score * (1.0 - link_density) - 3.0 * link_density
+
+
+def _terms(text):
+    return {word.lower().strip(".,'") for word in _WORD.findall(text) if len(word) > 3}
+
+
+def keyword_hits(text):
+    lowered = text.lower()
+    hits = sum(1 for keyword in FUNDING_KEYWORDS if keyword in lowered) + lowered.count("$")
+    return hits + (1 if _DATE.search(text) else 0)
+
+
+def _truncate_to_budget(text, token_budget):
+    limit = token_budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    # Prefer ending on a sentence boundary if one is reasonably close
+    boundary = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    return cut[:boundary + 1] if boundary > limit // 2 else cut
+
+
+def reduce_blocks(blocks, title=None, token_budget=DEFAULT_TOKEN_BUDGET, min_score=0.5):
+    """Drop boilerplate blocks and keep the ones nearest the title and funding keywords, within token_budget.
+
+    blocks is a list of (text, link_density) pairs in document order; the result keeps that order.
+    """
+    candidates = []
+    for index, (text, link_density) in enumerate(blocks):
+        text = text.strip()
+        # Navigation menus and related-article lists are mostly link text
+        if not text or link_density > 0.5:
+            continue
+        score = density_score(text, link_density)
+        hits = keyword_hits(text)
+        if score < min_score and hits == 0:
+            continue
+        candidates.append([index, text, score, hits])
+
+    if not candidates:
+        return _truncate_to_budget(" ".join(text for text, _ in blocks).strip(), token_budget)
+
+    title_terms = _terms(title) if title else set()
+    if title_terms:
+        overlaps = [len(title_terms & _terms(text)) for _, text, _, _ in candidates]
+        anchor = candidates[max(range(len(candidates)), key=lambda i: (overlaps[i], candidates[i][3]))][0]
+    else:
+        overlaps = [0] * len(candidates)
+        anchor = next((index for index, _, _, hits in candidates if hits), candidates[0][0])
+
+    ranked = []
+    for (index, text, score, hits), overlap in zip(candidates, overlaps):
+        proximity = 1.0 / (1.0 + abs(index - anchor))
+        relevance = score + 2.0 * min(hits, 5) + 1.5 * overlap + 6.0 * proximity
+        ranked.append((relevance, index, text))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+
+    selected, used = [], 0
+    for relevance, index, text in ranked:
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if not selected and remaining > 0:
+                selected.append((index, _truncate_to_budget(text, remaining)))
+                used = token_budget
+            continue
+        selected.append((index, text))
+        used += tokens
+
+    selected.sort()
+    return "\n\n".join(text for _, text in selected)
+
+
+def reduce_text(text, title=None, token_budget=DEFAULT_TOKEN_BUDGET):
+    if estimate_tokens(text) <= token_budget:
+        return text
+    return reduce_blocks(split_into_blocks(text), title=title, token_budget=token_budget)
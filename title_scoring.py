@@ -0,0 +1,192 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Curated titles of people who buy or manage lodging and travel, with their relative value to the sales team
+TARGET_TITLES = {
+    "travel manager": 1.0,
+    "corporate travel manager": 1.0,
+    "director of travel": 1.0,
+    "head of travel": 1.0,
+    "travel coordinator": 0.85,
+    "chief procurement officer": 1.0,
+    "vice president procurement": 1.0,
+    "director of procurement": 1.0,
+    "procurement manager": 0.95,
+    "purchasing manager": 0.9,
+    "director of purchasing": 0.9,
+    "strategic sourcing manager": 0.85,
+    "category manager indirect spend": 0.85,
+    "chief operating officer": 0.9,
+    "vice president operations": 0.85,
+    "director of operations": 0.85,
+    "operations manager": 0.8,
+    "field operations manager": 0.8,
+    "facilities manager": 0.8,
+    "director of facilities": 0.8,
+    "logistics manager": 0.8,
+    "head of logistics": 0.8,
+    "supply chain manager": 0.75,
+    "fleet manager": 0.75,
+    "crew coordinator": 0.7,
+    "workforce manager": 0.65,
+    "office manager": 0.6,
+    "event manager": 0.6,
+    "chief financial officer": 0.6,
+    "controller": 0.5,
+    "accounts payable manager": 0.5,
+    "human resources director": 0.5,
+}
+
+# MANAGEMENT_LEVEL (lower-cased, dashes/underscores as spaces) -> weight, in the order the prompt prefers
+MANAGEMENT_LEVEL_WEIGHTS = {
+    "c level": 1.0,
+    "vp level": 0.85,
+    "director": 0.7,
+    "manager": 0.55,
+    "non manager": 0.3,
+}
+DEFAULT_LEVEL_WEIGHT = 0.3
+
+# Titles the prompt tells the model never to pick
+EXCLUDED_TITLE_PATTERN = re.compile(
+    r"\b(?:former|retired|resigned|past|independent|self[\s-]?employ\w*|unemployed|freelance|advisor|consultant|"
+    r"personal assistant|pa|chief of staff|office of|to the|secretary)\b",
+    re.IGNORECASE,
+)
+
+# Common abbreviations expanded before n-gram extraction
+ABBREVIATIONS = {
+    "vp": "vice president", "svp": "senior vice president", "evp": "executive vice president",
+    "avp": "assistant vice president", "dir": "director", "mgr": "manager", "ops": "operations",
+    "coo": "chief operating officer", "cfo": "chief financial officer", "cpo": "chief procurement officer",
+    "hr": "human resources", "sr": "senior", "jr": "junior", "mgmt": "management", "purch": "purchasing",
+    "proc": "procurement", "log": "logistics", "fac": "facilities",
+}
+
+NGRAM_SIZE = 3
+
+# Weights of the components of contact_score
+TITLE_WEIGHT = 0.6
+LEVEL_WEIGHT = 0.25
+CONFIDENCE_WEIGHT = 0.15
+EXCLUDED_PENALTY = 1.0
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_title(title):
+    words = _NON_ALNUM.sub(" ", str(title).lower().replace("&", " and ")).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def char_ngrams(text, size=NGRAM_SIZE):
+    # Character n-grams within word boundaries (like scikit-learn's char_wb analyzer)
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        if len(padded) <= size:
+            grams.append(padded)
+        else:
+            grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+class TitleIndex:
+    """TF-IDF character n-gram similarity of job titles to TARGET_TITLES.
+
+    IDF is fitted on the distinct titles being scored, so n-grams common to every title ("man", "ger")
+    count for little. Only n-grams that occur in a target title are columns of the matrices; the rest
+    still contribute to each title's vector norm. Scoring works on distinct normalized titles, in
+    blocks, so the cost grows with the number of distinct titles rather than rows.
+    """
+
+    def __init__(self, targets=None, block_size=20000):
+        self.targets = dict(targets or TARGET_TITLES)
+        self.block_size = block_size
+        self.vocabulary = {}
+        for target in self.targets:
+            for gram in char_ngrams(normalize_title(target)):
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+        self.target_weights = np.array(list(self.targets.values()), dtype=np.float32)
+
+    def _fit_idf(self, titles):
+        document_frequency = Counter()
+        for title in titles:
+            document_frequency.update(set(char_ngrams(title)))
+        documents = len(titles) + len(self.targets)
+        for target in self.targets:
+            document_frequency.update(set(char_ngrams(normalize_title(target))))
+        # Smoothed IDF, as in scikit-learn's TfidfVectorizer
+        return {gram: math.log((1 + documents) / (1 + count)) + 1.0 for gram, count in document_frequency.items()}
+
+    def _vectors(self, titles, idf):
+        matrix = np.zeros((len(titles), len(self.vocabulary)), dtype=np.float32)
+        norms = np.zeros(len(titles), dtype=np.float32)
+        for row, title in enumerate(titles):
+            squared = 0.0
+            for gram, count in Counter(char_ngrams(title)).items():
+                weight = count * idf[gram]
+                squared += weight * weight
+                column = self.vocabulary.get(gram)
+                if column is not None:
+                    matrix[row, column] = weight
+            norms[row] = math.sqrt(squared)
+        norms[norms == 0] = 1.0
+        return matrix / norms[:, None]
+
+    def score_unique(self, titles):
+        # titles: list of normalized distinct titles -> best weighted cosine similarity to any target
+        idf = self._fit_idf(titles)
+        targets = self._vectors([normalize_title(target) for target in self.targets], idf)
+        scores = np.empty(len(titles), dtype=np.float32)
+        for start in range(0, len(titles), self.block_size):
+            block = self._vectors(titles[start:start + self.block_size], idf)
+            similarity = block @ targets.T
+            scores[start:start + self.block_size] = (similarity * self.target_weights).max(axis=1)
+        return scores
+
+    def score(self, titles):
+        # titles: pandas Series of raw titles -> numpy array of scores in [0, 1], one per row
+        codes, uniques = factorize_titles(titles)
+        return self.score_unique(uniques)[codes]
+
+
+def factorize_titles(titles):
+    # (row -> distinct title code, distinct normalized titles)
+    codes, uniques = pd.factorize(titles.fillna("").astype(str).map(normalize_title))
+    return codes, list(uniques)
+
+
+def score_contacts(df, index=None):
+    """Adds title_score and contact_score columns (vectorized over the whole frame)."""
+    index = index or TitleIndex()
+    # Titles repeat heavily, so everything title-based is computed once per distinct title
+    codes, uniques = factorize_titles(df["PRIMARY_TITLE"])
+    title_score = index.score_unique(uniques)[codes]
+    excluded = np.fromiter((EXCLUDED_TITLE_PATTERN.search(title) is not None for title in uniques),
+                           dtype=bool, count=len(uniques))[codes]
+
+    levels = df["MANAGEMENT_LEVEL"].fillna("").astype(str).str.lower().str.replace(r"[\s_-]+", " ", regex=True).str.strip()
+    level_score = levels.map(MANAGEMENT_LEVEL_WEIGHTS).fillna(DEFAULT_LEVEL_WEIGHT).to_numpy(dtype=np.float32)
+
+    confidence = pd.to_numeric(df["CONFIDENCE_SCORE"], errors="coerce").fillna(0).to_numpy(dtype=np.float32)
+    top_confidence = confidence.max() if len(confidence) else 0
+    if top_confidence > 0:
+        confidence = confidence / top_confidence
+
+    scored = df.copy()
+    scored["title_score"] = title_score
+    scored["contact_score"] = (TITLE_WEIGHT * title_score + LEVEL_WEIGHT * level_score
+                               + CONFIDENCE_WEIGHT * confidence - EXCLUDED_PENALTY * excluded)
+    return scored
+
+
+def shortlist_contacts(df, top_k, index=None):
+    """Keeps each company's top_k contacts by contact_score, best first within each company."""
+    scored = score_contacts(df, index).sort_values("contact_score", ascending=False, kind="stable")
+    shortlisted = scored.groupby("COMPANY_ID", sort=False, dropna=False).head(top_k)
+    return shortlisted.drop(columns=["title_score", "contact_score"])
@@ -1,42 +1,56 @@
-import pandas as pd
 import os
 import time
+import hashlib
 import csv
 import logging
 import json
 import argparse
+import itertools
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 import threading
-from queue import Queue
-from tqdm import tqdm
+from queue import Empty
 import signal
-import chardet
-import anthropic
 import traceback
 from typing import Dict, Any
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import multiprocessing
+from output_writers import add_output_arguments, write_results
+from html_parsing import HtmlParsingStage, load_content_rules, parse_page
+from text_reduction import DEFAULT_TOKEN_BUDGET, estimate_tokens, reduce_text
+from dedup_index import DedupIndex, canonicalize_url, fingerprint_text
+from snapshot_store import SnapshotStore
+from scraper_control import Cancelled, RunController
+from host_scheduler import FETCH_ERROR, FETCH_OK, FETCH_TIMEOUT, HostScheduler
+from retry_policy import NETWORK, TIMEOUT, RetryPolicy, ValidationError, add_retry_arguments, configure_retries
+from model_router import ModelRouter, TruncatedResponse, add_routing_arguments, check_truncated, configure_routing
+from streaming import JsonObjectMonitor, add_streaming_arguments, configure_streaming, create_message
+from hedging import add_hedging_arguments, configure_hedging
+from metrics import (add_metrics_arguments, finish_metrics, record_api_usage, record_error, set_queue_depth,
+                     start_metrics, time_stage)
+from llm_client import get_client
+from windowed_executor import submit_windowed
 
-# Initialize the Anthropic client
-client = anthropic.Anthropic(
-    api_key="xxx",
-)
+PIPELINE = "scraper"
 
 # Global variables
-paused = False
-pause_condition = threading.Condition()
 input_file_path = 'INPUT.csv'
 output_file_path = 'output.csv'
 results_dir = "results/"
 log_file = os.path.join(results_dir, "scraping_and_processing.log")
-excel_filename = os.path.join(results_dir, "result.xlsx")
+output_filename = os.path.join(results_dir, "result.xlsx")
 
-os.makedirs(results_dir, exist_ok=True)
+# Process pool for HTML-to-text extraction, created in scrape_rows()
+parsing_stage = None
+# Maximum estimated tokens of article text sent to extract_funding_info
+token_budget = DEFAULT_TOKEN_BUDGET
+# Cross-run URL/content deduplication index, opened in scrape_rows()
+dedup_index = None
+# Compressed HTML/text snapshots, opened in scrape_rows() / reextract_rows(); results then hold references
+snapshot_store = None
+# Live pause/drain/resize control; scrape_rows() replaces it with one that watches the control file
+controller = RunController()
+# Per-host politeness queue feeding the workers; scrape_rows() replaces it with one configured from the CLI
+scheduler = HostScheduler(respect_robots=False)
 
 def setup_logging():
     logging.basicConfig(filename=log_file, level=logging.INFO,
@@ -46,33 +60,67 @@ def log_message(message):
     logging.info(message)
     print(message)
 
+retry_policy = RetryPolicy(PIPELINE, log=log_message)
+# Page loads get fewer, shorter retries: the host scheduler already backs off hosts that keep timing out
+fetch_retry_policy = RetryPolicy(PIPELINE, rules={TIMEOUT: (1, 2.0, 10.0), NETWORK: (2, 1.0, 10.0)}, log=log_message)
+model_router = ModelRouter(PIPELINE, log=log_message)
+
 def setup_driver():
+    from selenium import webdriver
+
     options = webdriver.FirefoxOptions()
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
     options.add_argument('--headless')
     return webdriver.Firefox(options=options)
 
-def scrape_content(driver, url):
+def scrape_content(driver, url, title=None):
+    # Returns the full page text, the boilerplate-stripped text within token_budget, the post-redirect URL
+    # and the fetch outcome used by the host scheduler
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     try:
-        driver.get(url)
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
-        if main_content:
-            text_content = main_content.get_text(separator=' ', strip=True)
-        else:
-            text_content = soup.get_text(separator=' ', strip=True)
+        body_present = EC.presence_of_element_located((By.TAG_NAME, "body"))
+
+        def body_loaded_or_cancelled(d):
+            controller.check_cancelled()
+            return body_present(d)
+
+        def fetch():
+            driver.get(url)
+            WebDriverWait(driver, 10, poll_frequency=0.25).until(body_loaded_or_cancelled)
+            return driver.page_source, driver.current_url or url
+
+        with time_stage(PIPELINE, "fetch"):
+            html_content, final_url = fetch_retry_policy.call(fetch, stage="fetch", description=f"fetch of {url}")
+
+        html_ref = ""
+        if snapshot_store is not None:
+            with time_stage(PIPELINE, "snapshot"):
+                html_ref = snapshot_store.put(html_content)
+
+        # Parsing runs in worker processes; this thread only waits on the result
+        with time_stage(PIPELINE, "parse"):
+            if parsing_stage is not None:
+                page = parsing_stage.parse(html_content, url, title=title, token_budget=token_budget)
+            else:
+                page = parse_page(html_content, url, title=title, token_budget=token_budget)
         
-        return text_content
+        return {"text": page["text"], "reduced_text": page["reduced_text"], "final_url": final_url,
+                "fetch_status": FETCH_OK, "html_ref": html_ref}
+    except TimeoutException:
+        record_error(PIPELINE, "fetch_timeout")
+        logging.error(f"Timed out loading {url}")
+        return {"text": "", "reduced_text": "", "final_url": url, "fetch_status": FETCH_TIMEOUT, "html_ref": ""}
     except Exception as e:
+        record_error(PIPELINE, "fetch")
         logging.error(f"Error scraping {url}: {e}")
-        return ""
+        return {"text": "", "reduced_text": "", "final_url": url, "fetch_status": FETCH_ERROR, "html_ref": ""}
 
-def extract_funding_info(text: str) -> Dict[str, Any]:
-    prompt = f"""
+FUNDING_PROMPT = """
     Given the following text, extract the funding information and return it as a JSON-formatted string:
 
     {text}
@@ -91,142 +139,433 @@ def extract_funding_info(text: str) -> Dict[str, Any]:
     Return only the JSON string, nothing else.
     """
 
-    response = client.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=4000,
-        temperature=0.7,
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
-    )
+# Extractions in the dedup index are only reused under the prompt (and so the schema) that produced them
+EXTRACTION_VERSION = hashlib.sha256(FUNDING_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+def extract_funding_info(text: str, title: str = None) -> Dict[str, Any]:
+    # Callers normally pass already-reduced text; this only guards against oversized input
+    if estimate_tokens(text) > token_budget:
+        text = reduce_text(text, title=title, token_budget=token_budget)
+
+    prompt = FUNDING_PROMPT.format(text=text)
 
-    response_content = response.content[0].text
+    def request_funding_info(route):
+        start_time = time.time()
+        # Streamed (with --stream) until the JSON object closes
+        response = create_message(
+            get_client(), JsonObjectMonitor(), pipeline=PIPELINE,
+            model=route.model,
+            max_tokens=route.max_tokens,
+            temperature=0.7,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        record_api_usage(PIPELINE, route.model, response.usage, time.time() - start_time)
+        check_truncated(response)
+
+        response_content = response.content[0].text
+        try:
+            return json.loads(response_content.strip())
+        except json.JSONDecodeError as e:
+            record_error(PIPELINE, "parse_response")
+            log_message(f"Error parsing JSON: {str(e)}")
+            log_message(f"Raw response: {response_content}")
+            raise ValidationError(response_content) from e
+
+    # API errors that outlast their retry budget propagate to process_url, which records them on the row
+    description = f"extraction for {title or 'article'}"
     try:
-        return json.loads(response_content.strip())
-    except json.JSONDecodeError as e:
-        log_message(f"Error parsing JSON: {str(e)}")
-        log_message(f"Raw response: {response_content}")
+        return model_router.complete(
+            "funding_extraction", prompt,
+            lambda route: retry_policy.call(request_funding_info, route, stage="api", description=description),
+            description=description)
+    except (ValidationError, TruncatedResponse) as e:
         return {
             "error": "Failed to parse response",
-            "raw_response": response_content
+            "raw_response": str(e)
         }
 
+def content_columns(content, html_ref="", text_ref=""):
+    # With a snapshot store, rows reference the stored HTML and text instead of carrying the text
+    if snapshot_store is None:
+        return {"SCRAPED_CONTENT": content}
+    return {"HTML_SNAPSHOT": html_ref, "TEXT_SNAPSHOT": text_ref}
+
+def reuse_extraction(match, match_type, task_id, source_url, article_title):
+    dedup_index.map_task(task_id, match["extraction_id"], match_type)
+    if snapshot_store is not None and snapshot_store.latest(task_id) is None:
+        # A URL match is never fetched, so the duplicate takes the matched row's snapshot for --reextract
+        snapshot = snapshot_store.latest(match["task_id"])
+        if snapshot is not None:
+            snapshot_store.record(task_id, source_url, snapshot["final_url"], article_title, snapshot["html_ref"],
+                                  snapshot["text_ref"])
+    log_message(f"Task ID {task_id} matches Task ID {match['task_id']} by {match_type}; reusing its extraction")
+    return {
+        **match["result"],
+        "TASK_ID": task_id,
+        "ARTICLE TITLE": article_title,
+        "SOURCE": source_url,
+        "DUPLICATE_OF": match["task_id"],
+    }
+
 def process_url(task_id, source_url, article_title):
     try:
-        driver = setup_driver()
-        content = scrape_content(driver, source_url)
-        driver.quit()
+        canonical_urls = [canonicalize_url(source_url)]
+        if dedup_index is not None:
+            match = dedup_index.lookup_url(canonical_urls[0])
+            if match:
+                return reuse_extraction(match, "url", task_id, source_url, article_title)
+
+        controller.checkpoint()
+        with time_stage(PIPELINE, "driver_start"):
+            driver = setup_driver()
+        try:
+            page = scrape_content(driver, source_url, title=article_title)
+        finally:
+            driver.quit()
+        # The host slot is only needed while fetching; the API call below does not touch the site
+        scheduler.finish_fetch(page["fetch_status"])
+        content = page["text"]
+        text_ref = ""
+        if snapshot_store is not None and page["html_ref"]:
+            text_ref = snapshot_store.put(content)
+            snapshot_store.record(task_id, source_url, page["final_url"], article_title, page["html_ref"], text_ref)
+        controller.checkpoint()
+
+        fingerprint = None
+        if dedup_index is not None:
+            final_url = canonicalize_url(page["final_url"])
+            if final_url != canonical_urls[0]:
+                canonical_urls.append(final_url)
+                match = dedup_index.lookup_url(final_url)
+                if match:
+                    dedup_index.add_urls(canonical_urls, match["extraction_id"])
+                    return reuse_extraction(match, "redirect", task_id, source_url, article_title)
+            # Syndicated copies differ in boilerplate, so fingerprint the reduced article text
+            fingerprint = fingerprint_text(page["reduced_text"])
+            if fingerprint is not None:
+                match = dedup_index.lookup_fingerprint(fingerprint)
+                if match:
+                    dedup_index.add_urls(canonical_urls, match["extraction_id"])
+                    return reuse_extraction(match, "content", task_id, source_url, article_title)
         
-        funding_info = extract_funding_info(content)
+        controller.checkpoint()
+        # The full text (or its snapshot) is kept in the results; only the reduced text is sent to the model
+        funding_info = extract_funding_info(page["reduced_text"], title=article_title)
         
         result = {
             "TASK_ID": task_id,
             "ARTICLE TITLE": article_title,
             "SOURCE": source_url,
-            "SCRAPED_CONTENT": content,
+            **content_columns(content, page["html_ref"], text_ref),
             **funding_info
         }
+
+        if dedup_index is not None and content and "error" not in funding_info:
+            dedup_index.add(task_id, canonical_urls, fingerprint, result)
         
         log_message(f"Successfully processed Task ID {task_id}")
         return result
     except Exception as e:
+        record_error(PIPELINE, "process_url")
         log_message(f"Error processing Task ID {task_id}: {e}")
         return {
             "TASK_ID": task_id,
             "ARTICLE TITLE": article_title,
             "SOURCE": source_url,
-            "SCRAPED_CONTENT": "",
+            **content_columns(""),
             "error": str(e)
         }
 
-def worker_thread(url_queue, results, data_lock, pbar):
-    while True:
-        with pause_condition:
-            while paused:
-                pause_condition.wait()
-        
-        item = url_queue.get()
-        if item is None:
-            break
+def skipped_host_result(task_id, source_url, article_title, reason):
+    log_message(f"Task ID {task_id}: {reason}")
+    return {
+        "TASK_ID": task_id,
+        "ARTICLE TITLE": article_title,
+        "SOURCE": source_url,
+        **content_columns(""),
+        "error": reason
+    }
+
+def reextract_row(task_id, source_url, article_title):
+    # Parses and extracts one row again from its latest HTML snapshot; nothing is fetched
+    try:
+        snapshot = snapshot_store.latest(task_id)
+        if snapshot is None or not snapshot["html_ref"]:
+            return skipped_host_result(task_id, source_url, article_title,
+                                       "No HTML snapshot for this row; scrape it without --reextract first")
+        html_content = snapshot_store.get(snapshot["html_ref"])
+        with time_stage(PIPELINE, "parse"):
+            page = parsing_stage.parse(html_content, source_url, title=article_title, token_budget=token_budget)
+        text_ref = snapshot_store.put(page["text"])
+        snapshot_store.record(task_id, source_url, snapshot["final_url"], article_title, snapshot["html_ref"], text_ref)
+        funding_info = extract_funding_info(page["reduced_text"], title=article_title)
+        log_message(f"Re-extracted Task ID {task_id} from the snapshot taken {datetime.fromtimestamp(snapshot['fetched_at']):%Y-%m-%d %H:%M}")
+        return {
+            "TASK_ID": task_id,
+            "ARTICLE TITLE": article_title,
+            "SOURCE": source_url,
+            **content_columns(page["text"], snapshot["html_ref"], text_ref),
+            **funding_info
+        }
+    except Exception as e:
+        record_error(PIPELINE, "process_url")
+        log_message(f"Error re-extracting Task ID {task_id}: {e}")
+        return {
+            "TASK_ID": task_id,
+            "ARTICLE TITLE": article_title,
+            "SOURCE": source_url,
+            **content_columns(""),
+            "error": str(e)
+        }
+
+def worker_thread(worker_index, results, data_lock, pbar):
+    while not controller.worker_should_exit(worker_index):
+        controller.wait_while_paused()
+        try:
+            # Rows that will be skipped anyway are handed out without waiting on host politeness
+            item, skip_reason = scheduler.get(timeout=0.5, polite=controller.accepting())
+        except Empty:
+            continue
+        set_queue_depth(PIPELINE, "urls", scheduler.qsize())
+        if not controller.try_start():
+            # Rows not yet started when a drain/stop or lower max_rows arrived are left for the next run
+            scheduler.task_done()
+            continue
         task_id, source_url, article_title = item
-        result = process_url(task_id, source_url, article_title)
-        with data_lock:
-            results.append(result)
-        pbar.update(1)
-        url_queue.task_done()
+        try:
+            if skip_reason:
+                result = skipped_host_result(task_id, source_url, article_title, skip_reason)
+            else:
+                result = process_url(task_id, source_url, article_title)
+        except Cancelled:
+            controller.record_cancelled()
+            log_message(f"Cancelled Task ID {task_id}; it was not saved and will be picked up by the next run")
+        else:
+            with data_lock:
+                results.append(result)
+                snapshot = list(results) if len(results) % 10 == 0 else None
+            controller.record_completed()
+            if snapshot is not None:
+                save_partial_results(snapshot, output_file_path)
+        finally:
+            pbar.update(1)
+            scheduler.task_done()
 
 def save_partial_results(results, output_file_path):
-    df = pd.DataFrame(results)
-    df.to_csv(output_file_path, index=False)
+    import pandas as pd
+
+    with time_stage(PIPELINE, "write"):
+        df = pd.DataFrame(results)
+        df.to_csv(output_file_path, index=False)
     log_message(f"Partial results saved to {output_file_path}")
 
 def pause_resume_handler(signum, frame):
-    global paused
-    paused = not paused
-    with pause_condition:
-        if paused:
-            print("\nPaused. Press Ctrl+C again to resume.")
-            logging.info("Processing paused")
-        else:
-            print("\nResuming...")
-            logging.info("Processing resumed")
-        pause_condition.notify_all()
+    # Only queue the command; the controller thread applies it outside the signal handler
+    controller.request("toggle")
 
-def main():
-    setup_logging()
+def log_host_summary():
+    hosts = scheduler.summary()
+    skipped = [host["host"] for host in hosts if host["skipped"]]
+    throttled = [f"{host['host']} ({host['timeouts']})" for host in hosts if host["timeouts"]]
+    log_message(f"Fetched from {len(hosts)} hosts")
+    if throttled:
+        log_message(f"Hosts with timeouts: {', '.join(throttled)}")
+    if skipped:
+        log_message(f"Hosts skipped after repeated failures: {', '.join(skipped)}")
+
+def scrape_rows(df, parse_workers=None, max_content_tokens=DEFAULT_TOKEN_BUDGET, dedup_path=None, max_rows=None,
+                num_workers=5, control_file=None, per_host_workers=2, host_delay=0.0, respect_robots=True,
+                max_host_failure_rate=0.8, snapshot_dir=None):
+    """Scrapes and extracts the TASK_ID / SOURCE / ARTICLE TITLE rows of df; returns the result dicts.
+
+    Partial results are saved to output_file_path every 10 rows. With snapshot_dir, fetched HTML and
+    extracted text go to a SnapshotStore and rows carry HTML_SNAPSHOT / TEXT_SNAPSHOT references
+    instead of SCRAPED_CONTENT.
+    """
+    from tqdm import tqdm
+
+    global parsing_stage, token_budget, dedup_index, controller, scheduler, snapshot_store
+    token_budget = max_content_tokens
+    if dedup_path:
+        dedup_index = DedupIndex(dedup_path, version=EXTRACTION_VERSION)
+        log_message(f"Using deduplication index at {dedup_path}")
+    if snapshot_dir:
+        snapshot_store = SnapshotStore(snapshot_dir)
+        log_message(f"Saving {snapshot_store.codec}-compressed page snapshots to {snapshot_dir}")
     
-    df = pd.read_csv(input_file_path)
-    total_rows = len(df)
+    total_rows = len(df) if max_rows is None else min(len(df), max_rows)
     
-    url_queue = Queue()
+    # Holds every row so it can interleave hosts; max_rows/drain still apply to rows not yet started
+    scheduler = HostScheduler(per_host_limit=per_host_workers, host_delay=host_delay, respect_robots=respect_robots,
+                              max_failure_rate=max_host_failure_rate, log=log_message)
     results = []
     data_lock = threading.Lock()
-    num_threads = min(5, total_rows)
+    num_threads = max(1, min(num_workers, total_rows))
+
+    controller = RunController(control_file=control_file,
+                               status_file=f"{control_file}.status" if control_file else None,
+                               max_rows=max_rows, workers=num_threads, log=log_message)
+    if control_file:
+        log_message(f"Watching {control_file} for control commands: pause, resume, drain, stop, workers N, max_rows N, status")
 
     signal.signal(signal.SIGINT, pause_resume_handler)
 
+    parsing_stage = HtmlParsingStage(max_workers=parse_workers)
+    log_message(f"Parsing HTML with {parsing_stage.parser} in {parsing_stage.max_workers} processes")
+
     with tqdm(total=total_rows, desc="Processing URLs") as pbar:
-        threads = []
-        for _ in range(num_threads):
-            t = threading.Thread(target=worker_thread, args=(url_queue, results, data_lock, pbar))
-            t.start()
-            threads.append(t)
-
-        for index, row in df.iterrows():
-            task_id = row['TASK_ID']
-            source_url = row['SOURCE']
-            article_title = row['ARTICLE TITLE']
-            url_queue.put((task_id, source_url, article_title))
-
-            if (index + 1) % 10 == 0:
-                url_queue.join()
-                save_partial_results(results, output_file_path)
-
-        url_queue.join()
-
-        for _ in range(num_threads):
-            url_queue.put(None)
-        for t in threads:
-            t.join()
-
-    final_df = pd.DataFrame(results)
-    final_df.to_csv(output_file_path, index=False)
-    final_df.to_excel(excel_filename, index=False)
-    log_message(f"Final results saved to {output_file_path} and {excel_filename}")
+        threads = {}
+        threads_lock = threading.Lock()
+
+        def resize_pool(target):
+            with threads_lock:
+                for index in range(target):
+                    if index not in threads or not threads[index].is_alive():
+                        t = threading.Thread(target=worker_thread, args=(index, results, data_lock, pbar))
+                        t.start()
+                        threads[index] = t
+
+        controller.on_resize(resize_pool)
+        resize_pool(num_threads)
+        controller.start()
+
+        for item in df[['TASK_ID', 'SOURCE', 'ARTICLE TITLE']].itertuples(index=False, name=None):
+            if not controller.can_dispatch():
+                break
+            scheduler.put(item, item[1])
+            controller.record_dispatched()
+            set_queue_depth(PIPELINE, "urls", scheduler.qsize())
+            expected_rows = len(df) if controller.max_rows is None else min(len(df), controller.max_rows)
+            if pbar.total != expected_rows:
+                pbar.total = expected_rows
+                pbar.refresh()
+
+        scheduler.join()
+        if controller.skipped:
+            log_message(f"{controller.skipped} queued rows were not started")
+        controller.close()
+        with threads_lock:
+            for t in threads.values():
+                t.join()
+
+    scheduler.close()
+    log_host_summary()
+    parsing_stage.shutdown()
+    parsing_stage = None
+    if dedup_index is not None:
+        dedup_index.close()
+        dedup_index = None
+    if snapshot_store is not None:
+        snapshot_store.close()
+        snapshot_store = None
+    return results
+
+def reextract_rows(df, snapshot_dir, parse_workers=None, max_content_tokens=DEFAULT_TOKEN_BUDGET, max_rows=None,
+                   num_workers=5, **fetch_options):
+    """Re-runs parsing and funding extraction for the rows of df from their snapshots, offline.
+
+    Takes the same options as scrape_rows; those that only affect fetching (deduplication, host
+    politeness, the control file) are ignored, since nothing is fetched.
+    """
+    global parsing_stage, token_budget, snapshot_store
+    if not snapshot_dir:
+        raise ValueError("Re-extraction needs the snapshot directory of an earlier run")
+    token_budget = max_content_tokens
+    snapshot_store = SnapshotStore(snapshot_dir)
+    parsing_stage = HtmlParsingStage(max_workers=parse_workers)
+    log_message(f"Re-extracting from snapshots in {snapshot_dir}; parsing HTML with {parsing_stage.parser}")
+
+    rows = df[['TASK_ID', 'SOURCE', 'ARTICLE TITLE']].itertuples(index=False, name=None)
+    if max_rows is not None:
+        rows = itertools.islice(rows, max_rows)
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for _, future in submit_windowed(executor, lambda row: reextract_row(*row), rows, 2 * num_workers):
+                results.append(future.result())
+    finally:
+        parsing_stage.shutdown()
+        parsing_stage = None
+        snapshot_store.close()
+        snapshot_store = None
+    log_message(f"Re-extracted {sum('error' not in result for result in results)} of {len(results)} rows")
+    return results
+
+def main(output_format="auto", excel=None, reextract=False, **scrape_options):
+    import pandas as pd
+
+    setup_logging()
+    df = pd.read_csv(input_file_path)
+    results = (reextract_rows if reextract else scrape_rows)(df, **scrape_options)
+
+    with time_stage(PIPELINE, "write"):
+        final_df = pd.DataFrame(results)
+        final_df.to_csv(output_file_path, index=False)
+        written = write_results(final_df, output_filename, output_format=output_format, excel=excel,
+                                sheet_name='Results', log=log_message)
+    log_message(f"Final results saved to {output_file_path} and {', '.join(written)}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Scrape and process articles data from CSV")
     parser.add_argument("--max_rows", type=int, help="Maximum number of rows to process")
+    add_output_arguments(parser)
+    parser.add_argument("--parse_workers", type=int, help="Processes used for HTML parsing (default: CPU count)")
+    parser.add_argument("--content_rules", help="JSON file mapping domains to main-content CSS selectors")
+    parser.add_argument("--max_content_tokens", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="Token budget for the article text sent to the model")
+    parser.add_argument("--dedup_index", default=os.path.join(results_dir, "dedup_index.sqlite"),
+                        help="SQLite index of previous extractions keyed by canonical URL and content fingerprint")
+    parser.add_argument("--no_dedup", action="store_true", help="Scrape and extract every row, even duplicates")
+    parser.add_argument("--snapshot_dir", default=os.path.join(results_dir, "snapshots"),
+                        help="Compressed store of fetched HTML and extracted text; results keep references to it")
+    parser.add_argument("--no_snapshots", action="store_true",
+                        help="Keep no snapshots and write the full SCRAPED_CONTENT into the results")
+    parser.add_argument("--reextract", action="store_true",
+                        help="Parse and extract again from the snapshots of an earlier run, without fetching")
+    parser.add_argument("--workers", type=int, default=5, help="Initial number of scraping threads")
+    parser.add_argument("--control_file", default=os.path.join(results_dir, "control"),
+                        help="File polled for live commands (pause, resume, drain, stop, workers N, max_rows N, status)")
+    parser.add_argument("--per_host_workers", type=int, default=2, help="Maximum concurrent fetches per host")
+    parser.add_argument("--host_delay", type=float, default=0.0,
+                        help="Minimum seconds between fetches from one host (robots.txt crawl delays may raise it)")
+    parser.add_argument("--ignore_robots", action="store_true", help="Do not read crawl delays from robots.txt")
+    parser.add_argument("--max_host_failure_rate", type=float, default=0.8,
+                        help="Skip a host's remaining rows once this share of its fetches has failed")
+    add_metrics_arguments(parser)
+    add_retry_arguments(parser)
+    add_routing_arguments(parser)
+    add_streaming_arguments(parser)
+    add_hedging_arguments(parser)
     args = parser.parse_args()
+    if args.reextract and args.no_snapshots:
+        parser.error("--reextract reads the snapshots, so it cannot be combined with --no_snapshots")
 
+    os.makedirs(results_dir, exist_ok=True)
     if not os.path.exists(input_file_path):
         log_message(f"Error: Input CSV file not found at {input_file_path}")
         exit(1)
 
+    if args.content_rules:
+        load_content_rules(args.content_rules)
+
+    start_metrics(args, log=log_message)
+    configure_retries(args)
+    configure_routing(args, routers=[model_router])
+    configure_streaming(args)
+    configure_hedging(args)
     try:
-        main()
+        main(output_format=args.output_format, excel=args.excel, reextract=args.reextract,
+             snapshot_dir=None if args.no_snapshots else args.snapshot_dir, parse_workers=args.parse_workers,
+             max_content_tokens=args.max_content_tokens, dedup_path=None if args.no_dedup else args.dedup_index,
+             max_rows=args.max_rows, num_workers=args.workers, control_file=args.control_file,
+             per_host_workers=args.per_host_workers, host_delay=args.host_delay,
+             respect_robots=not args.ignore_robots, max_host_failure_rate=args.max_host_failure_rate)
     except KeyboardInterrupt:
         log_message("Script interrupted by user. Progress has been saved.")
     except Exception as e:
         log_message(f"An error occurred: {str(e)}")
         log_message(f"Traceback: {traceback.format_exc()}")
+    finally:
+        finish_metrics(args, log=log_message)
@@ -0,0 +1,28 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+def submit_windowed(executor, fn, items, window):
+    """Runs fn(item) on executor for each item, keeping at most `window` tasks in flight.
+
+    items is consumed lazily (a generator over a file or DataFrame chunks works), so memory holds
+    only the in-flight items and their futures however long the input is. Yields (item, future)
+    pairs as tasks complete; the window is refilled before each batch of completions is yielded, so
+    the pool stays busy while the caller handles results.
+    """
+    items = iter(items)
+    in_flight = {}
+
+    def fill():
+        while len(in_flight) < window:
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            in_flight[executor.submit(fn, item)] = item
+
+    fill()
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        completed = [(in_flight.pop(future), future) for future in done]
+        fill()
+        yield from completed